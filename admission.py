@@ -0,0 +1,195 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳：reason 为 rate_limited/queue_full/queue_timeout，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积累 burst 个"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost: float = 1, reserve: bool = False) -> float:
+        """取出令牌，返回需要等待的秒数（0 表示立即可用）
+
+        reserve=False 时令牌不足不扣除；reserve=True 时先预支（令牌可以为负），调用方等待返回的秒数后再执行。
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        wait = (cost - self.tokens) / self.rate
+        if reserve:
+            self.tokens -= cost
+        return wait
+
+    def level(self) -> float:
+        self._refill(time.monotonic())
+        return self.tokens
+
+
+class AdmissionController:
+    """提取类请求的准入控制（只在事件循环中使用）
+
+    - 每个客户端（IP 或 API key）一个令牌桶，限制请求速率
+    - 全局同时进行的提取数不超过 max_concurrent，超出的请求按到达顺序排队
+    - 排队数超过 max_queue 或排队超过 queue_timeout 秒的请求被拒绝，由调用方返回 429 和 Retry-After
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 64, queue_timeout: float = 10.0,
+                 rate: float = 2.0, burst: float = 20.0, max_clients: int = 10000):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # 每次占用名额的平均时长（指数移动平均），用于估算 Retry-After
+        self._avg_hold = 1.0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {'rate_limited': 0, 'queue_full': 0, 'queue_timeout': 0}
+
+    def configure(self, **limits):
+        """运行时调整限制；已有客户端的令牌桶按新的速率和容量继续计算"""
+        for key in ('max_concurrent', 'max_queue', 'queue_timeout', 'rate', 'burst'):
+            if limits.get(key) is not None:
+                setattr(self, key, type(getattr(self, key))(limits[key]))
+        for bucket in self._buckets.values():
+            bucket.rate, bucket.burst = self.rate, self.burst
+            bucket.tokens = min(bucket.tokens, self.burst)
+        # 放宽并发数后唤醒排队的请求
+        while self.active < self.max_concurrent and self._handoff():
+            self.active += 1
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _bucket(self, client: str) -> TokenBucket:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            # 客户端太多时丢弃最久未出现的客户端（它们的令牌桶重新从满开始）
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(reason, retry_after)
+
+    async def check_rate(self, client: str, wait: bool = False):
+        """消耗客户端的一个令牌；wait=True 时令牌不足就等待（最多 queue_timeout 秒）而不是直接拒绝"""
+        bucket = self._bucket(client)
+        delay = bucket.take()
+        if delay == 0:
+            return
+        if wait and delay <= self.queue_timeout:
+            bucket.take(reserve=True)
+            await asyncio.sleep(delay)
+            return
+        self._reject('rate_limited', delay)
+
+    def _saturated_retry_after(self) -> float:
+        return self._avg_hold * (len(self._waiters) + 1) / max(1, self.max_concurrent)
+
+    async def _acquire(self):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject('queue_full', self._saturated_retry_after())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self._reject('queue_timeout', self._saturated_retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已经交给了这个请求，转交给下一个
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _handoff(self) -> bool:
+        """把一个名额交给排在最前面的请求（active 不变）"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return True
+        return False
+
+    def _release(self):
+        self.active -= 1
+        if self.active < self.max_concurrent and self._handoff():
+            self.active += 1
+
+    @asynccontextmanager
+    async def slot(self, client: str, wait_for_tokens: bool = False):
+        """占用一个提取名额；被拒绝时抛出 AdmissionRejected"""
+        await self.check_rate(client, wait=wait_for_tokens)
+        await self._acquire()
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.monotonic() - started)
+            self._release()
+
+    def stats(self, top: int = 10) -> dict:
+        # 令牌最少（最接近被限流）的客户端
+        levels = sorted(((bucket.level(), client) for client, bucket in self._buckets.items()))[:top]
+        return {
+            'limits': {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'rate': self.rate,
+                'burst': self.burst,
+            },
+            'active': self.active,
+            'waiting': self.waiting,
+            'avg_hold_seconds': round(self._avg_hold, 3),
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'clients': len(self._buckets),
+            'busiest_clients': [{'client': client, 'tokens': round(tokens, 2)} for tokens, client in levels],
+        }
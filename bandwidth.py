@@ -0,0 +1,194 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """线程安全的令牌桶，rate <= 0 表示不限速"""
+
+    def __init__(self, rate: float = 0, burst: Optional[float] = None):
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.burst = 0.0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate: float, burst: Optional[float] = None):
+        with self._lock:
+            self.rate = float(rate or 0)
+            # 默认允许 0.25 秒的突发，暂停/恢复的粒度和平滑度都比较合适
+            self.burst = float(burst) if burst else self.rate / 4
+            self._tokens = min(self._tokens, self.burst)
+
+    def reserve(self, amount: float) -> float:
+        """预占 amount 个令牌（允许透支），返回需要等待的秒数"""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class _Job:
+    def __init__(self, rate_limit: float):
+        self.rate_limit = rate_limit
+        self.bucket = TokenBucket()
+        self.running = threading.Event()
+        self.running.set()
+        # 已被调度、正在传输数据；排队中和等待重试的任务不参与全局带宽分配
+        self.active = False
+        self.filename = None
+        self.last_bytes = 0
+        self.total_bytes = 0
+        self.speed = 0.0
+
+
+class BandwidthController:
+    """下载带宽控制：暂停/恢复、全局限速和单任务限速
+
+    yt-dlp 每读取一块数据就会调用一次进度回调，在回调里阻塞即可让下载线程停止读取 socket，
+    因此暂停的响应时间不超过读取一块数据（buffersize）的时间，恢复后从 .part 文件继续下载。
+
+    全局带宽按 max-min 公平分配：设置了较低单任务上限的任务按上限分配，剩余带宽由其他任务均分。
+    任务在提交时登记（保存暂停状态和单任务上限），开始传输时 activate() 才参与分配，暂停的任务不参与分配。
+    """
+
+    def __init__(self, global_rate: float = 0):
+        self._lock = threading.Lock()
+        self.global_rate = float(global_rate or 0)
+        self._global = TokenBucket(self.global_rate)
+        self._jobs: Dict[str, _Job] = {}
+        # 已结束任务下载的字节数，加上运行中任务的字节数即为累计下载量
+        self.finished_bytes = 0
+
+    def register(self, job_id: str, rate_limit: float = 0):
+        with self._lock:
+            self._jobs[job_id] = _Job(float(rate_limit or 0))
+            self._rebalance()
+
+    def activate(self, job_id: str) -> bool:
+        return self._set_active(job_id, True)
+
+    def deactivate(self, job_id: str) -> bool:
+        """任务停止传输（例如等待重试），保留它的暂停状态和单任务上限"""
+        return self._set_active(job_id, False)
+
+    def _set_active(self, job_id: str, active: bool) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.active = active
+            self._rebalance()
+            return True
+
+    def unregister(self, job_id: str):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is not None:
+                # 避免仍在等待的线程永远阻塞
+                job.running.set()
+                self.finished_bytes += job.total_bytes
+            self._rebalance()
+
+    def pause(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.running.clear()
+            self._rebalance()
+            return True
+
+    def resume(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.running.set()
+            self._rebalance()
+            return True
+
+    def is_paused(self, job_id: str) -> Optional[bool]:
+        job = self._jobs.get(job_id)
+        return None if job is None else not job.running.is_set()
+
+    def set_global_rate(self, rate: float):
+        with self._lock:
+            self.global_rate = float(rate or 0)
+            self._global.set_rate(self.global_rate)
+            self._rebalance()
+
+    def set_job_rate(self, job_id: str, rate: float) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.rate_limit = float(rate or 0)
+            self._rebalance()
+            return True
+
+    def _rebalance(self):
+        """重新计算每个任务的分配速率（调用方持有 self._lock），只有正在传输且未暂停的任务分配全局带宽"""
+        jobs = []
+        for job in self._jobs.values():
+            if self.global_rate > 0 and job.active and job.running.is_set():
+                jobs.append(job)
+            else:
+                job.bucket.set_rate(job.rate_limit)
+        jobs.sort(key=lambda j: j.rate_limit or float('inf'))
+        remaining = self.global_rate
+        for i, job in enumerate(jobs):
+            share = remaining / (len(jobs) - i)
+            rate = min(job.rate_limit, share) if job.rate_limit else share
+            job.bucket.set_rate(rate)
+            remaining -= rate
+
+    def on_progress(self, job_id: str, d: dict):
+        """在 yt-dlp 进度回调中调用：暂停时阻塞，超出带宽时休眠"""
+        job = self._jobs.get(job_id)
+        if job is None or d.get('status') != 'downloading':
+            return
+        job.running.wait()
+
+        downloaded = d.get('downloaded_bytes') or 0
+        filename = d.get('filename')
+        if filename != job.filename or downloaded < job.last_bytes:
+            # 新文件（例如合并前的音频流）或断点续传：首次回调的字节数可能包含已下载的部分，只记录基准
+            job.filename = filename
+            delta = 0
+        else:
+            delta = downloaded - job.last_bytes
+        job.last_bytes = downloaded
+        job.speed = d.get('speed') or 0.0
+        if delta <= 0:
+            return
+        job.total_bytes += delta
+
+        wait = max(job.bucket.reserve(delta), self._global.reserve(delta))
+        if wait > 0:
+            time.sleep(wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'global_rate': self.global_rate,
+                'total_bytes': self.finished_bytes + sum(job.total_bytes for job in self._jobs.values()),
+                'jobs': {
+                    job_id: {
+                        'rate_limit': job.rate_limit,
+                        'allocated_rate': job.bucket.rate,
+                        'active': job.active,
+                        'paused': not job.running.is_set(),
+                        'downloaded_bytes': job.total_bytes,
+                        'speed': job.speed,
+                    }
+                    for job_id, job in self._jobs.items()
+                },
+            }
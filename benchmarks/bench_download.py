@@ -0,0 +1,105 @@
+"""下载吞吐量基准测试
+
+用法:
+    python benchmarks/bench_download.py                         # 32 MB 文件，每连接限速 2 MB/s
+    python benchmarks/bench_download.py --size 64 --rate 4 --connections 2 4 8
+
+在本地媒体服务器（benchmarks/media_server.py）上对比：
+- 渐进式流：原来的单连接下载与 ParallelYoutubeDL 多连接分段下载
+- HLS：逐个下载分片与 concurrent_fragment_downloads 并行下载分片
+服务器按连接限速，模拟 CDN 对单连接的限速。每次下载都会校验文件内容。
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import yt_dlp  # noqa: E402
+
+from media_server import MediaServer, media_sha256  # noqa: E402
+from parallel_download import ParallelYoutubeDL  # noqa: E402
+
+# 与 main.download_task 相同的下载参数
+BASE_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'noprogress': True,
+    'retries': 3,
+    'fragment_retries': 3,
+    'http_chunk_size': 10485760,
+    'buffersize': 65536,
+    'noresizebuffer': True,
+    'fixup': 'never',
+}
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def run(ydl_cls, url, connections, expected_size, expected_sha):
+    with tempfile.TemporaryDirectory() as tmp:
+        opts = {
+            **BASE_OPTS,
+            'outtmpl': os.path.join(tmp, 'out.%(ext)s'),
+            'concurrent_fragment_downloads': connections,
+        }
+        start = time.perf_counter()
+        with ydl_cls(opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            path = info['requested_downloads'][0]['filepath']
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+        if size != expected_size or (expected_sha and file_sha256(path) != expected_sha):
+            raise SystemExit(f'downloaded file is corrupt: {path}')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=32, help='文件大小（MB）')
+    parser.add_argument('--rate', type=float, default=2, help='每个连接的带宽上限（MB/s）')
+    parser.add_argument('--connections', type=int, nargs='+', default=[4, 8])
+    parser.add_argument('--segment-size', type=float, default=1, help='HLS 分片大小（MB）')
+    args = parser.parse_args()
+
+    size = args.size << 20
+    segment_size = int(args.segment_size * (1 << 20))
+    segments = max(1, size // segment_size)
+    results = []
+    with MediaServer(rate=args.rate * (1 << 20)) as server:
+        media_url = server.url(f'/media/bench.mp4?size={size}')
+        hls_url = server.url(f'/hls/bench.m3u8?segments={segments}&segment_size={segment_size}')
+        sha = media_sha256(size)
+
+        baseline = run(yt_dlp.YoutubeDL, media_url, 1, size, sha)
+        results.append(('progressive', 'single stream', baseline, baseline))
+        for n in args.connections:
+            results.append(('progressive', f'{n} ranges', run(ParallelYoutubeDL, media_url, n, size, sha), baseline))
+
+        # HLS 分片的内容按分片偏移生成，拼接后与同样大小的渐进式文件相同
+        hls_size = segments * segment_size
+        hls_sha = media_sha256(hls_size)
+        hls_baseline = run(yt_dlp.YoutubeDL, hls_url, 1, hls_size, hls_sha)
+        results.append(('hls', 'sequential fragments', hls_baseline, hls_baseline))
+        for n in args.connections:
+            results.append(('hls', f'{n} fragments', run(yt_dlp.YoutubeDL, hls_url, n, hls_size, hls_sha),
+                            hls_baseline))
+
+    print(f'{args.size} MB, per-connection cap {args.rate} MB/s')
+    print(f"{'stream':<12} {'mode':<22} {'seconds':>8} {'MB/s':>8} {'speedup':>8}")
+    for stream, mode, elapsed, base in results:
+        print(f'{stream:<12} {mode:<22} {elapsed:>8.2f} {args.size / elapsed:>8.2f} {base / elapsed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
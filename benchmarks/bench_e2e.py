@@ -0,0 +1,395 @@
+"""端到端基准测试：启动服务进程，通过 HTTP/WebSocket 接口测量，结果以 JSON 输出
+
+用法:
+    python benchmarks/bench_e2e.py                                  # 全部场景，JSON 输出到标准输出
+    python benchmarks/bench_e2e.py --only info download --output results.json
+    python benchmarks/bench_e2e.py --clients 1 10 100 1000 --jobs 1 2 4 8
+    python benchmarks/bench_e2e.py --only info websocket --workers 4    # 多进程部署（共享状态见 YTD_STATE_DB）
+
+不依赖网络：上游是本地媒体服务器（benchmarks/media_server.py），提供渐进式文件、HLS 和 DASH 清单，
+服务通过 yt-dlp 的通用提取器解析这些地址。服务在临时工作目录中以独立进程（uvicorn）运行，
+任务日志、媒体索引等文件不会写入仓库目录。
+
+场景：
+- startup:   进程启动到第一个请求成功返回的时间
+- info:      不同并发下 /video-info 的延迟（首次解析和缓存命中）
+- download:  1..N 个并行下载任务的总吞吐量（需要 ffmpeg）
+- websocket: 1..N 个 WebSocket 客户端订阅同一下载时，暂停/恢复事件从接口调用到各客户端收到的延迟（需要 ffmpeg）
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import websockets  # noqa: E402
+import yt_dlp  # noqa: E402
+
+from media_server import MediaServer  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('startup', 'info', 'download', 'websocket')
+# 不需要合并的格式选择，基准只测量下载本身
+DOWNLOAD_FORMAT = 'bestvideo/best'
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def summarize(values):
+    """延迟（秒）的分位数统计，输出为毫秒"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pct(50),
+        'p90_ms': pct(90),
+        'p99_ms': pct(99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def http(method, url, body=None, timeout=120):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def make_workdir(parent):
+    """服务的工作目录：main.py 按相对路径挂载 static 和 templates"""
+    workdir = os.path.join(parent, 'app')
+    os.makedirs(os.path.join(workdir, 'static'))
+    os.makedirs(os.path.join(workdir, 'templates'))
+    for candidate in (os.path.join(ROOT, 'templates', 'index.html'), os.path.join(ROOT, 'index.html')):
+        if os.path.exists(candidate):
+            shutil.copy(candidate, os.path.join(workdir, 'templates', 'index.html'))
+            break
+    return workdir
+
+
+class AppProcess:
+    """以子进程运行的服务"""
+
+    def __init__(self, workdir, env=None, workers=1):
+        self.workdir = workdir
+        self.workers = workers
+        self.port = free_port()
+        self.base = f'http://127.0.0.1:{self.port}'
+        self.env = {
+            **os.environ,
+            'PYTHONPATH': ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''),
+            'YTD_JOB_JOURNAL': os.path.join(workdir, f'jobs-{self.port}.db'),
+            'YTD_MEDIA_ARCHIVE': '',
+            **(env or {}),
+        }
+        self.process = None
+        self.startup_seconds = None
+
+    def start(self, timeout=60):
+        started = time.perf_counter()
+        self._log = open(os.path.join(self.workdir, f'server-{self.port}.log'), 'wb')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(self.port),
+             '--log-level', 'warning', '--workers', str(self.workers)],
+            cwd=self.workdir, env=self.env, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        while time.perf_counter() - started < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'服务启动失败，日志见 {self._log.name}')
+            try:
+                if http('GET', self.base + '/cache-stats', timeout=1)[0] == 200:
+                    self.startup_seconds = time.perf_counter() - started
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError('服务启动超时')
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self._log.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def media_urls(server, kind, count, size):
+    """count 个不同的上游地址（不同地址不会命中视频信息缓存）"""
+    segment_size = 1 << 20
+    segments = max(1, size // segment_size)
+    tag = uuid.uuid4().hex[:8]
+    urls = []
+    for i in range(count):
+        name = f'{kind}-{tag}-{i}'
+        if kind == 'progressive':
+            urls.append(server.url(f'/media/{name}.mp4?size={size}'))
+        elif kind == 'hls':
+            urls.append(server.url(f'/hls/{name}.m3u8?segments={segments}&segment_size={segment_size}'))
+        else:
+            urls.append(server.url(f'/dash/{name}.mpd?segments={segments}&segment_size={segment_size}'))
+    return urls
+
+
+def bench_startup(workdir, runs):
+    results = []
+    for _ in range(runs):
+        with AppProcess(workdir) as app:
+            results.append(app.startup_seconds)
+        log(f'  startup: {results[-1] * 1000:.0f} ms')
+    return {'runs_ms': [r * 1000 for r in results], 'median_ms': statistics.median(results) * 1000}
+
+
+def bench_info(app, server, levels, requests, kinds):
+    def timed(url):
+        start = time.perf_counter()
+        status, _ = http('GET', app.base + '/video-info?' + urllib.parse.urlencode({'url': url}))
+        return status, time.perf_counter() - start
+
+    results = {}
+    for kind in kinds:
+        results[kind] = {}
+        for concurrency in levels:
+            entry = {}
+            for phase in ('cold', 'warm'):
+                # 首次解析使用不同的地址；缓存命中重复请求同一个地址
+                urls = media_urls(server, kind, requests, 16 << 20)
+                if phase == 'warm':
+                    timed(urls[0])
+                    urls = [urls[0]] * requests
+                began = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    outcomes = list(pool.map(timed, urls))
+                elapsed = time.perf_counter() - began
+                entry[phase] = {
+                    **summarize([t for status, t in outcomes if status == 200]),
+                    'errors': sum(1 for status, _ in outcomes if status != 200),
+                    'requests_per_second': len(urls) / elapsed,
+                }
+            results[kind][str(concurrency)] = entry
+            log(f'  info {kind} c={concurrency}: cold p50 {entry["cold"].get("p50_ms", 0):.1f} ms, '
+                f'warm p50 {entry["warm"].get("p50_ms", 0):.1f} ms')
+    return results
+
+
+async def wait_downloads(app, download_ids, timeout):
+    """订阅下载进度，等待全部任务结束，返回 {download_id: 最终状态}"""
+    query = urllib.parse.urlencode([('download_id', d) for d in download_ids])
+    final = {}
+    async with websockets.connect(app.base.replace('http', 'ws') + '/ws?' + query, max_size=None) as ws:
+        deadline = time.monotonic() + timeout
+        while len(final) < len(download_ids):
+            message = json.loads(await asyncio.wait_for(ws.recv(), max(0.1, deadline - time.monotonic())))
+            if message.get('status') in ('completed', 'error', 'cancelled'):
+                final[message['download_id']] = message['status']
+    return final
+
+
+def bench_download(app, server, levels, size, kinds, save_root):
+    results = {}
+    for kind in kinds:
+        results[kind] = {}
+        for jobs in levels:
+            urls = media_urls(server, kind, jobs, size)
+            save_path = os.path.join(save_root, f'{kind}-{jobs}')
+            download_ids = [f'bench-{uuid.uuid4().hex[:8]}' for _ in urls]
+            began = time.perf_counter()
+            for url, download_id in zip(urls, download_ids):
+                status, _ = http('POST', app.base + '/download', {
+                    'url': url, 'format_id': DOWNLOAD_FORMAT, 'save_path': save_path, 'download_id': download_id,
+                })
+                if status != 200:
+                    raise RuntimeError(f'提交下载失败: HTTP {status}')
+            final = asyncio.run(wait_downloads(app, download_ids, timeout=600))
+            elapsed = time.perf_counter() - began
+            total = sum(os.path.getsize(os.path.join(save_path, f)) for f in os.listdir(save_path)
+                        if not f.endswith('.part'))
+            entry = {
+                'seconds': elapsed,
+                'bytes': total,
+                'aggregate_mb_per_second': total / elapsed / (1 << 20),
+                'per_job_mb_per_second': total / jobs / elapsed / (1 << 20),
+                'failed': sum(1 for status in final.values() if status != 'completed'),
+            }
+            results[kind][str(jobs)] = entry
+            shutil.rmtree(save_path, ignore_errors=True)
+            log(f'  download {kind} jobs={jobs}: {entry["aggregate_mb_per_second"]:.1f} MB/s aggregate')
+    return results
+
+
+class _Client:
+    def __init__(self, ws):
+        self.ws = ws
+
+    async def expect(self, status, timeout=60):
+        """读取消息直到收到指定状态，返回收到时的时间"""
+        deadline = time.monotonic() + timeout
+        while True:
+            message = await asyncio.wait_for(self.ws.recv(), max(0.1, deadline - time.monotonic()))
+            if json.loads(message).get('status') == status:
+                return time.perf_counter()
+
+
+async def _fanout(app, download_id, clients, rounds):
+    url = app.base.replace('http', 'ws') + '/ws?' + urllib.parse.urlencode({'download_id': download_id})
+    connections = []
+    latencies = []
+    loop = asyncio.get_running_loop()
+    try:
+        # 分批建立连接，避免瞬间打满监听队列
+        for start in range(0, clients, 100):
+            batch = await asyncio.gather(*(websockets.connect(url, max_size=None)
+                                           for _ in range(start, min(clients, start + 100))))
+            connections.extend(batch)
+        readers = [_Client(ws) for ws in connections]
+        for _ in range(rounds):
+            for action, status in (('pause', 'paused'), ('resume', 'resumed')):
+                waiters = [asyncio.create_task(r.expect(status)) for r in readers]
+                await asyncio.sleep(0)
+                sent = time.perf_counter()
+                await loop.run_in_executor(None, http, 'POST', app.base + '/toggle-download',
+                                           {'action': action, 'download_id': download_id})
+                latencies.extend(t - sent for t in await asyncio.gather(*waiters))
+    finally:
+        await asyncio.gather(*(ws.close() for ws in connections), return_exceptions=True)
+    return latencies
+
+
+def bench_websocket(app, levels, rounds, save_root):
+    # 上游限速的长时间下载，保证测量期间任务一直在运行
+    with MediaServer(rate=256 << 10) as slow:
+        url = slow.url(f'/media/ws-{uuid.uuid4().hex[:8]}.mp4?size={1 << 30}')
+        download_id = f'bench-ws-{uuid.uuid4().hex[:8]}'
+        status, _ = http('POST', app.base + '/download', {
+            'url': url, 'format_id': DOWNLOAD_FORMAT, 'save_path': os.path.join(save_root, 'ws'),
+            'download_id': download_id,
+        })
+        if status != 200:
+            raise RuntimeError(f'提交下载失败: HTTP {status}')
+        # 等待任务开始下载，暂停/恢复只对运行中的任务生效
+        deadline = time.monotonic() + 60
+        while http('GET', app.base + '/bandwidth')[1]['jobs'].get(download_id) is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError('下载任务未开始')
+            time.sleep(0.1)
+        results = {}
+        try:
+            for clients in levels:
+                latencies = asyncio.run(_fanout(app, download_id, clients, rounds))
+                results[str(clients)] = summarize(latencies)
+                log(f'  websocket clients={clients}: p50 {results[str(clients)]["p50_ms"]:.1f} ms, '
+                    f'p99 {results[str(clients)]["p99_ms"]:.1f} ms')
+        finally:
+            http('POST', app.base + '/cancel-download', {'download_id': download_id})
+    return results
+
+
+def environment():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'yt_dlp': yt_dlp.version.__version__,
+        'git_revision': revision or None,
+        'ffmpeg': shutil.which('ffmpeg') is not None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    parser.add_argument('--startup-runs', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='/video-info 并发数')
+    parser.add_argument('--requests', type=int, default=64, help='每个并发级别的 /video-info 请求数')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8], help='并行下载任务数')
+    parser.add_argument('--size', type=int, default=16, help='每个下载的大小（MB）')
+    parser.add_argument('--rate', type=float, default=4, help='上游每个连接的带宽上限（MB/s），0 表示不限速')
+    parser.add_argument('--kinds', nargs='+', choices=('progressive', 'hls', 'dash'),
+                        default=['progressive', 'hls', 'dash'])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 100, 1000], help='WebSocket 客户端数')
+    parser.add_argument('--rounds', type=int, default=5, help='每个客户端数下的暂停/恢复次数')
+    parser.add_argument('--workers', type=int, default=1, help='服务的工作进程数（uvicorn --workers），启动场景除外')
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'config': vars(args), 'results': {}}
+    needs_ffmpeg = {'download', 'websocket'} & set(args.only)
+    if needs_ffmpeg and not report['environment']['ffmpeg']:
+        log('未找到 ffmpeg，跳过下载相关场景')
+        for scenario in needs_ffmpeg:
+            report['results'][scenario] = {'skipped': 'ffmpeg not found'}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = make_workdir(tmp)
+        if 'startup' in args.only:
+            log('startup')
+            report['results']['startup'] = bench_startup(workdir, args.startup_runs)
+        # 所有请求来自同一个客户端：关闭单客户端限速，排队上限不低于最高并发数
+        env = {'YTD_MAX_DOWNLOADS': str(max(args.jobs)), 'YTD_CLIENT_RATE': '0',
+               'YTD_EXTRACTION_QUEUE': str(max(args.concurrency) * 2)}
+        with MediaServer(rate=args.rate * (1 << 20)) as server, AppProcess(workdir, env, args.workers) as app:
+            if 'info' in args.only:
+                log('info')
+                report['results']['info'] = bench_info(app, server, args.concurrency, args.requests, args.kinds)
+            if 'download' in args.only and 'download' not in report['results']:
+                log('download')
+                report['results']['download'] = bench_download(
+                    app, server, args.jobs, args.size << 20, args.kinds, os.path.join(tmp, 'downloads'))
+            if 'websocket' in args.only and 'websocket' not in report['results']:
+                log('websocket')
+                report['results']['websocket'] = bench_websocket(
+                    app, args.clients, args.rounds, os.path.join(tmp, 'downloads'))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""格式表构建的微基准测试
+
+用法:
+    python benchmarks/bench_format_table.py                    # 使用合成的 DASH 清单
+    python benchmarks/bench_format_table.py --manifest info.json  # 使用录制的清单 (yt-dlp -J URL > info.json)
+
+对比旧版 /info 的 O(n²) 实现与 format_table 的单次遍历实现。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import humanize  # noqa: E402
+
+from format_table import FormatTable  # noqa: E402
+
+
+def synthetic_manifest(n_formats=600, seed=0):
+    """生成类似直播回放 / DASH 清单的格式列表，包含大量纯视频、纯音频和合并流"""
+    rng = random.Random(seed)
+    heights = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+    vcodecs = ['avc1.640028', 'vp09.00.40.08', 'av01.0.08M.08']
+    acodecs = ['mp4a.40.2', 'opus']
+    formats = []
+    for i in range(n_formats):
+        kind = rng.random()
+        height = rng.choice(heights)
+        fmt = {
+            'format_id': str(100 + i),
+            'tbr': round(rng.uniform(50, 20000), 3),
+            'filesize': rng.randint(1 << 20, 4 << 30) if rng.random() > 0.05 else None,
+            'format_note': f'{height}p',
+        }
+        if kind < 0.6:
+            fmt.update(vcodec=rng.choice(vcodecs), acodec='none', ext='mp4', height=height,
+                       width=height * 16 // 9, fps=rng.choice([24, 30, 60]))
+        elif kind < 0.9:
+            fmt.update(vcodec='none', acodec=rng.choice(acodecs), ext='m4a')
+        else:
+            fmt.update(vcodec='avc1.42001E', acodec='mp4a.40.2', ext='mp4', height=height,
+                       width=height * 16 // 9, fps=30)
+        formats.append(fmt)
+    return {'title': 'synthetic', 'duration': 36000, 'formats': formats}
+
+
+def legacy_info_formats(info):
+    """旧版 /info 的格式处理（每个格式都重新扫描一遍最佳音频）"""
+    formats = {'combined': [], 'video': [], 'audio': []}
+    for f in info['formats']:
+        if f.get('vcodec') == 'none' and f.get('acodec') == 'none':
+            continue
+        best_audio = None
+        for af in info['formats']:
+            if af.get('vcodec') == 'none' and af.get('acodec') != 'none':
+                if not best_audio or ((af.get('filesize') or 0) > (best_audio.get('filesize') or 0)):
+                    best_audio = af
+        size = f.get('filesize') or f.get('approximate_filesize')
+        format_info = {
+            'format_id': f['format_id'],
+            'ext': f['ext'],
+            'fps': f.get('fps', 'N/A'),
+            'vcodec': f.get('vcodec', 'N/A'),
+            'acodec': f.get('acodec', 'N/A'),
+            'filesize': humanize.naturalsize(size) if size else 'N/A',
+            'width': f.get('width', 0),
+            'height': f.get('height', 0),
+        }
+        if f.get('vcodec') != 'none':
+            if f.get('acodec') == 'none' and best_audio:
+                format_info['format_id'] = f'{f["format_id"]}+{best_audio["format_id"]}'
+            formats['combined'].append(format_info)
+        elif f.get('acodec') != 'none':
+            formats['audio'].append(format_info)
+    for format_type in formats:
+        formats[format_type].sort(key=lambda x: (x.get('height') or 0, x.get('fps') or 0), reverse=True)
+    return formats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--manifest', help='yt-dlp -J 输出的 JSON 文件')
+    parser.add_argument('--formats', type=int, default=600, help='合成清单的格式数量')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.manifest:
+        with open(args.manifest, encoding='utf-8') as fp:
+            info = json.load(fp)
+    else:
+        info = synthetic_manifest(args.formats)
+
+    cases = {
+        'legacy /info (O(n^2))': lambda: legacy_info_formats(info),
+        'format_table (single pass)': lambda: FormatTable(info['formats']).to_dict(),
+    }
+    results = {}
+    print(f"formats: {len(info['formats'])}")
+    for name, fn in cases.items():
+        best = min(timeit.repeat(fn, repeat=args.repeat, number=args.number)) / args.number
+        results[name] = best
+        print(f"{name:<30} {best * 1000:10.3f} ms/op")
+    legacy, new = results.values()
+    print(f"speedup: {legacy / new:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""上游故障基准测试：本地媒体服务器注入故障，测量负缓存、熔断和任务重试的效果，结果以 JSON 输出
+
+用法:
+    python benchmarks/bench_resilience.py
+    python benchmarks/bench_resilience.py --only breaker --requests 50 --output results.json
+
+场景：
+- negative: 重复查询已删除（404）的视频，上游实际收到的请求数和响应延迟
+- breaker:  上游持续返回 429 时，上游收到的请求数、被直接拒绝（503）的请求数，以及故障恢复后多久恢复服务
+- retry:    下载数据的请求先返回若干次 429，任务重试的次数、全部完成的时间（需要 ffmpeg）
+
+服务以独立进程运行（见 bench_e2e.AppProcess），熔断冷却和重试退避按测试需要缩短。
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import websockets  # noqa: E402
+
+from bench_e2e import DOWNLOAD_FORMAT, AppProcess, environment, log, make_workdir, summarize  # noqa: E402
+from media_server import MediaServer  # noqa: E402
+
+SCENARIOS = ('negative', 'breaker', 'retry')
+
+
+def get(url, timeout=60):
+    """返回 (状态码, Retry-After, 耗时秒数)"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            return response.status, None, time.perf_counter() - started
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('Retry-After'), time.perf_counter() - started
+
+
+def video_info(app, url):
+    return get(app.base + '/video-info?' + urllib.parse.urlencode({'url': url}))
+
+
+def bench_negative(app, server, requests):
+    url = server.url(f'/media/gone-{uuid.uuid4().hex[:8]}.mp4?status=404')
+    before = server.requests
+    results = [video_info(app, url) for _ in range(requests)]
+    return {
+        'requests': requests,
+        'upstream_requests': server.requests - before,
+        'statuses': sorted({status for status, _, _ in results}),
+        'first_ms': results[0][2] * 1000,
+        'cached': summarize([elapsed for _, _, elapsed in results[1:]]),
+    }
+
+
+def bench_breaker(app, server, requests, cooldown):
+    tag = uuid.uuid4().hex[:8]
+    server.inject(429)
+    before = server.requests
+    statuses = {}
+    retry_after = set()
+    for i in range(requests):
+        status, after, _ = video_info(app, server.url(f'/media/throttled-{tag}-{i}.mp4'))
+        statuses[status] = statuses.get(status, 0) + 1
+        if after is not None:
+            retry_after.add(after)
+    upstream_requests = server.requests - before
+    # 上游恢复后，冷却结束时的探测请求成功即关闭熔断
+    server.clear_faults()
+    recovered = time.perf_counter()
+    deadline = recovered + cooldown * 4 + 30
+    attempts = 0
+    while time.perf_counter() < deadline:
+        attempts += 1
+        status, _, _ = video_info(app, server.url(f'/media/recovered-{tag}-{attempts}.mp4'))
+        if status == 200:
+            break
+        time.sleep(0.2)
+    return {
+        'requests': requests,
+        'upstream_requests': upstream_requests,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'retry_after': sorted(retry_after),
+        'recovery_seconds': time.perf_counter() - recovered,
+        'recovery_attempts': attempts,
+        'upstream_stats': json.loads(urllib.request.urlopen(app.base + '/upstream-stats').read()),
+    }
+
+
+async def _watch(app, download_ids, timeout):
+    """订阅下载进度，返回 {download_id: (最终状态, 重试次数)}"""
+    query = urllib.parse.urlencode([('download_id', d) for d in download_ids])
+    final = {}
+    retries = {d: 0 for d in download_ids}
+    async with websockets.connect(app.base.replace('http', 'ws') + '/ws?' + query, max_size=None) as ws:
+        deadline = time.monotonic() + timeout
+        while len(final) < len(download_ids):
+            message = json.loads(await asyncio.wait_for(ws.recv(), max(0.1, deadline - time.monotonic())))
+            download_id = message.get('download_id')
+            if message.get('status') == 'retrying':
+                retries[download_id] += 1
+            elif message.get('status') in ('completed', 'error', 'cancelled'):
+                final[download_id] = message['status']
+    return {d: (final[d], retries[d]) for d in download_ids}
+
+
+def bench_retry(app, server, jobs, failures, size, save_root):
+    tag = uuid.uuid4().hex[:8]
+    save_path = os.path.join(save_root, 'retry')
+    download_ids = [f'retry-{tag}-{i}' for i in range(jobs)]
+    # 页面解析正常，下载数据的前 failures 个请求返回 429
+    server.inject(429, failures, ranged_only=True)
+    before = server.failures
+    began = time.perf_counter()
+
+    async def run():
+        watcher = asyncio.create_task(_watch(app, download_ids, timeout=600))
+        await asyncio.sleep(0.2)
+        loop = asyncio.get_running_loop()
+        for i, download_id in enumerate(download_ids):
+            body = json.dumps({
+                'url': server.url(f'/media/retry-{tag}-{i}.mp4?size={size}'), 'format_id': DOWNLOAD_FORMAT,
+                'save_path': save_path, 'download_id': download_id,
+            }).encode()
+            request = urllib.request.Request(app.base + '/download', data=body, method='POST',
+                                             headers={'Content-Type': 'application/json'})
+            await loop.run_in_executor(None, lambda: urllib.request.urlopen(request, timeout=60).read())
+        return await watcher
+
+    final = asyncio.run(run())
+    elapsed = time.perf_counter() - began
+    shutil.rmtree(save_path, ignore_errors=True)
+    return {
+        'jobs': jobs,
+        'injected_failures': server.failures - before,
+        'completed': sum(1 for state, _ in final.values() if state == 'completed'),
+        'retries': sum(n for _, n in final.values()),
+        'seconds': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    parser.add_argument('--requests', type=int, default=30, help='negative/breaker 场景的请求数')
+    parser.add_argument('--jobs', type=int, default=4, help='retry 场景的下载任务数')
+    parser.add_argument('--failures', type=int, default=6, help='retry 场景注入的 429 次数')
+    parser.add_argument('--size', type=int, default=4, help='每个下载的大小（MB）')
+    parser.add_argument('--cooldown', type=float, default=2, help='熔断冷却时间（秒）')
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'config': vars(args), 'results': {}}
+    if 'retry' in args.only and not report['environment']['ffmpeg']:
+        log('未找到 ffmpeg，跳过 retry 场景')
+        report['results']['retry'] = {'skipped': 'ffmpeg not found'}
+    env = {
+        'YTD_CLIENT_RATE': '0',
+        'YTD_BREAKER_THRESHOLD': '5',
+        'YTD_BREAKER_COOLDOWN': str(args.cooldown),
+        'YTD_RETRY_BASE_DELAY': '0.5',
+        'YTD_RETRY_MAX_DELAY': '5',
+        'YTD_RETRY_ATTEMPTS': '5',
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = make_workdir(tmp)
+        with MediaServer() as server:
+            # 每个场景使用新的服务进程，熔断状态互不影响
+            if 'negative' in args.only:
+                log('negative')
+                with AppProcess(workdir, env) as app:
+                    report['results']['negative'] = bench_negative(app, server, args.requests)
+            if 'breaker' in args.only:
+                log('breaker')
+                with AppProcess(workdir, env) as app:
+                    report['results']['breaker'] = bench_breaker(app, server, args.requests, args.cooldown)
+            if 'retry' in args.only and 'retry' not in report['results']:
+                log('retry')
+                with AppProcess(workdir, {**env, 'YTD_MAX_DOWNLOADS': str(args.jobs)}) as app:
+                    report['results']['retry'] = bench_retry(
+                        app, server, args.jobs, args.failures, args.size << 20, os.path.join(tmp, 'downloads'))
+                server.clear_faults()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
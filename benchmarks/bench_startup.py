@@ -0,0 +1,87 @@
+"""冷启动基准测试
+
+用法:
+    python benchmarks/bench_startup.py                                   # 默认配置，运行 5 次
+    python benchmarks/bench_startup.py --allowed-extractors "youtube.*" generic --runs 10 --output startup.json
+
+每次运行都启动一个新的服务进程，测量：
+- import: 新解释器中 import main 的耗时
+- ready:  进程启动到第一个 HTTP 请求成功返回的时间
+- first_info: 就绪后立即请求 /video-info（本地媒体服务器上的地址）的延迟，反映首个请求承担的导入和预热开销
+- first_info_after_warmup: 等待后台预热完成后再请求的延迟
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_e2e import ROOT, AppProcess, environment, http, log, make_workdir  # noqa: E402
+from media_server import MediaServer  # noqa: E402
+
+
+def import_seconds(workdir, env):
+    code = 'import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)'
+    out = subprocess.run([sys.executable, '-c', code], cwd=workdir, capture_output=True, text=True,
+                         env={**os.environ, 'PYTHONPATH': ROOT, **env}, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def first_info(app, server, name):
+    url = server.url(f'/media/{name}.mp4?size=1048576')
+    start = time.perf_counter()
+    status, _ = http('GET', app.base + '/video-info?' + urllib.parse.urlencode({'url': url}))
+    if status != 200:
+        raise RuntimeError(f'/video-info 失败: HTTP {status}')
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup-wait', type=float, default=3, help='等待后台预热完成的秒数')
+    parser.add_argument('--allowed-extractors', nargs='+', help='设置 YTD_ALLOWED_EXTRACTORS')
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    args = parser.parse_args()
+
+    env = {}
+    if args.allowed_extractors:
+        env['YTD_ALLOWED_EXTRACTORS'] = ','.join(args.allowed_extractors)
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp, MediaServer() as server:
+        workdir = make_workdir(tmp)
+        for i in range(args.runs):
+            run = {'import_ms': import_seconds(workdir, env) * 1000}
+            with AppProcess(workdir, env) as app:
+                run['ready_ms'] = app.startup_seconds * 1000
+                run['first_info_ms'] = first_info(app, server, f'cold-{i}') * 1000
+            with AppProcess(workdir, env) as app:
+                time.sleep(args.warmup_wait)
+                run['first_info_after_warmup_ms'] = first_info(app, server, f'warm-{i}') * 1000
+            runs.append(run)
+            log('  ' + ', '.join(f'{k} {v:.0f}' for k, v in run.items()))
+
+    report = {
+        'environment': environment(),
+        'config': vars(args),
+        'results': {
+            'runs': runs,
+            'median': {key: statistics.median(run[key] for run in runs) for key in runs[0]},
+        },
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""本地媒体服务器：基准测试用的上游替身，不依赖网络
+
+提供确定性的合成媒体数据，支持 Range 请求，并按连接限制带宽（模拟 CDN 对单连接的限速）：
+    /media/<name>.mp4?size=<字节数>                          渐进式文件
+    /hls/<name>.m3u8?segments=<分片数>&segment_size=<字节数>  HLS 播放列表，分片为 /hls/<name>/<i>.ts
+    /dash/<name>.mpd?segments=<分片数>&segment_size=<字节数>  DASH 清单（一路视频、一路音频），分片为 /dash/<name>/<流>/<i>.m4s
+
+故障注入：任意地址加上 status=<状态码> 时总是返回该状态（模拟已删除、私享等永久错误）；
+MediaServer.inject(status, count) 让之后的 count 个请求返回该状态（模拟上游限流或故障），clear_faults() 恢复正常；
+ranged_only=True 时只影响带 Range 的请求（下载媒体数据），页面解析不受影响。
+
+单独运行时启动服务器，便于手动调试：
+    python benchmarks/media_server.py --port 8765 --rate 2
+    python benchmarks/media_server.py --fail-status 429 --fail-count 10
+"""
+import argparse
+import hashlib
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_PATTERN = random.Random(0).randbytes(1 << 20)
+
+
+def media_bytes(start: int, end: int) -> bytes:
+    """合成媒体数据中 [start, end) 的内容"""
+    n = len(_PATTERN)
+    out = bytearray()
+    pos = start
+    while pos < end:
+        offset = pos % n
+        take = min(n - offset, end - pos)
+        out += _PATTERN[offset:offset + take]
+        pos += take
+    return bytes(out)
+
+
+def media_sha256(size: int) -> str:
+    h = hashlib.sha256()
+    for start in range(0, size, 1 << 20):
+        h.update(media_bytes(start, min(size, start + (1 << 20))))
+    return h.hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'MediaServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def _handle(self, send_body: bool):
+        self.server.requests += 1
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        status = int(query['status']) if 'status' in query else self.server.take_fault('Range' in self.headers)
+        if status is not None:
+            return self._fail(status, send_body)
+        m = re.fullmatch(r'/hls/([\w-]+)\.m3u8', url.path)
+        if m:
+            return self._playlist(m.group(1), query, send_body)
+        m = re.fullmatch(r'/dash/([\w-]+)\.mpd', url.path)
+        if m:
+            return self._manifest(m.group(1), query, send_body)
+        m = re.fullmatch(r'/dash/[\w-]+/(video|audio)/(init|\d+)\.m4s', url.path)
+        if m:
+            size = int(query.get('segment_size', 1 << 20))
+            if m.group(2) == 'init':
+                return self._media(1024, 'video/mp4', send_body)
+            # 音频流的码率约为视频的 1/8
+            if m.group(1) == 'audio':
+                size = max(1024, size // 8)
+            return self._media(size, 'video/mp4', send_body, offset=int(m.group(2)) * size)
+        m = re.fullmatch(r'/hls/[\w-]+/(\d+)\.ts', url.path)
+        if m:
+            size = int(query.get('segment_size', 1 << 20))
+            return self._media(size, 'video/mp2t', send_body, offset=int(m.group(1)) * size)
+        if re.fullmatch(r'/media/[\w-]+\.mp4', url.path):
+            return self._media(int(query.get('size', 16 << 20)), 'video/mp4', send_body)
+        self.send_error(404)
+
+    def _fail(self, status, send_body):
+        self.server.failures += 1
+        body = f'injected failure {status}\n'.encode()
+        self.send_response(status)
+        if status in (429, 503):
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _playlist(self, name, query, send_body):
+        segments = int(query.get('segments', 16))
+        segment_size = int(query.get('segment_size', 1 << 20))
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(segments):
+            lines += ['#EXTINF:4.0,', f'{name}/{i}.ts?segment_size={segment_size}']
+        lines.append('#EXT-X-ENDLIST')
+        body = ('\n'.join(lines) + '\n').encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _manifest(self, name, query, send_body):
+        segments = int(query.get('segments', 16))
+        segment_size = int(query.get('segment_size', 1 << 20))
+        # 每个分片 4 秒，码率由分片大小推算
+        bandwidth = segment_size * 8 // 4
+        template = f'{name}/$RepresentationID$/$Number$.m4s?segment_size={segment_size}'
+        init = f'{name}/$RepresentationID$/init.m4s'
+        body = f'''<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" profiles="urn:mpeg:dash:profile:isoff-live:2011"
+     mediaPresentationDuration="PT{segments * 4}S" minBufferTime="PT4S">
+  <Period>
+    <AdaptationSet mimeType="video/mp4" contentType="video">
+      <SegmentTemplate timescale="1" duration="4" startNumber="0" initialization="{init}" media="{template}"/>
+      <Representation id="video" codecs="avc1.64001f" width="1280" height="720" frameRate="30" bandwidth="{bandwidth}"/>
+    </AdaptationSet>
+    <AdaptationSet mimeType="audio/mp4" contentType="audio" lang="en">
+      <SegmentTemplate timescale="1" duration="4" startNumber="0" initialization="{init}" media="{template}"/>
+      <Representation id="audio" codecs="mp4a.40.2" audioSamplingRate="44100" bandwidth="{max(8192, bandwidth // 8)}"/>
+    </AdaptationSet>
+  </Period>
+</MPD>
+'''.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/dash+xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _media(self, size, content_type, send_body, offset=0):
+        start, end = 0, size
+        range_header = self.headers.get('Range')
+        m = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header or '')
+        if m and self.server.ranges:
+            start = int(m.group(1))
+            end = min(size, int(m.group(2)) + 1) if m.group(2) else size
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes' if self.server.ranges else 'none')
+        self.end_headers()
+        if send_body:
+            self._send_throttled(offset + start, offset + end)
+
+    def _send_throttled(self, start, end):
+        """按 server.rate 限制本连接的发送速度"""
+        block = 64 << 10
+        rate = self.server.rate
+        began = time.monotonic()
+        sent = 0
+        pos = start
+        try:
+            while pos < end:
+                data = media_bytes(pos, min(end, pos + block))
+                self.wfile.write(data)
+                pos += len(data)
+                sent += len(data)
+                if rate > 0:
+                    ahead = sent / rate - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class MediaServer(ThreadingHTTPServer):
+    """在后台线程中运行的媒体服务器，rate 为每个连接的带宽上限（字节/秒，0 表示不限速）"""
+
+    daemon_threads = True
+
+    def __init__(self, rate: float = 0, ranges: bool = True, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.rate = rate
+        self.ranges = ranges
+        self.requests = 0
+        self.failures = 0
+        self._fault_lock = threading.Lock()
+        # (状态码, 剩余次数, 是否只影响 Range 请求)，次数为 None 表示直到 clear_faults()
+        self._fault = None
+        self._thread = None
+
+    def inject(self, status: int, count=None, ranged_only=False):
+        """之后的 count 个请求（None 表示全部）返回 status"""
+        with self._fault_lock:
+            self._fault = (status, count, ranged_only)
+
+    def clear_faults(self):
+        with self._fault_lock:
+            self._fault = None
+
+    def take_fault(self, ranged: bool):
+        with self._fault_lock:
+            if self._fault is None:
+                return None
+            status, count, ranged_only = self._fault
+            if ranged_only and not ranged:
+                return None
+            if count is not None:
+                self._fault = (status, count - 1, ranged_only) if count > 1 else None
+            return status
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭 keep-alive 连接属于正常情况
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def url(self, path: str) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{path}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate', type=float, default=0, help='每个连接的带宽上限（MB/s），0 表示不限速')
+    parser.add_argument('--no-ranges', action='store_true', help='忽略 Range 请求')
+    parser.add_argument('--fail-status', type=int, help='注入故障：返回该状态码')
+    parser.add_argument('--fail-count', type=int, help='注入故障的请求数，默认所有请求')
+    args = parser.parse_args()
+    server = MediaServer(rate=args.rate * (1 << 20), ranges=not args.no_ranges, port=args.port)
+    if args.fail_status:
+        server.inject(args.fail_status, args.fail_count)
+    print(f'Serving synthetic media at {server.url("/media/sample.mp4?size=67108864")}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
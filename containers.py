@@ -0,0 +1,150 @@
+from functools import lru_cache
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+# 合并时的输出容器，按优先级排列（与 yt-dlp 的 merge_output_format 写法一致）
+DEFAULT_CONTAINERS = ('mp4', 'webm', 'mkv')
+
+# codec 字符串前缀 -> 编码族
+_VIDEO_FAMILIES = (
+    (('avc1', 'avc3', 'h264'), 'h264'),
+    (('hvc1', 'hev1', 'hevc', 'h265'), 'hevc'),
+    (('av01', 'av1'), 'av1'),
+    (('vp09', 'vp9'), 'vp9'),
+    (('vp08', 'vp8'), 'vp8'),
+)
+_AUDIO_FAMILIES = (
+    (('mp4a.40.34', 'mp3'), 'mp3'),
+    (('mp4a', 'aac'), 'aac'),
+    (('opus',), 'opus'),
+    (('vorbis', 'vrbs'), 'vorbis'),
+    (('ec-3', 'eac3'), 'eac3'),
+    (('ac-3', 'ac3'), 'ac3'),
+    (('ac-4', 'ac4'), 'ac4'),
+    (('flac', 'fLaC'), 'flac'),
+)
+
+# 各容器可以直接复制（-c copy）的编码族，与 yt-dlp 选择合并容器的规则保持一致；mkv 可以容纳任意编码
+STREAM_COPY = {
+    'mp4': ({'h264', 'hevc', 'av1'}, {'aac', 'mp3', 'eac3', 'ac3', 'ac4'}),
+    'webm': ({'vp8', 'vp9', 'av1'}, {'opus', 'vorbis'}),
+}
+
+# 转码到各容器时使用的目标编码
+_TRANSCODE_TARGET = {
+    'mp4': ('h264', 'aac'),
+    'webm': ('vp9', 'opus'),
+}
+
+# 每秒媒体时长的转码 CPU 秒数（单核估算）；视频以 1080p30 为基准按像素率缩放
+_AUDIO_CPU_PER_SECOND = 0.02
+_VIDEO_CPU_PER_SECOND = {'h264': 1.0, 'vp9': 4.0}
+_BASE_PIXEL_RATE = 1920 * 1080 * 30
+
+
+def _family(codec: Optional[str], families) -> Optional[str]:
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    for prefixes, family in families:
+        if codec.startswith(tuple(p.lower() for p in prefixes)):
+            return family
+    return codec.split('.')[0]
+
+
+@lru_cache(maxsize=256)
+def video_family(vcodec: Optional[str]) -> Optional[str]:
+    return _family(vcodec, _VIDEO_FAMILIES)
+
+
+@lru_cache(maxsize=256)
+def audio_family(acodec: Optional[str]) -> Optional[str]:
+    return _family(acodec, _AUDIO_FAMILIES)
+
+
+def can_copy(container: str, vfamily: Optional[str], afamily: Optional[str]) -> bool:
+    if container == 'mkv':
+        return True
+    video, audio = STREAM_COPY.get(container, (set(), set()))
+    return (vfamily is None or vfamily in video) and (afamily is None or afamily in audio)
+
+
+class MergePlan(NamedTuple):
+    """一对视频/音频流的合并方案：输出容器，以及需要转码的流和估算的 CPU 开销"""
+    container: str
+    transcode: Tuple[str, ...] = ()
+    cpu_seconds: float = 0.0
+
+    @property
+    def stream_copy(self) -> bool:
+        return not self.transcode
+
+    @property
+    def cpu_cost(self) -> str:
+        if not self.transcode:
+            return 'none'
+        if 'video' not in self.transcode:
+            return 'low'
+        return 'high' if self.cpu_seconds > 600 else 'medium'
+
+    def to_dict(self) -> Optional[dict]:
+        """格式表中的转码标记，纯复制时为 None"""
+        if not self.transcode:
+            return None
+        return {
+            'streams': list(self.transcode),
+            'cpu_cost': self.cpu_cost,
+            'estimated_cpu_seconds': round(self.cpu_seconds, 1),
+        }
+
+
+@lru_cache(maxsize=1024)
+def family_plan(vfamily: Optional[str], afamily: Optional[str], containers: Tuple[str, ...]) -> MergePlan:
+    """按编码族选择容器，不含 CPU 开销估算"""
+    for container in containers:
+        if can_copy(container, vfamily, afamily):
+            return MergePlan(container)
+    # 没有可以直接复制的容器：转码到首选容器
+    container = containers[0]
+    video, audio = STREAM_COPY.get(container, (set(), set()))
+    transcode = []
+    if vfamily is not None and vfamily not in video:
+        transcode.append('video')
+    if afamily is not None and afamily not in audio:
+        transcode.append('audio')
+    return MergePlan(container, tuple(transcode))
+
+
+def estimate_cost(plan: MergePlan, video: Optional[dict], duration: float) -> MergePlan:
+    """估算转码的 CPU 秒数"""
+    if not plan.transcode:
+        return plan
+    duration = float(duration or 0)
+    cpu = 0.0
+    if 'audio' in plan.transcode:
+        cpu += duration * _AUDIO_CPU_PER_SECOND
+    if 'video' in plan.transcode and video:
+        target = _TRANSCODE_TARGET.get(plan.container, ('h264', 'aac'))[0]
+        pixel_rate = (video.get('width') or 1920) * (video.get('height') or 1080) * (video.get('fps') or 30)
+        cpu += duration * _VIDEO_CPU_PER_SECOND.get(target, 1.0) * pixel_rate / _BASE_PIXEL_RATE
+    return plan._replace(cpu_seconds=cpu)
+
+
+def merge_plan(video: Optional[dict], audio: Optional[dict], containers: Sequence[str] = DEFAULT_CONTAINERS,
+               duration: float = 0) -> MergePlan:
+    """为视频流和音频流（dict 为 yt-dlp 的格式信息，可为 None）选择输出容器"""
+    containers = tuple(containers) or DEFAULT_CONTAINERS
+    vfamily = video_family(video.get('vcodec')) if video else None
+    afamily = audio_family(audio.get('acodec')) if audio else None
+    return estimate_cost(family_plan(vfamily, afamily, containers), video, duration)
+
+
+def plan_for_selection(info: dict, format_id: str, containers: Sequence[str] = DEFAULT_CONTAINERS) -> Optional[MergePlan]:
+    """format_table 生成的 "视频+音频" 组合对应的合并方案，其他格式选择返回 None"""
+    parts = format_id.split('+')
+    if len(parts) != 2:
+        return None
+    by_id = {f.get('format_id'): f for f in info.get('formats') or ()}
+    video, audio = by_id.get(parts[0]), by_id.get(parts[1])
+    if video is None or audio is None:
+        return None
+    return merge_plan(video, audio, containers, info.get('duration') or 0)
@@ -0,0 +1,155 @@
+import asyncio
+import copy
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from metadata_cache import MetadataCache, cache_key
+from resilience import UpstreamGuard
+from ydl_pool import YoutubeDLPool
+
+
+class SingleFlight:
+    """合并同一个 key 的并发调用：同一时刻只执行一次，所有等待者共享结果"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: 某个请求被取消时不影响其他共享同一结果的请求
+        return await asyncio.shield(task)
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+def _opts_key(ydl_opts: dict) -> str:
+    # progress_hooks 等不可序列化的值按 repr 处理，只用于区分参数组合
+    return json.dumps(ydl_opts, sort_keys=True, default=repr)
+
+
+def _extract_raw(pool: YoutubeDLPool, url: str, ydl_opts: dict):
+    """只运行提取器（网络请求），返回 (是否可缓存, 结果)"""
+    with pool.acquire(ydl_opts) as ydl:
+        ie_result = ydl.extract_info(url, download=False, process=False)
+        if ie_result and ie_result.get('_type', 'video') != 'video':
+            # 播放列表等结果包含惰性条目，无法缓存，直接完整处理
+            return False, ydl.process_ie_result(ie_result, download=False)
+        return True, ie_result
+
+
+# 未限制提取器时预热的提取器：本项目主要处理 YouTube，其他网站由通用提取器处理
+DEFAULT_WARM_EXTRACTORS = ('Youtube', 'YoutubeTab', 'Generic')
+
+
+def warm_up(pool: YoutubeDLPool, ydl_opts: dict) -> dict:
+    """预先加载提取器注册表和常用提取器的模块，避免第一个请求承担导入开销；创建的实例留在池中供后续请求使用"""
+    started = time.perf_counter()
+    with pool.acquire(ydl_opts) as ydl:
+        restricted = ydl.params.get('allowed_extractors') not in (None, ['default'])
+        names = list(ydl._ies) if restricted else DEFAULT_WARM_EXTRACTORS
+        for name in names:
+            # 惰性提取器（lazy_extractors）在访问 real_class 时才导入真正的模块
+            getattr(type(ydl.get_info_extractor(name)), 'real_class', None)
+    return {'extractors': len(names), 'seconds': time.perf_counter() - started}
+
+
+def _process(pool: YoutubeDLPool, raw: dict, ydl_opts: dict):
+    """在本地对原始提取结果做格式选择，不产生网络请求"""
+    with pool.acquire(ydl_opts) as ydl:
+        return ydl.process_ie_result(copy.deepcopy(raw), download=False)
+
+
+class Extractor:
+    """在独立的有界线程池中运行 yt-dlp 提取，避免阻塞事件循环"""
+
+    def __init__(self, max_workers: int = 4, cache: Optional[MetadataCache] = None,
+                 pool: Optional[YoutubeDLPool] = None, guard: Optional[UpstreamGuard] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract")
+        self.pool = pool or YoutubeDLPool(max_idle=max_workers)
+        self._flight = SingleFlight()
+        self.cache = cache or MetadataCache()
+        # 同一原始结果、同一组参数的格式选择结果，热门视频的重复请求可直接复用
+        self._processed: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._processed_size = 64
+        # 负缓存和上游熔断：缓存未命中、需要访问上游时才检查
+        self.guard = guard
+
+    async def extract_raw(self, url: str, ydl_opts: dict, check_upstream: bool = True):
+        """返回未经格式选择的原始提取结果，优先使用缓存
+
+        check_upstream=False 时不检查熔断（调用方已经检查过，例如调度器放行的下载任务），负缓存仍然生效。
+        """
+        key = cache_key(url, ydl_opts)
+        loop = asyncio.get_running_loop()
+        raw = self.cache.peek(key)
+        if raw is None and self.cache.persistent:
+            # 内存未命中时在提取线程池中读取磁盘缓存
+            raw = await loop.run_in_executor(self._executor, self.cache.get, key)
+        elif raw is None:
+            raw = self.cache.get(key)
+        if raw is not None:
+            return True, raw
+        if self.guard is not None:
+            if check_upstream:
+                self.guard.check(url)
+            else:
+                self.guard.check_negative(url)
+
+        async def extract():
+            try:
+                cacheable, result = await loop.run_in_executor(self._executor, _extract_raw, self.pool, url, ydl_opts)
+            except Exception as e:
+                if self.guard is not None:
+                    self.guard.record_failure(url, e)
+                raise
+            if self.guard is not None:
+                self.guard.record_success(url)
+            if cacheable and result:
+                if self.cache.persistent:
+                    await loop.run_in_executor(self._executor, self.cache.set, key, result)
+                else:
+                    self.cache.set(key, result)
+            return cacheable, result
+
+        return await self._flight.do((key, _opts_key(ydl_opts)), extract)
+
+    async def process(self, raw: dict, ydl_opts: dict):
+        """按 ydl_opts 对原始提取结果做格式选择，原始结果不会被修改"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _process, self.pool, raw, ydl_opts)
+
+    async def extract_info(self, url: str, ydl_opts: dict):
+        """返回处理后的信息，结果可能被多个请求共享，调用方不能修改"""
+        cacheable, result = await self.extract_raw(url, ydl_opts)
+        if not cacheable or not result:
+            return result
+        key = (cache_key(url, ydl_opts), _opts_key(ydl_opts))
+        entry = self._processed.get(key)
+        if entry is not None and entry[0] is result:
+            self._processed.move_to_end(key)
+            return entry[1]
+        info = await self.process(result, ydl_opts)
+        self._processed[key] = (result, info)
+        self._processed.move_to_end(key)
+        while len(self._processed) > self._processed_size:
+            self._processed.popitem(last=False)
+        return info
+
+    async def warm_up(self, ydl_opts: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, warm_up, self.pool, ydl_opts)
+
+    def inflight(self) -> int:
+        return self._flight.inflight()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.close()
@@ -0,0 +1,252 @@
+import asyncio
+import mimetypes
+import os
+import re
+from collections import OrderedDict
+from typing import AsyncIterator, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+
+# 每次读取的块大小
+CHUNK_SIZE = 1 << 20
+# 下载中的文件没有新数据时的轮询间隔（秒）
+TAIL_POLL_INTERVAL = 0.25
+# ASGI 零拷贝发送扩展（服务器在 scope['extensions'] 中声明支持时使用 sendfile）
+ZEROCOPY_EXTENSION = 'http.response.zerocopysend'
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class DownloadInterrupted(Exception):
+    """下载中的文件没有写完就结束了，正在发送的响应需要中止"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单个字节范围，返回 [start, end)；没有 Range 或格式不支持（如多个范围）时返回 None"""
+    m = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', header or '')
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if not m.group(1):
+        # bytes=-N：最后 N 个字节
+        length = int(m.group(2))
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size
+    start = int(m.group(1))
+    end = min(size, int(m.group(2)) + 1) if m.group(2) else size
+    if start >= size or end <= start:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def _read(path: str, offset: int, length: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+class LiveFile:
+    """一个下载任务的文件状态，由进度回调更新"""
+
+    def __init__(self, download_id: str, streamable: bool = True):
+        self.download_id = download_id
+        # 只有单个流（不需要合并）的下载可以边下边读
+        self.streamable = streamable
+        self.state = 'downloading'
+        self.filename: Optional[str] = None
+        # 正在写入的文件（.part），流下载完成后为最终文件名
+        self.path: Optional[str] = None
+        self.total: Optional[int] = None
+        # 多连接下载时从文件开头起连续写入的字节数；None 表示文件按顺序写入，文件大小即可读字节数
+        self.contiguous: Optional[int] = None
+        self.stream_done = False
+        self.final_path: Optional[str] = None
+
+    def available(self) -> int:
+        """可以按顺序读取的字节数"""
+        if self.contiguous is not None and not self.stream_done:
+            return self.contiguous
+        for path in (self.path, self.filename):
+            if path:
+                try:
+                    return os.path.getsize(path)
+                except OSError:
+                    continue
+        return 0
+
+    def read(self, offset: int, length: int) -> bytes:
+        # .part 文件在流下载完成时被重命名，每次按当前路径重新打开
+        for path in (self.path, self.filename):
+            if path:
+                try:
+                    return _read(path, offset, length)
+                except FileNotFoundError:
+                    continue
+        raise FileNotFoundError(self.filename)
+
+    @property
+    def finished(self) -> bool:
+        return self.state != 'downloading' or self.stream_done
+
+
+class FileRegistry:
+    """记录下载任务的文件，供文件接口按 download_id 提供下载中和已完成的文件"""
+
+    def __init__(self, history_size: int = 1000):
+        self.history_size = history_size
+        self._files: "OrderedDict[str, LiveFile]" = OrderedDict()
+
+    def start(self, download_id: str, streamable: bool = True) -> LiveFile:
+        live = self._files[download_id] = LiveFile(download_id, streamable)
+        self._files.move_to_end(download_id)
+        while len(self._files) > self.history_size:
+            self._files.popitem(last=False)
+        return live
+
+    def get(self, download_id: str) -> Optional[LiveFile]:
+        return self._files.get(download_id)
+
+    def on_progress(self, download_id: str, d: dict):
+        """在 yt-dlp 进度回调中调用，只更新几个属性"""
+        live = self._files.get(download_id)
+        if live is None:
+            return
+        filename = d.get('filename')
+        if filename != live.filename:
+            if live.filename is not None:
+                # 第二个流（例如合并前的音频）：最终文件要等合并完成
+                live.streamable = False
+            live.filename = filename
+            live.stream_done = False
+        if d.get('status') == 'downloading':
+            live.path = d.get('tmpfilename') or filename
+            live.total = d.get('total_bytes') or None
+            live.contiguous = d.get('contiguous_bytes')
+        elif d.get('status') == 'finished':
+            live.path = filename
+            live.total = d.get('total_bytes') or live.total
+            live.stream_done = True
+
+    def complete(self, download_id: str, path: str):
+        live = self._files.get(download_id) or self.start(download_id)
+        live.final_path = path
+        live.state = 'completed'
+
+    def fail(self, download_id: str, state: str = 'failed'):
+        """标记未完成的下载为失败/取消，已完成的不受影响"""
+        live = self._files.get(download_id)
+        if live is not None and live.state == 'downloading':
+            live.state = state
+
+
+def _headers(path: str, attachment: bool) -> dict:
+    name = os.path.basename(path)
+    disposition = 'attachment' if attachment else 'inline'
+    return {
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': f"{disposition}; filename*=UTF-8''{quote(name)}",
+        'Content-Type': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+    }
+
+
+class ZeroCopyFileResponse(Response):
+    """通过 ASGI 零拷贝扩展发送文件的一段，文件内容不经过 Python 缓冲区"""
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: dict):
+        super().__init__(status_code=status_code, headers={**headers, 'Content-Length': str(end - start)})
+        self.path = path
+        self.start = start
+        self.end = end
+
+    async def __call__(self, scope, receive, send):
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        if scope.get('method') == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        with open(self.path, 'rb') as f:
+            await send({'type': ZEROCOPY_EXTENSION, 'file': f, 'offset': self.start,
+                        'count': self.end - self.start, 'more_body': False})
+
+
+async def _iter_file(path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            chunk = await run_in_threadpool(f.read, min(CHUNK_SIZE, end - pos))
+            if not chunk:
+                return
+            pos += len(chunk)
+            yield chunk
+
+
+def file_response(path: str, range_header: Optional[str], scope: dict, attachment: bool = False) -> Response:
+    """已完成文件：支持 Range，服务器支持时零拷贝发送"""
+    size = os.path.getsize(path)
+    headers = _headers(path, attachment)
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+    status_code = 200
+    start, end = 0, size
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    if ZEROCOPY_EXTENSION in (scope.get('extensions') or {}):
+        return ZeroCopyFileResponse(path, start, end, status_code, headers)
+    # 服务器不支持零拷贝（如 uvicorn）时在线程池中按大块读取发送
+    headers['Content-Length'] = str(end - start)
+    return StreamingResponse(_iter_file(path, start, end), status_code=status_code, headers=headers)
+
+
+async def _tail(live: LiveFile, start: int, end: Optional[int]) -> AsyncIterator[bytes]:
+    """按写入进度发送下载中的文件，直到读到 end 或下载结束
+
+    下载失败、取消或文件比声明的长度短时抛出 DownloadInterrupted：服务器中止连接，
+    客户端不会把截断的内容当作完整的响应（包括按 chunked 发送的响应）。
+    """
+    pos = start
+    while end is None or pos < end:
+        available = live.available()
+        if end is not None:
+            available = min(available, end)
+        if pos < available:
+            chunk = await run_in_threadpool(live.read, pos, min(CHUNK_SIZE, available - pos))
+            if chunk:
+                pos += len(chunk)
+                yield chunk
+                continue
+        if live.state in ('failed', 'cancelled'):
+            raise DownloadInterrupted(f"下载已结束: {live.state}")
+        if live.finished and pos >= live.available():
+            if end is not None:
+                raise DownloadInterrupted(f"文件只有 {pos} 字节，少于 {end} 字节")
+            return
+        await asyncio.sleep(TAIL_POLL_INTERVAL)
+
+
+def tail_response(live: LiveFile, range_header: Optional[str], attachment: bool = False) -> Response:
+    """下载中的文件：数据写入磁盘后立即发送；总大小已知时支持 Range"""
+    headers = _headers(live.filename or live.download_id, attachment)
+    start, end = 0, None
+    status_code = 200
+    if live.total:
+        try:
+            byte_range = parse_range(range_header, live.total)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{live.total}'})
+        start, end = byte_range or (0, live.total)
+        if byte_range is not None:
+            status_code = 206
+            headers['Content-Range'] = f'bytes {start}-{end - 1}/{live.total}'
+        headers['Content-Length'] = str(end - start)
+    else:
+        # 总大小未知（例如分片直播流），只能从头按 chunked 方式发送
+        headers.pop('Accept-Ranges')
+    return StreamingResponse(_tail(live, start, end), status_code=status_code, headers=headers)
@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import humanize
+
+from containers import DEFAULT_CONTAINERS, audio_family, estimate_cost, family_plan, video_family
+
+
+class FormatRecord(NamedTuple):
+    """单个可选格式的紧凑记录，sort_key 在构建时预先计算"""
+    format_id: str
+    ext: str
+    filesize: int
+    tbr: float
+    vcodec: str
+    acodec: str
+    width: int
+    height: int
+    fps: float
+    quality_label: str
+    sort_key: Tuple[int, float, float]
+    # 下载后的容器；需要转码的组合附带转码的流和估算的 CPU 开销
+    container: str = ''
+    transcode: Optional[dict] = None
+
+    def to_dict(self) -> dict:
+        return {
+            'format_id': self.format_id,
+            'ext': self.ext,
+            'filesize': humanize.naturalsize(self.filesize),
+            'tbr': self.tbr,
+            'vcodec': self.vcodec,
+            'acodec': self.acodec,
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'quality_label': self.quality_label,
+            'container': self.container,
+            'transcode': self.transcode,
+        }
+
+
+def _quality_label(f: dict, height: int, fps: float) -> str:
+    if height:
+        label = f"{height}p"
+        if fps > 30:
+            label += f" {int(fps)}fps"
+        return label
+    return f.get('format_note') or 'N/A'
+
+
+def _audio_rank(f: dict) -> Tuple[float, int]:
+    return (float(f.get('tbr') or 0), int(f.get('filesize') or f.get('approximate_filesize') or 0))
+
+
+class FormatTable:
+    """对 info['formats'] 单次遍历得到的 combined / video / audio 三类格式
+
+    纯视频流与音频流组合时，优先选择可以直接复制（不转码）到靠前容器的音频，
+    同等条件下选码率最高的音频；无法直接复制的组合会标记需要转码的流和估算的 CPU 开销。
+    """
+
+    def __init__(self, formats: List[dict], containers: Sequence[str] = DEFAULT_CONTAINERS,
+                 duration: float = 0):
+        self.best_audio: Optional[dict] = None
+        self.combined: List[FormatRecord] = []
+        self.video: List[FormatRecord] = []
+        self.audio: List[FormatRecord] = []
+
+        best_audio_rank = None
+        # 音频编码族 -> (rank, 该编码族中最好的音频)
+        family_audio: Dict[Optional[str], Tuple[Tuple[float, int], dict]] = {}
+        video_only = []
+        for f in formats:
+            vcodec = f.get('vcodec') or 'none'
+            acodec = f.get('acodec') or 'none'
+            if vcodec == 'none' and acodec == 'none':
+                continue
+
+            if vcodec == 'none':
+                rank = _audio_rank(f)
+                if best_audio_rank is None or rank > best_audio_rank:
+                    self.best_audio, best_audio_rank = f, rank
+                family = audio_family(acodec)
+                if family not in family_audio or rank > family_audio[family][0]:
+                    family_audio[family] = (rank, f)
+
+            filesize = int(f.get('filesize') or f.get('approximate_filesize') or 0)
+            # 没有文件大小的格式（如直播/部分 HLS）不提供选择
+            if not filesize:
+                continue
+
+            height = int(f.get('height') or 0)
+            fps = float(f.get('fps') or 0)
+            tbr = float(f.get('tbr') or 0)
+            record = FormatRecord(
+                format_id=f['format_id'],
+                ext=f.get('ext') or 'N/A',
+                filesize=filesize,
+                tbr=tbr,
+                vcodec=vcodec,
+                acodec=acodec,
+                width=int(f.get('width') or 0),
+                height=height,
+                fps=fps,
+                quality_label=_quality_label(f, height, fps),
+                sort_key=(height, fps, tbr),
+                container=f.get('ext') or '',
+            )
+            if vcodec == 'none':
+                self.audio.append(record)
+            elif acodec == 'none':
+                video_only.append((record, f))
+            else:
+                self.combined.append(record)
+
+        # 纯视频流与音频组合，需要等遍历结束确定各编码族的最佳音频后再生成
+        containers = tuple(containers) or DEFAULT_CONTAINERS
+        candidates = list(family_audio.values())
+        # 视频编码族 -> (合并方案, 音频)，同一编码族的视频流选择相同的音频
+        pairs = {}
+        for record, f in video_only:
+            if candidates:
+                vfamily = video_family(record.vcodec)
+                if vfamily not in pairs:
+                    pairs[vfamily] = self._pair(vfamily, candidates, containers)
+                plan, audio = pairs[vfamily]
+                record = record._replace(
+                    format_id=f"{record.format_id}+{audio['format_id']}",
+                    acodec=audio.get('acodec') or 'none',
+                )
+                audio_size = int(audio.get('filesize') or audio.get('approximate_filesize') or 0)
+                self.combined.append(record._replace(
+                    filesize=record.filesize + audio_size,
+                    container=plan.container,
+                    transcode=estimate_cost(plan, f, duration).to_dict() if plan.transcode else None,
+                ))
+            self.video.append(record)
+
+        for bucket in (self.combined, self.video, self.audio):
+            bucket.sort(key=lambda r: r.sort_key, reverse=True)
+
+    @staticmethod
+    def _pair(vfamily, candidates, containers):
+        """为视频编码族选择音频：可直接复制的容器越靠前越好，其次转码越少越好，最后按音频码率"""
+        best = None
+        for rank, audio in candidates:
+            plan = family_plan(vfamily, audio_family(audio.get('acodec')), containers)
+            key = (containers.index(plan.container) if plan.stream_copy else len(containers),
+                   len(plan.transcode), tuple(-x for x in rank))
+            if best is None or key < best[0]:
+                best = (key, plan, audio)
+        return best[1], best[2]
+
+    def to_dict(self) -> Dict[str, List[dict]]:
+        return {
+            'combined': [r.to_dict() for r in self.combined],
+            'video': [r.to_dict() for r in self.video],
+            'audio': [r.to_dict() for r in self.audio],
+        }
+
+
+_MEMO_SIZE = 128
+_memo: "OrderedDict[tuple, tuple]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def format_table(info: dict, containers: Sequence[str] = DEFAULT_CONTAINERS) -> Dict[str, List[dict]]:
+    """返回 info 的格式表（JSON 结构），同一个 info 对象只计算一次"""
+    containers = tuple(containers)
+    key = (id(info), containers)
+    with _memo_lock:
+        entry = _memo.get(key)
+        # 保存 info 的强引用，保证 id 在缓存期间不会被复用
+        if entry is not None and entry[0] is info:
+            _memo.move_to_end(key)
+            return entry[1]
+    table = FormatTable(info.get('formats') or [], containers, info.get('duration') or 0).to_dict()
+    with _memo_lock:
+        _memo[key] = (info, table)
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return table
@@ -0,0 +1,91 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+# 任务结束事件，出现这些事件的任务在重启后不再恢复
+TERMINAL_EVENTS = ('completed', 'failed', 'cancelled')
+
+
+class JobJournal:
+    """只追加的任务日志（SQLite），用于进程重启后恢复未完成的下载
+
+    每个任务依次记录 submitted / started / progress / completed|failed|cancelled 事件，
+    progress 事件按 progress_interval 限频写入。启动时回放日志得到未完成的任务，
+    并删除已结束任务的记录以保持日志文件较小。
+    """
+
+    def __init__(self, path: str, progress_interval: float = 5.0):
+        self.path = path
+        self.progress_interval = progress_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._last_progress: Dict[str, float] = {}
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, download_id TEXT NOT NULL, "
+                "event TEXT NOT NULL, data TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS job_events_download_id ON job_events (download_id)"
+            )
+
+    def append(self, download_id: str, event: str, **data):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO job_events (download_id, event, data, ts) VALUES (?, ?, ?, ?)",
+                (download_id, event, json.dumps(data), time.time()),
+            )
+        if event in TERMINAL_EVENTS:
+            self._last_progress.pop(download_id, None)
+
+    def submitted(self, download_id: str, **job):
+        self.append(download_id, 'submitted', **job)
+
+    def progress(self, download_id: str, d: dict):
+        """在进度回调中调用，按时间间隔限频写入"""
+        now = time.monotonic()
+        if now - self._last_progress.get(download_id, 0.0) < self.progress_interval:
+            return
+        self._last_progress[download_id] = now
+        self.append(
+            download_id, 'progress',
+            filename=d.get('filename'),
+            downloaded_bytes=d.get('downloaded_bytes'),
+            total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+        )
+
+    def unfinished(self) -> List[dict]:
+        """回放日志，返回未结束任务的提交参数和最后一次进度"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT download_id, event, data FROM job_events ORDER BY seq"
+            ).fetchall()
+        jobs: Dict[str, dict] = {}
+        for download_id, event, data in rows:
+            data = json.loads(data)
+            if event == 'submitted':
+                jobs[download_id] = {'download_id': download_id, 'progress': None, **data}
+            elif event in TERMINAL_EVENTS:
+                jobs.pop(download_id, None)
+            elif event == 'progress' and download_id in jobs:
+                jobs[download_id]['progress'] = data
+        return list(jobs.values())
+
+    def compact(self):
+        """删除每个任务最后一次结束事件及之前的记录（同一 download_id 可能被再次提交）"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM job_events WHERE seq <= ("
+                "SELECT MAX(e.seq) FROM job_events e WHERE e.download_id = job_events.download_id "
+                "AND e.event IN (%s))" % ','.join('?' * len(TERMINAL_EVENTS)),
+                TERMINAL_EVENTS,
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
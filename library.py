@@ -0,0 +1,236 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+# 视为媒体文件的扩展名
+MEDIA_EXTENSIONS = frozenset((
+    'mp4', 'mkv', 'webm', 'mov', 'avi', 'flv', 'm4v', 'ts',
+    'm4a', 'mp3', 'opus', 'ogg', 'oga', 'flac', 'wav', 'aac',
+))
+
+# /videos 可用的排序字段
+SORT_COLUMNS = {
+    'added': 'added_at',
+    'mtime': 'mtime',
+    'title': 'title COLLATE NOCASE',
+    'size': 'size',
+    'duration': 'duration',
+}
+
+_COLUMNS = ('path', 'name', 'title', 'video_id', 'extractor', 'format_id', 'ext', 'size', 'mtime', 'duration', 'added_at')
+
+
+def _ext(name: str) -> str:
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+
+
+def _is_media(name: str) -> bool:
+    # 跳过 yt-dlp 的临时文件（.part、.ytdl、.temp.mp4 等）
+    return _ext(name) in MEDIA_EXTENSIONS and '.part' not in name and '.temp.' not in name
+
+
+def _like_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class LibraryIndex:
+    """下载目录中媒体文件的索引，保存在 SQLite 中
+
+    - 下载完成时由 record() 登记标题、视频ID、格式、时长等信息
+    - scan() 增量扫描：对已知目录只做一次 stat，修改时间变化的目录才重新列出，
+      新出现的子目录再递归扫描；直接在原处改写文件（目录修改时间不变）不会被发现
+    - 只有下载根目录下的子目录会递归扫描，根目录之外的保存路径只跟踪这一层
+    """
+
+    def __init__(self, path: str, roots: Iterable[str] = ()):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # 同一时刻只运行一次扫描
+        self._scan_lock = threading.Lock()
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.last_scan: Optional[dict] = None
+        with self._lock, self._conn:
+            # 扫描时每个目录一个事务，WAL 模式下提交不必每次都同步到磁盘
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "path TEXT PRIMARY KEY, dir TEXT NOT NULL, name TEXT NOT NULL, title TEXT NOT NULL, "
+                "video_id TEXT, extractor TEXT, format_id TEXT, ext TEXT NOT NULL, "
+                "size INTEGER NOT NULL, mtime REAL NOT NULL, duration REAL, added_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER NOT NULL, recursive INTEGER NOT NULL)"
+            )
+            for column in ('dir', 'mtime', 'added_at', 'size', 'title COLLATE NOCASE'):
+                name = column.split()[0]
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS items_{name} ON items ({column})")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)")
+
+    def add_root(self, root: str):
+        root = os.path.abspath(root)
+        if root not in self.roots:
+            self.roots.append(root)
+
+    def _under_root(self, path: str) -> bool:
+        return any(path == r or path.startswith(r.rstrip(os.sep) + os.sep) for r in self.roots)
+
+    def record(self, path: str, info: Optional[dict] = None, format_id: Optional[str] = None):
+        """登记下载完成的文件和它的元数据"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        info = info or {}
+        name = os.path.basename(path)
+        row = (
+            path, os.path.dirname(path), name, info.get('title') or os.path.splitext(name)[0],
+            info.get('id'), info.get('extractor_key') or info.get('extractor'), format_id,
+            _ext(name), st.st_size, st.st_mtime, info.get('duration'), time.time(),
+        )
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO items (path, dir, name, title, video_id, extractor, format_id, ext, size, mtime, duration, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET title = excluded.title, video_id = excluded.video_id, "
+                "extractor = excluded.extractor, format_id = excluded.format_id, size = excluded.size, "
+                "mtime = excluded.mtime, duration = excluded.duration",
+                row,
+            )
+            # 保存路径之前没有跟踪过：登记这一层目录，之后的扫描能发现文件被删除；
+            # 修改时间记为 0，下次扫描时把目录中已有的其他文件也补进来
+            self._conn.execute(
+                "INSERT OR IGNORE INTO dirs VALUES (?, NULL, 0, ?)",
+                (row[1], int(self._under_root(row[1]))),
+            )
+
+    def scan(self) -> dict:
+        """增量扫描所有根目录和已跟踪的目录（阻塞，应在线程池中调用）"""
+        if not self._scan_lock.acquire(blocking=False):
+            return self.last_scan or {}
+        try:
+            started = time.monotonic()
+            stats = {'dirs_checked': 0, 'dirs_scanned': 0, 'added': 0, 'updated': 0, 'removed': 0}
+            with self._lock:
+                known = dict(self._conn.execute("SELECT path, mtime_ns FROM dirs").fetchall())
+            for root in self.roots:
+                if root not in known:
+                    known[root] = None
+            for path, mtime_ns in list(known.items()):
+                stats['dirs_checked'] += 1
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    self._forget_dir(path, stats)
+                    continue
+                if st.st_mtime_ns != mtime_ns:
+                    self._scan_dir(path, st.st_mtime_ns, known, stats)
+            stats['seconds'] = round(time.monotonic() - started, 3)
+            stats['finished_at'] = time.time()
+            self.last_scan = stats
+            return stats
+        finally:
+            self._scan_lock.release()
+
+    def _scan_dir(self, path: str, mtime_ns: int, known: dict, stats: dict):
+        """重新列出一个目录：登记新文件、更新变化的文件、删除消失的文件和子目录"""
+        stats['dirs_scanned'] += 1
+        recursive = self._under_root(path)
+        files = {}
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif _is_media(entry.name) and entry.is_file():
+                            st = entry.stat()
+                            files[os.path.abspath(entry.path)] = (entry.name, st.st_size, st.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            self._forget_dir(path, stats)
+            return
+        with self._lock, self._conn:
+            existing = {
+                p: (size, mtime) for p, size, mtime in
+                self._conn.execute("SELECT path, size, mtime FROM items WHERE dir = ?", (path,))
+            }
+            gone = [(p,) for p in existing if p not in files]
+            if gone:
+                self._conn.executemany("DELETE FROM items WHERE path = ?", gone)
+                stats['removed'] += len(gone)
+            for p, (name, size, mtime) in files.items():
+                old = existing.get(p)
+                if old is None:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO items (path, dir, name, title, ext, size, mtime, added_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (p, path, name, os.path.splitext(name)[0], _ext(name), size, mtime, mtime),
+                    )
+                    stats['added'] += 1
+                elif old != (size, mtime):
+                    self._conn.execute("UPDATE items SET size = ?, mtime = ? WHERE path = ?", (size, mtime, p))
+                    stats['updated'] += 1
+            parent = os.path.dirname(path) if path not in self.roots else None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", (path, parent, mtime_ns, int(recursive))
+            )
+            children = [c for (c,) in self._conn.execute("SELECT path FROM dirs WHERE parent = ?", (path,))]
+        current = {os.path.abspath(d) for d in subdirs}
+        for child in children:
+            if child not in current:
+                self._forget_dir(child, stats)
+        if not recursive:
+            return
+        for child in current:
+            if child in known:
+                # 已知的子目录在 scan() 的循环中单独检查
+                continue
+            known[child] = None
+            try:
+                st = os.stat(child)
+            except OSError:
+                continue
+            self._scan_dir(child, st.st_mtime_ns, known, stats)
+
+    def _forget_dir(self, path: str, stats: dict):
+        """目录已不存在：删除它和所有子目录的记录"""
+        prefix = _like_escape(path.rstrip(os.sep) + os.sep) + '%'
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM items WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (path, prefix)
+            )
+            stats['removed'] += cur.rowcount
+            self._conn.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (path, prefix))
+
+    def query(self, search: str = '', sort: str = 'added', descending: bool = True,
+              offset: int = 0, limit: int = 50) -> Tuple[int, List[dict]]:
+        """分页查询，返回 (总数, 当前页)；search 匹配标题、文件名和视频ID"""
+        order = SORT_COLUMNS.get(sort)
+        if order is None:
+            raise ValueError(f"不支持的排序字段: {sort}")
+        where, params = '', []
+        if search:
+            pattern = '%' + _like_escape(search) + '%'
+            where = "WHERE title LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\' OR video_id = ?"
+            params = [pattern, pattern, search]
+        direction = 'DESC' if descending else 'ASC'
+        with self._lock:
+            (total,) = self._conn.execute(f"SELECT COUNT(*) FROM items {where}", params).fetchone()
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM items {where} ORDER BY {order} {direction}, path LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return total, [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM items").fetchone()
+            (dirs,) = self._conn.execute("SELECT COUNT(*) FROM dirs").fetchone()
+        return {'roots': self.roots, 'items': count, 'total_bytes': total, 'dirs': dirs, 'last_scan': self.last_scan}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,195 @@
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+# 当前处理的下载任务，日志记录自动带上 download_id（在 download_task 中设置，线程池中需要 copy_context 传递）
+download_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('download_id', default=None)
+
+# 所有组件的日志都在 ytd 之下，例如 ytd.download、ytd.ws，按组件单独设置级别
+ROOT_LOGGER = 'ytd'
+
+# LogRecord 自带的属性，其余属性（extra 传入的字段）原样写入 JSON
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'download_id', 'color_message'}
+
+
+def get_logger(component: str) -> logging.Logger:
+    return logging.getLogger(f'{ROOT_LOGGER}.{component}')
+
+
+class _ContextFilter(logging.Filter):
+    """在调用日志的线程中取出 download_id（格式化在后台线程中进行，那时已经拿不到上下文）"""
+
+    def filter(self, record):
+        if getattr(record, 'download_id', None) is None:
+            record.download_id = download_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON：ts、level、component、msg、download_id 以及 extra 字段"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'component': record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + '.') else record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'download_id', None) is not None:
+            entry['download_id'] = record.download_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """开发时使用的单行文本格式"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, 'download_id', None) is not None:
+            line += f' download_id={record.download_id}'
+        extra = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and not k.startswith('_')}
+        if extra:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in extra.items())
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """有界队列，队列满时丢弃日志并计数，调用方（事件循环、下载线程）从不等待输出"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 只在调用线程中合并参数和格式化异常堆栈，JSON 编码和写出交给后台线程
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSampler:
+    """按 key 限频：每个 key 每 interval 秒最多放行一条，返回期间被跳过的条数（未放行时为 None）"""
+
+    def __init__(self, interval: float = 5.0, max_keys: int = 4096):
+        self.interval = interval
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> [上次放行的时间, 之后被跳过的条数]
+        self._state: Dict[object, list] = {}
+
+    def allow(self, key) -> Optional[int]:
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                if len(self._state) >= self.max_keys:
+                    self._state.clear()
+                self._state[key] = [now, 0]
+                return 0
+            if now - state[0] < self.interval:
+                state[1] += 1
+                return None
+            suppressed = state[1]
+            state[0], state[1] = now, 0
+            return suppressed
+
+    def forget(self, key):
+        with self._lock:
+            self._state.pop(key, None)
+
+
+class YtDlpLogger:
+    """yt-dlp 的 logger 参数：把它的屏幕输出和警告写入结构化日志"""
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def debug(self, msg):
+        self.logger.debug(msg)
+
+    def info(self, msg):
+        self.logger.info(msg)
+
+    def warning(self, msg):
+        self.logger.warning(msg)
+
+    def error(self, msg):
+        self.logger.error(msg)
+
+    def __repr__(self):
+        # 作为 YoutubeDL 参数的一部分参与实例池的分组，所有实例共用同一个 logger
+        return f'YtDlpLogger({self.logger.name})'
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """解析 "download=DEBUG,ws=WARNING" 形式的组件级别"""
+    levels = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        component, level = (s.strip() for s in item.split('=', 1))
+        levels[component] = logging.getLevelName(level.upper())
+        if not isinstance(levels[component], int):
+            raise ValueError(f"无效的日志级别: {item}")
+    return levels
+
+
+class LogPipeline:
+    """日志经有界队列交给后台线程写出（JSON lines 或文本）"""
+
+    def __init__(self, level: str = 'INFO', levels: str = '', fmt: str = 'json', queue_size: int = 10000,
+                 stream=None, capture=('uvicorn.error', 'uvicorn.access')):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = _QueueHandler(self.queue)
+        self.handler.addFilter(_ContextFilter())
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, output)
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(logging.getLevelName(level.upper()))
+        # uvicorn 的服务日志和访问日志也经过同一个队列写出
+        for logger in (root, *(logging.getLogger(name) for name in capture)):
+            logger.handlers[:] = [self.handler]
+            logger.propagate = False
+        for component, component_level in parse_levels(levels).items():
+            name = component if component in capture else f'{ROOT_LOGGER}.{component}'
+            logging.getLogger(name).setLevel(component_level)
+
+    def start(self):
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """写出队列中剩余的日志"""
+        try:
+            self.listener.stop()
+        except AttributeError:
+            # 已经停止
+            pass
+
+    def stats(self) -> dict:
+        return {'queued': self.queue.qsize(), 'dropped': self.handler.dropped}
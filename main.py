@@ -1,26 +1,59 @@
-from fastapi import FastAPI, Request, HTTPException, WebSocket
+from fastapi import Depends, FastAPI, Request, HTTPException, WebSocket
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import yt_dlp
 import os
 import asyncio
 from datetime import timedelta
-import humanize
 import json
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from tkinter import filedialog
-import tkinter as tk
 import subprocess
 import platform
-from typing import List
 from concurrent.futures import ThreadPoolExecutor
-import functools
 import time
+import copy
+import atexit
+import contextvars
+import hashlib
+from urllib.parse import urlparse
+from admission import AdmissionController, AdmissionRejected
+from bandwidth import BandwidthController
+from containers import DEFAULT_CONTAINERS, plan_for_selection
+from extraction import Extractor
+from file_server import FileRegistry, file_response, tail_response
+from format_table import format_table
+from job_journal import JobJournal
+from library import SORT_COLUMNS, LibraryIndex
+from logs import LogPipeline, LogSampler, YtDlpLogger, download_id_var, get_logger
+from media_archive import MediaArchive
+from metrics import LAG_BUCKETS, EventLoopMonitor, MetricsRegistry
+from metadata_cache import MetadataCache, SqliteCacheBackend, cache_key, is_expired
+from playlist_ingest import DONE as PLAYLIST_DONE, ERROR as PLAYLIST_ERROR, FORMAT_POLICIES, PlaylistIngestor
+from postprocess_pipeline import PipelinedYoutubeDL, PostProcessPipeline, ffmpeg_capabilities
+from progress_bus import ProgressBus
+from resilience import RetryPolicy, UpstreamGuard, UpstreamUnavailable
+from scheduler import POSTPROCESSING, PRIORITIES, JobScheduler, RetryJob
+from shared_state import LocalStateBackend, SqliteStateBackend
+from ydl_pool import YoutubeDLPool
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# 日志：经有界队列在后台线程中写出（默认 JSON lines），可以按组件设置级别，例如 YTD_LOG_LEVELS=download=DEBUG,ws=WARNING
+LOG_LEVEL = os.environ.get("YTD_LOG_LEVEL", "INFO")
+log_pipeline = LogPipeline(
+    level=LOG_LEVEL,
+    levels=os.environ.get("YTD_LOG_LEVELS", ""),
+    fmt=os.environ.get("YTD_LOG_FORMAT", "json"),
+).start()
+atexit.register(log_pipeline.stop)
+logger = get_logger('app')
+download_log = get_logger('download')
+extract_log = get_logger('extract')
+ws_log = get_logger('ws')
+# yt-dlp 的屏幕输出为 debug 级别，警告和错误按原级别记录
+ydl_logger = YtDlpLogger(get_logger('yt_dlp'))
+# 下载进度每个任务每隔几秒最多记录一条
+progress_sampler = LogSampler(interval=float(os.environ.get("YTD_LOG_PROGRESS_INTERVAL", 5)))
 
 app = FastAPI()
 
@@ -41,9 +74,6 @@ templates = Jinja2Templates(directory="templates")
 DOWNLOAD_DIR = "downloads"
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-# 存储视频信息的列表
-videos = []
-
 # 存储WebSocket连接
 active_connections = []
 
@@ -52,41 +82,178 @@ DEFAULT_DOWNLOAD_PATHS = [
     DOWNLOAD_DIR
 ]
 
-# 创建线程池
-thread_pool = ThreadPoolExecutor(max_workers=4)
+# 下载库索引：登记下载完成的文件，并定期增量扫描下载目录（只重新列出修改时间变化的目录）
+LIBRARY_DB = os.environ.get("YTD_LIBRARY_DB", "library.db")
+LIBRARY_ROOTS = DEFAULT_DOWNLOAD_PATHS + [p for p in os.environ.get("YTD_LIBRARY_ROOTS", "").split(os.pathsep) if p]
+LIBRARY_SCAN_INTERVAL = float(os.environ.get("YTD_LIBRARY_SCAN_INTERVAL", 60))
+LIBRARY_MAX_PAGE_SIZE = 500
+library = LibraryIndex(LIBRARY_DB, LIBRARY_ROOTS)
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections = []
-        self._lock = asyncio.Lock()
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        async with self._lock:
-            self.active_connections.append(websocket)
-            print(f"New WebSocket connection. Total: {len(self.active_connections)}")
-    
-    async def disconnect(self, websocket: WebSocket):
-        async with self._lock:
-            if websocket in self.active_connections:
-                self.active_connections.remove(websocket)
-                print(f"WebSocket disconnected. Total: {len(self.active_connections)}")
-    
-    async def broadcast(self, message: str):
-        if not self.active_connections:
-            print("No active WebSocket connections")
-            return
-            
-        print(f"Broadcasting to {len(self.active_connections)} connections")
-        async with self._lock:
-            for connection in self.active_connections:
-                try:
-                    await connection.send_text(message)
-                except Exception as e:
-                    print(f"Error sending message: {e}")
-                    await self.disconnect(connection)
+# 上游故障处理：永久不可用的URL（私享、已删除、地区限制等）在负缓存中保留一段时间；
+# 同一上游主机连续失败（限流、超时等）后熔断，冷却期间信息接口直接返回 503，下载任务留在队列中等待
+NEGATIVE_CACHE_TTL = float(os.environ.get("YTD_NEGATIVE_CACHE_TTL", 600))
+BREAKER_THRESHOLD = int(os.environ.get("YTD_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.environ.get("YTD_BREAKER_COOLDOWN", 30))
+BREAKER_MAX_COOLDOWN = float(os.environ.get("YTD_BREAKER_MAX_COOLDOWN", 600))
+upstream = UpstreamGuard(negative_ttl=NEGATIVE_CACHE_TTL, threshold=BREAKER_THRESHOLD,
+                         cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN)
+
+# 下载任务失败后的重试：指数退避加随机抖动，限流错误退避更长，永久错误不重试
+RETRY_ATTEMPTS = int(os.environ.get("YTD_RETRY_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.environ.get("YTD_RETRY_BASE_DELAY", 5))
+RETRY_MAX_DELAY = float(os.environ.get("YTD_RETRY_MAX_DELAY", 300))
+retry_policy = RetryPolicy(max_retries=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY)
+
+# 下载任务调度：全局并发数和单个上游主机的并发数（0 表示不单独限制）
+MAX_DOWNLOADS = int(os.environ.get("YTD_MAX_DOWNLOADS", 4))
+MAX_DOWNLOADS_PER_HOST = int(os.environ.get("YTD_MAX_DOWNLOADS_PER_HOST", 0))
+scheduler = JobScheduler(max_concurrent=MAX_DOWNLOADS, per_host_limit=MAX_DOWNLOADS_PER_HOST,
+                         host_gate=upstream.host_wait)
+
+# 任务日志：进程重启（包括 reload）后恢复未完成的下载
+JOB_JOURNAL_PATH = os.environ.get("YTD_JOB_JOURNAL", "jobs.db")
+journal = JobJournal(JOB_JOURNAL_PATH)
+
+# 单个下载的最大连接数：渐进式流按字节范围、DASH/HLS 按分片并行下载（1 表示单连接）
+DOWNLOAD_CONNECTIONS = int(os.environ.get("YTD_DOWNLOAD_CONNECTIONS", 4))
+
+# 后处理（ffmpeg 合并）线程池，默认与 CPU 核数相同；下载线程下载完成后即可开始下一个下载
+POSTPROCESS_WORKERS = int(os.environ.get("YTD_POSTPROCESS_WORKERS", 0)) or os.cpu_count() or 1
+postprocess_pipeline = PostProcessPipeline(max_workers=POSTPROCESS_WORKERS)
+
+# 合并视频和音频时可用的输出容器，按优先级排列；无法直接复制到任何容器的组合会转码到第一个容器
+MERGE_CONTAINERS = tuple(
+    c for c in os.environ.get("YTD_MERGE_CONTAINERS", "/".join(DEFAULT_CONTAINERS)).split("/") if c
+)
+
+# 已下载媒体的索引：同一视频和格式再次下载时直接硬链接/复制已有文件（设为空字符串关闭）
+MEDIA_ARCHIVE_DB = os.environ.get("YTD_MEDIA_ARCHIVE", "archive.db")
+# 复用前是否核对文件的 sha256（需要读取整个文件），关闭后只比较大小和修改时间
+MEDIA_ARCHIVE_VERIFY = os.environ.get("YTD_ARCHIVE_VERIFY", "1") != "0"
+archive = MediaArchive(MEDIA_ARCHIVE_DB, verify=MEDIA_ARCHIVE_VERIFY) if MEDIA_ARCHIVE_DB else None
+
+# 下载线程池只运行下载任务，大小与调度器的并发数一致；视频信息提取使用独立的线程池
+download_pool = ThreadPoolExecutor(max_workers=MAX_DOWNLOADS, thread_name_prefix="download")
 
-manager = ConnectionManager()
+# 视频信息缓存，/video-info、/info 和 /download 共用
+METADATA_CACHE_SIZE = int(os.environ.get("YTD_METADATA_CACHE_SIZE", 256))
+METADATA_CACHE_TTL = float(os.environ.get("YTD_METADATA_CACHE_TTL", 1800))
+METADATA_CACHE_DB = os.environ.get("YTD_METADATA_CACHE_DB", "")
+metadata_cache = MetadataCache(
+    max_entries=METADATA_CACHE_SIZE,
+    ttl=METADATA_CACHE_TTL,
+    backend=SqliteCacheBackend(METADATA_CACHE_DB) if METADATA_CACHE_DB else None,
+)
+
+# 各接口共用的提取参数，保证同一视频在不同接口间命中同一条缓存
+BASE_EXTRACT_OPTS = {
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    },
+    'socket_timeout': 30,
+    'retries': 3,
+    'logger': ydl_logger,
+}
+# 只加载允许的提取器（逗号分隔的正则，例如 youtube.*,generic），可以明显减少每次创建 YoutubeDL 的开销
+ALLOWED_EXTRACTORS = [e.strip() for e in os.environ.get("YTD_ALLOWED_EXTRACTORS", "").split(",") if e.strip()]
+if ALLOWED_EXTRACTORS:
+    BASE_EXTRACT_OPTS['allowed_extractors'] = ALLOWED_EXTRACTORS
+
+# 复用 YoutubeDL 实例（按参数组合），省去重复初始化并复用到同一主机的 HTTP 连接
+YDL_POOL_IDLE = int(os.environ.get("YTD_YDL_POOL_IDLE", 4))
+YDL_POOL_MAX_USES = int(os.environ.get("YTD_YDL_POOL_MAX_USES", 100))
+ydl_pool = YoutubeDLPool(max_idle=YDL_POOL_IDLE, max_uses=YDL_POOL_MAX_USES)
+
+# 视频信息提取使用独立的线程池，并合并同一URL的并发请求
+EXTRACT_WORKERS = int(os.environ.get("YTD_EXTRACT_WORKERS", 4))
+extractor = Extractor(max_workers=EXTRACT_WORKERS, cache=metadata_cache, pool=ydl_pool, guard=upstream)
+
+# 提取类接口（/video-info、/batch-video-info、/info、/download、/playlist-ingest）的准入控制：
+# 全局并发上限 + 有界等待队列，每个客户端（API key 或 IP）一个令牌桶；超出时返回 429 和 Retry-After
+MAX_EXTRACTIONS = int(os.environ.get("YTD_MAX_EXTRACTIONS", EXTRACT_WORKERS * 2))
+EXTRACTION_QUEUE = int(os.environ.get("YTD_EXTRACTION_QUEUE", 64))
+EXTRACTION_QUEUE_TIMEOUT = float(os.environ.get("YTD_EXTRACTION_QUEUE_TIMEOUT", 10))
+CLIENT_RATE = float(os.environ.get("YTD_CLIENT_RATE", 2))
+CLIENT_BURST = float(os.environ.get("YTD_CLIENT_BURST", 20))
+# 可信的 API key（逗号分隔）；请求头 X-API-Key 是其中之一时按 key 限流，否则按客户端 IP 限流
+API_KEYS = frozenset(k.strip() for k in os.environ.get("YTD_API_KEYS", "").split(",") if k.strip())
+admission = AdmissionController(
+    max_concurrent=MAX_EXTRACTIONS, max_queue=EXTRACTION_QUEUE, queue_timeout=EXTRACTION_QUEUE_TIMEOUT,
+    rate=CLIENT_RATE, burst=CLIENT_BURST,
+)
+
+def admission_client(request: Request) -> str:
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in API_KEYS:
+        # 统计和日志中只出现 key 的摘要
+        return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return 'ip:' + (request.client.host if request.client else 'anonymous')
+
+def too_many_requests(e: AdmissionRejected) -> HTTPException:
+    messages = {
+        'rate_limited': "请求过于频繁，请稍后重试",
+        'queue_full': "服务器繁忙，请稍后重试",
+        'queue_timeout': "等待处理超时，请稍后重试",
+    }
+    return HTTPException(status_code=429, detail=messages[e.reason], headers={'Retry-After': str(e.retry_after)})
+
+async def extraction_slot(request: Request):
+    """接口依赖：在处理请求期间占用一个提取名额（在接口自身的异常处理之外，429 不会被改写）"""
+    client = admission_client(request)
+    try:
+        async with admission.slot(client):
+            yield
+    except AdmissionRejected as e:
+        logger.info("拒绝提取请求", extra={'client': client, 'reason': e.reason, 'path': request.url.path})
+        raise too_many_requests(e)
+
+# Prometheus 指标（/metrics）；热路径上只更新计数，其余统计在抓取时读取
+metrics = MetricsRegistry()
+EXTRACTION_SECONDS = metrics.histogram(
+    'ytd_extraction_seconds', '视频信息提取耗时（含缓存命中）', ['endpoint'])
+EXTRACTION_ERRORS = metrics.counter(
+    'ytd_extraction_errors_total', '视频信息提取失败次数', ['endpoint'])
+WS_SEND_SECONDS = metrics.histogram(
+    'ytd_websocket_send_seconds', 'WebSocket 消息从入队到发送完成的耗时')
+LOOP_LAG_SECONDS = metrics.histogram(
+    'ytd_event_loop_lag_seconds', '事件循环调度延迟', buckets=LAG_BUCKETS)
+loop_monitor = EventLoopMonitor(LOOP_LAG_SECONDS)
+
+# 多进程部署（uvicorn --workers N）时各进程通过这个 SQLite 文件共享任务归属、控制命令和进度事件（设为空字符串表示只运行单个进程）
+STATE_DB = os.environ.get("YTD_STATE_DB", "state.db")
+STATE_POLL_INTERVAL = float(os.environ.get("YTD_STATE_POLL_INTERVAL", 0.1))
+state = SqliteStateBackend(STATE_DB, poll_interval=STATE_POLL_INTERVAL) if STATE_DB else LocalStateBackend()
+
+# WebSocket 进度推送：同一下载的进度按频率合并，慢连接会被断开
+PROGRESS_MAX_RATE = float(os.environ.get("YTD_PROGRESS_MAX_RATE", 4))
+WS_QUEUE_SIZE = int(os.environ.get("YTD_WS_QUEUE_SIZE", 100))
+manager = ProgressBus(max_rate=PROGRESS_MAX_RATE, queue_size=WS_QUEUE_SIZE, on_send=WS_SEND_SECONDS.observe,
+                      relay=state.publish if state.shared else None)
+
+# 带宽控制：暂停/恢复、全局限速（字节/秒，0 表示不限速）和单任务限速
+GLOBAL_RATE_LIMIT = float(os.environ.get("YTD_GLOBAL_RATE_LIMIT", 0))
+bandwidth = BandwidthController(global_rate=GLOBAL_RATE_LIMIT)
+
+# 播放列表/频道导入：每个导入最多有多少个条目在下载队列中排队，超过时暂停枚举
+PLAYLIST_WINDOW = int(os.environ.get("YTD_PLAYLIST_WINDOW", 100))
+playlist_ingestor = PlaylistIngestor(scheduler, manager.publish, BASE_EXTRACT_OPTS, window=PLAYLIST_WINDOW,
+                                     pool=ydl_pool)
+
+# 信息接口遇到播放列表时只平铺提取第一条，用于识别并提示使用 /playlist-ingest
+PLAYLIST_PROBE_OPTS = {'extract_flat': 'in_playlist', 'playlistend': 1}
+
+def upstream_unavailable(e: UpstreamUnavailable) -> HTTPException:
+    if e.reason == 'circuit_open':
+        return HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    # 负缓存命中：与第一次失败时相同的错误
+    return HTTPException(status_code=400, detail=f"Failed to extract video info: {e}")
+
+def reject_playlist(info):
+    if info.get('_type') in ('playlist', 'multi_video'):
+        raise HTTPException(status_code=400, detail="该链接是播放列表或频道，请使用 /playlist-ingest 导入")
+
+# 下载任务的文件状态，供 /files 边下边读和 Range 下载
+files = FileRegistry()
 
 # 添加下载状态管理
 class DownloadManager:
@@ -94,44 +261,49 @@ class DownloadManager:
         self._downloads = {}
         self._lock = asyncio.Lock()
     
-    async def add_download(self, download_id, task):
+    async def add_download(self, download_id, job):
         async with self._lock:
-            print(f"Adding download task: {download_id}")
+            download_log.debug("添加下载任务", extra={'download_id': download_id})
             self._downloads[download_id] = {
-                'task': task,
-                'paused': False,
-                'pause_event': asyncio.Event()
+                'job': job,
+                'paused': False
             }
-            self._downloads[download_id]['pause_event'].set()
+            state.register(download_id)
     
     async def pause_download(self, download_id):
         async with self._lock:
             if download_id in self._downloads:
-                print(f"Pausing download: {download_id}")
+                download_log.info("暂停下载", extra={'download_id': download_id})
                 self._downloads[download_id]['paused'] = True
-                self._downloads[download_id]['pause_event'].clear()
-                await manager.broadcast(json.dumps({
+                # 下载线程会在下一次进度回调时阻塞，停止读取数据
+                bandwidth.pause(download_id)
+                manager.publish({
                     'status': 'paused',
                     'download_id': download_id
-                }))
+                })
                 return True
-            print(f"Download not found for pausing: {download_id}")
+            download_log.debug("要暂停的下载不在本进程中", extra={'download_id': download_id})
             return False
     
     async def resume_download(self, download_id):
         async with self._lock:
             if download_id in self._downloads:
-                print(f"Resuming download: {download_id}")
+                download_log.info("恢复下载", extra={'download_id': download_id})
                 self._downloads[download_id]['paused'] = False
-                self._downloads[download_id]['pause_event'].set()
-                await manager.broadcast(json.dumps({
+                bandwidth.resume(download_id)
+                manager.publish({
                     'status': 'resumed',
                     'download_id': download_id
-                }))
+                })
                 return True
-            print(f"Download not found for resuming: {download_id}")
+            download_log.debug("要恢复的下载不在本进程中", extra={'download_id': download_id})
             return False
     
+    async def remove_download(self, download_id):
+        async with self._lock:
+            self._downloads.pop(download_id, None)
+            state.unregister(download_id)
+    
     async def get_download_status(self, download_id):
         async with self._lock:
             if download_id in self._downloads:
@@ -140,28 +312,71 @@ class DownloadManager:
 
 download_manager = DownloadManager()
 
+@app.on_event("startup")
+async def start_progress_bus():
+    await manager.start()
+    state.start(asyncio.get_running_loop(), manager.deliver, handle_command)
+    loop_monitor.start()
+    asyncio.create_task(warm_up())
+    asyncio.create_task(scan_library())
+    await recover_downloads()
+
+@app.on_event("shutdown")
+async def shutdown_executors():
+    await scheduler.stop()
+    await manager.stop()
+    state.close()
+    loop_monitor.stop()
+    extractor.shutdown()
+    download_pool.shutdown(wait=False, cancel_futures=True)
+    postprocess_pipeline.shutdown()
+    playlist_ingestor.shutdown()
+    ydl_pool.close()
+    journal.close()
+    library.close()
+    if archive is not None:
+        archive.close()
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    print("New WebSocket connection request")
     await manager.connect(websocket)
+    # 也支持在连接地址中直接订阅: /ws?download_id=xxx
+    initial = websocket.query_params.getlist('download_id')
+    if initial:
+        manager.subscribe(websocket, initial)
     try:
         while True:
             data = await websocket.receive_text()
-            print(f"Received WebSocket message: {data}")
+            ws_log.debug("收到 WebSocket 消息", extra={'data': data})
+            # 订阅消息: {"action": "subscribe" | "unsubscribe", "download_ids": [...]}
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            if not isinstance(message, dict):
+                continue
+            download_ids = message.get('download_ids') or [message.get('download_id')]
+            if not isinstance(download_ids, list):
+                continue
+            download_ids = [d for d in download_ids if isinstance(d, str) and d]
+            if message.get('action') == 'subscribe':
+                manager.subscribe(websocket, download_ids)
+            elif message.get('action') == 'unsubscribe':
+                manager.unsubscribe(websocket, download_ids)
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        ws_log.debug("WebSocket 连接结束", extra={'error': str(e)})
     finally:
         await manager.disconnect(websocket)
 
 @app.get("/")
 async def home(request: Request):
-    logger.info("Accessing home page")
     try:
+        # 最近添加的 50 个文件
+        _, videos = await asyncio.get_running_loop().run_in_executor(None, library.query)
         response = templates.TemplateResponse("index.html", {"request": request, "videos": videos})
-        logger.info("Template rendered successfully")
         return response
     except Exception as e:
-        logger.error(f"Error rendering template: {str(e)}")
+        logger.exception("渲染首页失败")
         raise
 
 @app.get("/download-paths")
@@ -173,133 +388,108 @@ async def get_download_paths():
             paths.append(path)
     return {"paths": paths}
 
-@app.get("/video-info")
+VIDEO_INFO_OPTS = {
+    **BASE_EXTRACT_OPTS,
+    **PLAYLIST_PROBE_OPTS,
+    'quiet': True,
+    'no_warnings': True,
+    'format': 'bestvideo+bestaudio/best',
+}
+
+# 批量查询视频信息：单个请求内同时解析的URL数（实际并发还受提取线程池限制）和URL数上限
+BATCH_INFO_CONCURRENCY = int(os.environ.get("YTD_BATCH_INFO_CONCURRENCY", EXTRACT_WORKERS))
+BATCH_INFO_MAX_URLS = int(os.environ.get("YTD_BATCH_INFO_MAX_URLS", 1000))
+
+async def resolve_video_info(url, endpoint='video_info'):
+    """解析单个URL的视频信息和格式表，失败时抛出 HTTPException"""
+    try:
+        with EXTRACTION_SECONDS.time(endpoint):
+            info = await extractor.extract_info(url, VIDEO_INFO_OPTS)
+        if not info:
+            raise HTTPException(status_code=400, detail="No video information found")
+        reject_playlist(info)
+        
+        extract_log.debug("获取视频信息成功", extra={'url': url, 'title': info.get('title')})
+        
+        formats = format_table(info, MERGE_CONTAINERS)
+
+        return {
+            'title': info.get('title', 'Unknown Title'),
+            'duration': str(timedelta(seconds=int(info.get('duration', 0) or 0))),
+            'thumbnail': info.get('thumbnail', ''),
+            'description': info.get('description', ''),
+            'formats': formats
+        }
+        
+    except HTTPException:
+        raise
+    except UpstreamUnavailable as e:
+        raise upstream_unavailable(e)
+    except yt_dlp.utils.DownloadError as e:
+        EXTRACTION_ERRORS.inc(endpoint)
+        extract_log.info("获取视频信息失败", extra={'url': url, 'error': str(e)})
+        raise HTTPException(status_code=400, detail=f"Failed to extract video info: {str(e)}")
+    except Exception as e:
+        EXTRACTION_ERRORS.inc(endpoint)
+        extract_log.exception("获取视频信息出错", extra={'url': url})
+        raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+
+@app.get("/video-info", dependencies=[Depends(extraction_slot)])
 async def get_video_info(url: str):
-    print(f"\n=== Video Info Request ===")
-    print(f"Requested URL: {url}")
-    
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
     
+    return await resolve_video_info(url)
+
+@app.post("/batch-video-info")
+async def batch_video_info(request: Request):
+    """批量查询视频信息：并发解析，每个URL解析完成后立即以一行 NDJSON 返回（按完成顺序，index 为请求中的位置）"""
+    data = await request.json()
+    urls = data.get('urls')
+    if not isinstance(urls, list) or not urls:
+        raise HTTPException(status_code=400, detail="urls 必须是非空列表")
+    if len(urls) > BATCH_INFO_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"单次最多查询 {BATCH_INFO_MAX_URLS} 个URL")
     try:
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'format': 'bestvideo+bestaudio/best',
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            },
-            'socket_timeout': 30,
-            'retries': 3,
-        }
+        concurrency = int(data.get('concurrency') or BATCH_INFO_CONCURRENCY)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="concurrency 必须是整数")
+    concurrency = max(1, min(concurrency, BATCH_INFO_CONCURRENCY))
+    extract_log.info("批量查询视频信息", extra={'urls': len(urls), 'concurrency': concurrency})
+    client = admission_client(request)
+    
+    async def stream():
+        results = asyncio.Queue()
+        pending = iter(enumerate(urls))
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(url, download=False)
-                if not info:
-                    raise HTTPException(status_code=400, detail="No video information found")
-                
-                print(f"Successfully retrieved info for video: {info.get('title', 'Unknown')}")
-                
-                formats = {'combined': [], 'video': [], 'audio': []}
-                
-                # 获取最佳音频流
-                best_audio = None
-                for f in info['formats']:
-                    if f.get('vcodec') == 'none' and f.get('acodec') != 'none':
-                        if not best_audio or (
-                            (f.get('filesize', 0) or 0) > (best_audio.get('filesize', 0) or 0) and 
-                            (f.get('tbr', 0) or 0) > (best_audio.get('tbr', 0) or 0)
-                        ):
-                            best_audio = f
-
-                # 处理所有格式
-                for f in info['formats']:
-                    vcodec = f.get('vcodec', 'none')
-                    acodec = f.get('acodec', 'none')
-                    filesize = f.get('filesize', 0) or f.get('approximate_filesize', 0) or 0
-                    
-                    # 跳过无效格式
-                    if (vcodec == 'none' and acodec == 'none') or filesize == 0:
-                        continue
-                    
-                    # 创建基本格式信息
-                    format_info = {
-                        'format_id': f['format_id'],
-                        'ext': f.get('ext', 'N/A'),
-                        'filesize': humanize.naturalsize(filesize),
-                        'tbr': float(f.get('tbr', 0) or 0),  # 总比特率
-                        'vcodec': vcodec,
-                        'acodec': acodec,
-                        'width': int(f.get('width', 0) or 0),
-                        'height': int(f.get('height', 0) or 0),
-                        'fps': float(f.get('fps', 0) or 0),
-                    }
-                    
-                    # 设置质量标签
-                    if format_info['height']:
-                        quality = f"{format_info['height']}p"
-                        if format_info['fps'] > 30:
-                            quality += f" {int(format_info['fps'])}fps"
-                        format_info['quality_label'] = quality
-                    else:
-                        format_info['quality_label'] = f.get('format_note', 'N/A')
-
-                    # 分类并组合格式
-                    if vcodec != 'none' and acodec != 'none':
-                        formats['combined'].append(format_info)
-                    elif vcodec != 'none':
-                        if best_audio:
-                            format_info['format_id'] = f"{f['format_id']}+{best_audio['format_id']}"
-                            format_info['acodec'] = best_audio['acodec']
-                            # 确保复制一份，避免引用问题
-                            combined_format = format_info.copy()
-                            # 更新合并后的文件大小估计
-                            combined_format['filesize'] = humanize.naturalsize(filesize + (best_audio.get('filesize', 0) or 0))
-                            formats['combined'].append(combined_format)
-                        formats['video'].append(format_info)
-                    elif acodec != 'none':
-                        formats['audio'].append(format_info)
-
-                # 安全的排序函数
-                def safe_sort_key(x):
-                    return (
-                        int(x.get('height', 0) or 0),  # 首先按分辨率排序
-                        float(x.get('fps', 0) or 0),   # 然后按帧率排序
-                        float(x.get('tbr', 0) or 0)    # 最后按比特率排序
-                    )
-
-                # 按质量排序
-                for format_type in formats:
-                    formats[format_type].sort(
-                        key=safe_sort_key,
-                        reverse=True  # 降序排序
-                    )
-
-                response_data = {
-                    'title': info.get('title', 'Unknown Title'),
-                    'duration': str(timedelta(seconds=int(info.get('duration', 0) or 0))),
-                    'thumbnail': info.get('thumbnail', ''),
-                    'description': info.get('description', ''),
-                    'formats': formats
-                }
-                
-                return response_data
-                
-            except yt_dlp.utils.DownloadError as e:
-                print(f"YouTube-DL error: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Failed to extract video info: {str(e)}")
-            except Exception as e:
-                print(f"Unexpected error: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
-                
-    except Exception as e:
-        print(f"Error processing request: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        async def worker():
+            for index, url in pending:
+                line = {'index': index, 'url': url}
+                try:
+                    if not isinstance(url, str) or not url:
+                        raise HTTPException(status_code=400, detail="URL is required")
+                    # 每个URL单独准入；令牌不足时按客户端的速率等待，而不是直接拒绝
+                    async with admission.slot(client, wait_for_tokens=True):
+                        line.update(ok=True, **await resolve_video_info(url, 'batch_video_info'))
+                except AdmissionRejected as e:
+                    line.update(ok=False, status_code=429, error=too_many_requests(e).detail, retry_after=e.retry_after)
+                except HTTPException as e:
+                    line.update(ok=False, status_code=e.status_code, error=e.detail)
+                await results.put(line)
+        
+        # 固定数量的 worker 从同一个迭代器取URL，任何时刻最多 concurrency 个解析在进行
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(urls)))]
+        try:
+            for _ in range(len(urls)):
+                yield json.dumps(await results.get(), ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时停止剩余的解析
+            for task in workers:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
-@app.post("/download")
+@app.post("/download", dependencies=[Depends(extraction_slot)])
 async def download_video(request: Request):
     try:
         data = await request.json()
@@ -307,15 +497,22 @@ async def download_video(request: Request):
         format_id = data.get('format_id')
         save_path = data.get('save_path')
         download_id = data.get('download_id')
+        # 可选的单任务限速（字节/秒）
+        rate_limit = float(data.get('rate_limit') or 0)
+        # 调度优先级（high/normal/low），同一优先级内按客户端轮流执行
+        priority = data.get('priority') or 'normal'
+        client_id = request.headers.get('X-Client-Id') or (request.client.host if request.client else 'anonymous')
         
-        print(f"\n=== 开始处理下载请求 ===")
-        print(f"URL: {url}")
-        print(f"格式ID: {format_id}")
-        print(f"保存路径: {save_path}")
-        print(f"下载ID: {download_id}")
+        download_log.info("收到下载请求", extra={
+            'download_id': download_id, 'url': url, 'format_id': format_id, 'save_path': save_path
+        })
         
         if not all([url, format_id, save_path, download_id]):
             raise HTTPException(status_code=400, detail="缺少必要参数")
+        if priority not in PRIORITIES:
+            raise HTTPException(status_code=400, detail=f"无效的优先级: {priority}")
+        if scheduler.get(download_id) is not None or state.owner(download_id) is not None:
+            raise HTTPException(status_code=400, detail="该下载任务已在队列中")
         
         # 创建下载目录
         os.makedirs(save_path, exist_ok=True)
@@ -323,61 +520,301 @@ async def download_video(request: Request):
         try:
             # 先获取视频信息
             ydl_opts = {
+                **BASE_EXTRACT_OPTS,
                 'quiet': True,
                 'no_warnings': True,
                 'format': format_id
             }
             
-            print("获取视频信息...")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if not info:
-                    raise Exception("无法获取视频信息")
-                
-                print(f"视频信息获取成功: {info.get('title', 'Unknown')}")
-                
-                # 创建并启动下载任务
-                print("创建下载任务...")
-                task = asyncio.create_task(download_task(url, format_id, save_path, download_id))
-                await download_manager.add_download(download_id, task)
-                
-                print("下载任务已创建")
-                return JSONResponse({
-                    "status": "success",
-                    "message": "下载任务已创建",
-                    "save_path": save_path,
-                    "download_id": download_id
-                })
-                
+            with EXTRACTION_SECONDS.time('download'):
+                cacheable, raw_info = await extractor.extract_raw(url, ydl_opts)
+            info = await extractor.process(raw_info, ydl_opts) if cacheable and raw_info else raw_info
+            if not info:
+                raise Exception("无法获取视频信息")
+            
+            download_log.debug("视频信息获取成功", extra={'download_id': download_id, 'title': info.get('title')})
+            
+            # 创建下载任务并交给调度器排队，直接交给它已提取的原始信息，避免再次解析页面
+            journal.submitted(
+                download_id, url=url, format_id=format_id, save_path=save_path,
+                rate_limit=rate_limit, priority=priority, client_id=client_id
+            )
+            job = submit_download(
+                url, format_id, save_path, download_id,
+                info=raw_info if cacheable else None,
+                rate_limit=rate_limit, priority=priority, client_id=client_id
+            )
+            await download_manager.add_download(download_id, job)
+            
+            return JSONResponse({
+                "status": "success",
+                "message": "下载任务已创建",
+                "save_path": save_path,
+                "download_id": download_id,
+                "state": job.state,
+                "queue_position": scheduler.queue_position(download_id)
+            })
+            
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             error_msg = f"创建下载任务失败: {str(e)}"
-            print(error_msg)
-            import traceback
-            traceback.print_exc()
+            download_log.warning(error_msg, exc_info=True, extra={'download_id': download_id})
             raise HTTPException(status_code=400, detail=error_msg)
             
+    except UpstreamUnavailable as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         error_msg = f"处理下载请求失败: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        # 堆栈已在上面记录过
+        download_log.info(error_msg)
         raise HTTPException(status_code=400, detail=error_msg)
 
-# 添加ffmpeg检查函数
+@app.post("/playlist-ingest")
+async def ingest_playlist(request: Request):
+    """导入播放列表/频道：平铺枚举条目并逐条加入下载队列，以 NDJSON 流式返回发现的条目
+
+    单个视频的完整解析在该条目开始下载时才进行。WebSocket 客户端订阅响应头 X-Ingest-Id 中的 ID 可以收到同样的事件。
+    """
+    data = await request.json()
+    url = data.get('url')
+    save_path = data.get('save_path')
+    # 格式策略：best/audio/1080p/720p/480p，或直接传入 yt-dlp 的格式选择表达式
+    policy = data.get('format') or 'best'
+    format_selector = FORMAT_POLICIES.get(policy, policy)
+    rate_limit = float(data.get('rate_limit') or 0)
+    priority = data.get('priority') or 'normal'
+    client_id = request.headers.get('X-Client-Id') or (request.client.host if request.client else 'anonymous')
+    
+    if not url or not save_path:
+        raise HTTPException(status_code=400, detail="缺少必要参数")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"无效的优先级: {priority}")
+    # 枚举在后台进行，不占用提取名额，只消耗一个令牌
+    try:
+        await admission.check_rate(admission_client(request))
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
+    os.makedirs(save_path, exist_ok=True)
+    
+    async def submit(entry_url, download_id, index):
+        journal.submitted(
+            download_id, url=entry_url, format_id=format_selector, save_path=save_path,
+            rate_limit=rate_limit, priority=priority, client_id=client_id
+        )
+        job = submit_download(
+            entry_url, format_selector, save_path, download_id,
+            rate_limit=rate_limit, priority=priority, client_id=client_id
+        )
+        await download_manager.add_download(download_id, job)
+        return job
+    
+    ingest = playlist_ingestor.start(url, format_selector, save_path, submit)
+    get_logger('playlist').info("开始导入播放列表", extra={'url': url, 'ingest_id': ingest.id})
+    events = playlist_ingestor.listen(ingest)
+    
+    async def stream():
+        try:
+            yield json.dumps({'status': 'playlist_started', **ingest.to_dict()}, ensure_ascii=False) + "\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), 15)
+                except asyncio.TimeoutError:
+                    # 读取太慢被摘除时结束响应；导入本身继续进行
+                    if ingest.finished_at is not None or not playlist_ingestor.is_listening(ingest, events):
+                        return
+                    continue
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+                if event['status'] in (PLAYLIST_DONE, PLAYLIST_ERROR):
+                    return
+        finally:
+            playlist_ingestor.unlisten(ingest, events)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={'X-Ingest-Id': ingest.id})
+
+@app.get("/playlist-ingests")
+async def get_playlist_ingests():
+    return playlist_ingestor.snapshot()
+
+@app.post("/cancel-ingest")
+async def cancel_ingest(request: Request):
+    """停止枚举播放列表，已加入队列的条目不受影响"""
+    data = await request.json()
+    if not playlist_ingestor.cancel(data.get('ingest_id')):
+        raise HTTPException(status_code=404, detail="Ingest not found")
+    return {"status": "success", "ingest_id": data.get('ingest_id')}
+
+def submit_download(url, format_id, save_path, download_id, info=None,
+                    rate_limit=0, priority='normal', client_id='anonymous'):
+    """登记带宽控制（开始传输前不分配全局带宽）并把下载任务交给调度器排队"""
+    bandwidth.register(download_id, rate_limit)
+    return scheduler.submit(
+        download_id,
+        lambda job: download_task(
+            url, format_id, save_path, download_id,
+            info=info, cancel_event=job.cancel_event, attempt=job.attempts
+        ),
+        client=client_id,
+        priority=priority,
+        host=urlparse(url).hostname,
+    )
+
+def queue_depths():
+    """下载流水线各阶段排队中的任务数"""
+    return {
+        'download': len(scheduler.queued()),
+        'postprocess': postprocess_pipeline.depth(),
+    }
+
+def _job_samples(field):
+    return [({'download_id': job_id}, job[field]) for job_id, job in bandwidth.stats()['jobs'].items()]
+
+def _cache_samples(field):
+    caches = [('metadata', metadata_cache)] + ([('media_archive', archive)] if archive is not None else [])
+    return [({'cache': name}, getattr(cache, field)) for name, cache in caches]
+
+def _ratio(hits, misses):
+    return hits / (hits + misses) if hits + misses else 0.0
+
+metrics.gauge('ytd_download_speed_bytes', '运行中任务的下载速度（字节/秒）', lambda: _job_samples('speed'))
+metrics.gauge('ytd_aggregate_download_speed_bytes', '所有运行中任务的总下载速度（字节/秒）',
+              lambda: sum(job['speed'] for job in bandwidth.stats()['jobs'].values()))
+metrics.counter_fn('ytd_job_downloaded_bytes_total', '运行中任务已下载的字节数', lambda: _job_samples('downloaded_bytes'))
+metrics.counter_fn('ytd_downloaded_bytes_total', '累计下载的字节数', lambda: bandwidth.stats()['total_bytes'])
+metrics.gauge('ytd_queue_depth', '下载流水线各阶段排队中的任务数',
+              lambda: [({'stage': stage}, depth) for stage, depth in queue_depths().items()])
+metrics.gauge('ytd_download_workers_busy', '运行中的下载任务数', lambda: len(scheduler.running()))
+metrics.gauge('ytd_download_workers', '下载任务并发上限', lambda: scheduler.max_concurrent)
+metrics.gauge('ytd_download_worker_utilization', '下载名额占用比例',
+              lambda: len(scheduler.running()) / scheduler.max_concurrent)
+metrics.gauge('ytd_postprocess_workers_busy', '执行中的合并数', lambda: postprocess_pipeline.stats()['running'])
+metrics.gauge('ytd_ydl_pool_instances', 'YoutubeDL 实例池中的实例数',
+              lambda: [({'state': state}, ydl_pool.stats()[state]) for state in ('idle', 'in_use')])
+metrics.counter_fn('ytd_ydl_pool_checkouts_total', 'YoutubeDL 实例借出次数',
+                   lambda: [({'result': result}, ydl_pool.stats()[result]) for result in ('created', 'reused')])
+metrics.counter_fn('ytd_ydl_pool_recycled_total', '因出错或达到使用次数上限而关闭的实例数', lambda: ydl_pool.recycled)
+metrics.gauge('ytd_admission_active', '占用中的提取名额', lambda: admission.active)
+metrics.gauge('ytd_admission_waiting', '等待提取名额的请求数', lambda: admission.waiting)
+metrics.counter_fn('ytd_admission_admitted_total', '准入的提取请求数', lambda: admission.admitted)
+metrics.counter_fn('ytd_admission_rejected_total', '被拒绝（429）的请求数',
+                   lambda: [({'reason': reason}, n) for reason, n in admission.rejected.items()])
+metrics.counter_fn('ytd_upstream_failures_total', '上游请求失败次数（按失败类型）',
+                   lambda: [({'kind': kind}, n) for kind, n in upstream.failures.items()])
+metrics.gauge('ytd_upstream_circuit_open', '上游主机的熔断状态（1 为打开或半开）',
+              lambda: [({'host': host}, int(state != 'closed')) for host, state in upstream.breaker_states().items()])
+metrics.counter_fn('ytd_upstream_shed_total', '因上游熔断直接拒绝的提取请求数', lambda: upstream.shed)
+metrics.counter_fn('ytd_negative_cache_hits_total', '负缓存命中次数', lambda: upstream.negative.hits)
+metrics.gauge('ytd_download_retry_waiting', '等待重试的下载任务数', lambda: len(scheduler.retrying()))
+metrics.gauge('ytd_extraction_inflight', '进行中的视频信息提取数（同一URL的并发请求只算一次）', extractor.inflight)
+metrics.gauge('ytd_event_loop_lag_last_seconds', '最近一次测量的事件循环调度延迟', lambda: loop_monitor.last_lag)
+metrics.gauge('ytd_websocket_connections', '活动的 WebSocket 连接数', lambda: len(manager.active_connections))
+metrics.counter_fn('ytd_websocket_messages_sent_total', '已发送的 WebSocket 消息数', lambda: manager.sent_messages)
+metrics.counter_fn('ytd_websocket_dropped_connections_total', '因消费太慢被断开的 WebSocket 连接数',
+                   lambda: manager.dropped_connections)
+metrics.gauge('ytd_log_queue_depth', '等待写出的日志条数', lambda: log_pipeline.queue.qsize())
+metrics.counter_fn('ytd_log_dropped_total', '日志队列已满时丢弃的日志条数', lambda: log_pipeline.handler.dropped)
+metrics.counter_fn('ytd_cache_hits_total', '缓存命中次数', lambda: _cache_samples('hits'))
+metrics.counter_fn('ytd_cache_misses_total', '缓存未命中次数', lambda: _cache_samples('misses'))
+metrics.gauge('ytd_cache_hit_ratio', '缓存命中率', lambda: [
+    (labels, _ratio(hits, misses))
+    for (labels, hits), (_, misses) in zip(_cache_samples('hits'), _cache_samples('misses'))
+])
+
+async def recover_downloads(download_ids=None):
+    """重新排队上次进程退出时未完成的任务，yt-dlp 会从已有的 .part 文件继续下载
+
+    多进程部署时每个任务只由一个进程恢复；仍登记在刚退出（心跳尚未过期）的进程名下的任务稍后再试一次。
+    """
+    if download_ids is None:
+        journal.compact()
+    blocked = []
+    for entry in journal.unfinished():
+        download_id = entry['download_id']
+        if download_ids is not None and download_id not in download_ids:
+            continue
+        if scheduler.get(download_id) is not None or not state.claim(download_id):
+            blocked.append(download_id)
+            continue
+        download_log.info("恢复未完成的下载", extra={'download_id': download_id})
+        try:
+            os.makedirs(entry['save_path'], exist_ok=True)
+            job = submit_download(
+                entry['url'], entry['format_id'], entry['save_path'], download_id,
+                rate_limit=entry.get('rate_limit') or 0,
+                priority=entry.get('priority') or 'normal',
+                client_id=entry.get('client_id') or 'anonymous'
+            )
+        except Exception as e:
+            download_log.error("恢复下载失败", extra={'download_id': download_id, 'error': str(e)})
+            journal.append(download_id, 'failed', error=str(e))
+            state.unregister(download_id)
+            continue
+        await download_manager.add_download(download_id, job)
+    if blocked and download_ids is None and state.shared:
+        async def retry():
+            await asyncio.sleep(state.worker_timeout)
+            await recover_downloads(set(blocked))
+        asyncio.create_task(retry())
+
+# 添加ffmpeg检查函数（启动时探测一次，结果缓存）
 def check_ffmpeg():
     try:
-        subprocess.run(['ffmpeg', '-version'], capture_output=True)
-        return True
+        return ffmpeg_capabilities()['available']
     except Exception:
         return False
 
-async def download_task(url, format_id, save_path, download_id):
-    print(f"\n=== 开始下载任务 ===")
-    print(f"下载ID: {download_id}")
-    print(f"URL: {url}")
-    print(f"格式ID: {format_id}")
-    print(f"保存路径: {save_path}")
+async def warm_up():
+    """启动后在后台预热提取器并探测 ffmpeg，不阻塞服务启动"""
+    loop = asyncio.get_running_loop()
+    try:
+        capabilities, warm = await asyncio.gather(
+            loop.run_in_executor(None, ffmpeg_capabilities),
+            extractor.warm_up(VIDEO_INFO_OPTS),
+        )
+    except Exception as e:
+        logger.warning("预热失败", extra={'error': str(e)})
+        return
+    logger.info("预热完成", extra={
+        'ffmpeg': capabilities['ffmpeg'], 'ffprobe': capabilities['ffprobe'],
+        'extractors': warm['extractors'], 'seconds': round(warm['seconds'], 3),
+    })
+
+async def scan_library():
+    """定期增量扫描下载目录；第一次扫描在启动后立即执行"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            stats = await loop.run_in_executor(None, library.scan)
+            if stats.get('added') or stats.get('removed') or stats.get('updated'):
+                logger.info("下载库扫描完成", extra=stats)
+        except Exception as e:
+            logger.warning("扫描下载库失败", extra={'error': str(e)})
+        await asyncio.sleep(LIBRARY_SCAN_INTERVAL)
+
+async def record_library(path, info, format_id):
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, library.record, path, info, format_id)
+    except Exception as e:
+        logger.warning("登记到下载库失败", extra={'path': path, 'error': str(e)})
+
+class DownloadFailed(Exception):
+    """下载线程中已经记录过原因的失败"""
+
+async def download_task(url, format_id, save_path, download_id, info=None, cancel_event=None, attempt=0):
+    # 本任务（包括交给线程池的部分）记录的日志都带上 download_id
+    download_id_var.set(download_id)
+    download_log.info("开始下载任务", extra={
+        'url': url, 'format_id': format_id, 'save_path': save_path, 'attempt': attempt
+    })
     
+    journal.append(download_id, 'started')
+    # 开始传输，参与全局带宽分配
+    bandwidth.activate(download_id)
+    # 需要合并的格式只能在合并完成后获取
+    files.start(download_id, streamable='+' not in format_id)
+    ydl = None
+    succeeded = False
+    retrying = False
     try:
         # 检查ffmpeg
         if not check_ffmpeg():
@@ -393,6 +830,12 @@ async def download_task(url, format_id, save_path, download_id):
         
         def progress_callback(d):
             try:
+                # 暂停时在这里阻塞，超出带宽时在这里休眠
+                bandwidth.on_progress(download_id, d)
+                if cancel_event is not None and cancel_event.is_set():
+                    raise yt_dlp.utils.DownloadCancelled("下载已取消")
+                journal.progress(download_id, d)
+                files.on_progress(download_id, d)
                 if d['status'] == 'downloading':
                     downloaded = d.get('downloaded_bytes', 0)
                     total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
@@ -402,96 +845,419 @@ async def download_task(url, format_id, save_path, download_id):
                     
                     if total > 0:
                         percent = (downloaded / total) * 100
-                        print(f"\r下载进度: {percent:.1f}% - {filename}")
+                        if download_log.isEnabledFor(logging.DEBUG):
+                            suppressed = progress_sampler.allow(download_id)
+                            if suppressed is not None:
+                                download_log.debug("下载进度", extra={
+                                    'download_id': download_id, 'percent': round(percent, 1), 'speed': speed,
+                                    'file': filename, 'suppressed': suppressed,
+                                })
                         
-                        try:
-                            # 发送进度更新
-                            future = asyncio.run_coroutine_threadsafe(
-                                manager.broadcast(json.dumps({
-                                    'status': 'downloading',
-                                    'percent': percent,
-                                    'speed': speed,
-                                    'eta': eta,
-                                    'filename': filename,
-                                    'download_id': download_id
-                                })),
-                                loop
-                            )
-                            # 等待消息发送完成
-                            future.result(timeout=5)
-                        except Exception as e:
-                            print(f"发送进度更新失败: {e}")
-                            import traceback
-                            traceback.print_exc()
+                        # 发送进度更新（只入队，不等待网络发送）
+                        manager.publish({
+                            'status': 'downloading',
+                            'percent': percent,
+                            'speed': speed,
+                            'eta': eta,
+                            'filename': filename,
+                            'download_id': download_id
+                        })
                             
-            except Exception as e:
-                print(f"处理下载进度失败: {e}")
-                import traceback
-                traceback.print_exc()
+            except yt_dlp.utils.DownloadCancelled:
+                raise
+            except Exception:
+                # 每次进度回调都可能出同样的错，限频记录
+                if progress_sampler.allow(('error', download_id)) is not None:
+                    download_log.warning("处理下载进度失败", exc_info=True, extra={'download_id': download_id})
         
         # yt-dlp配置
         ydl_opts = {
+            **BASE_EXTRACT_OPTS,
             'format': format_id,
             'outtmpl': os.path.join(save_path, '%(title)s.%(ext)s'),
             'progress_hooks': [progress_callback],
-            'merge_output_format': 'mp4',
+            'merge_output_format': '/'.join(MERGE_CONTAINERS),
             'quiet': False,
             'no_warnings': False,
+            # 进度由 progress_callback 推送和限频记录，不再输出 yt-dlp 的进度条
+            'noprogress': True,
             'retries': 3,
             'fragment_retries': 3,
             'http_chunk_size': 10485760,
-            'socket_timeout': 30,
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
+            'concurrent_fragment_downloads': DOWNLOAD_CONNECTIONS,
+            # 固定读取块大小，保证暂停和限速的响应粒度
+            'buffersize': 65536,
+            'noresizebuffer': True,
         }
         
+        # 签名地址已过期（或即将过期）时才重新解析；重试时上次的地址可能正是失败的原因，也重新解析
+        if info is not None and (is_expired(info) or attempt > 0):
+            download_log.info("重新获取视频信息", extra={'expired': is_expired(info)})
+            await loop.run_in_executor(None, extractor.cache.invalidate, cache_key(url, ydl_opts))
+            info = None
+        if info is None:
+            with EXTRACTION_SECONDS.time('download_task'):
+                # 调度器只在上游主机没有熔断时才启动任务，这里不再检查熔断
+                cacheable, raw_info = await extractor.extract_raw(url, ydl_opts, check_upstream=False)
+            info = raw_info if cacheable else None
+        
+        # 按格式表中的合并方案选择容器：能直接复制就不转码，否则先合并为 mkv 再转码到目标容器
+        plan = plan_for_selection(info, format_id, MERGE_CONTAINERS) if info is not None else None
+        if plan is not None:
+            if plan.stream_copy:
+                ydl_opts['merge_output_format'] = plan.container
+            else:
+                download_log.info("格式需要转码", extra={
+                    'transcode': plan.transcode, 'container': plan.container, 'cpu_seconds': round(plan.cpu_seconds),
+                })
+                ydl_opts['merge_output_format'] = 'mkv'
+                ydl_opts['postprocessors'] = [{'key': 'FFmpegVideoConvertor', 'preferedformat': plan.container}]
+        
+        archive_key = None
+        if archive is not None and info is not None and info.get('id'):
+            archive_key = (info.get('extractor_key') or info.get('extractor') or '', info['id'], format_id)
+            entry = await loop.run_in_executor(download_pool, archive.lookup, *archive_key)
+            if entry is not None:
+                try:
+                    path, method = await loop.run_in_executor(download_pool, archive.materialize, entry, save_path)
+                except Exception as e:
+                    download_log.warning("复用已下载文件失败，重新下载", extra={'error': str(e)})
+                else:
+                    download_log.info("已下载过相同视频和格式", extra={'method': method, 'path': path})
+                    files.complete(download_id, path)
+                    await record_library(path, info, format_id)
+                    journal.append(download_id, 'completed', archived=method)
+                    manager.publish({
+                        'status': 'completed',
+                        'path': save_path,
+                        'archived': method,
+                        'download_id': download_id
+                    })
+                    return
+        
         def do_download():
+            # 合并等后处理被推迟，下载完成后交给后处理流水线；实例在任务结束后才归还到实例池
+            ydl = ydl_pool.checkout(ydl_opts, PipelinedYoutubeDL)
             try:
-                print("开始下载...")
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    error_code = ydl.download([url])
-                    print(f"下载完成，返回代码: {error_code}")
-                    if error_code != 0:
-                        raise Exception(f"下载失败，错误代码: {error_code}")
-                    return True
+                if info is not None:
+                    try:
+                        # 直接使用已解析的信息下载，无需再次请求页面和格式清单
+                        ydl.process_ie_result(copy.deepcopy(info), download=True)
+                        return ydl
+                    except yt_dlp.utils.DownloadError as e:
+                        if 'HTTP Error 403' not in str(e):
+                            raise
+                        # 签名地址提前失效，丢弃缓存后完整解析一次
+                        download_log.info("视频地址已失效，重新解析后下载")
+                        extractor.cache.invalidate(cache_key(url, ydl_opts))
+                        ydl.deferred.clear()
+                error_code = ydl.download([url])
+                if error_code != 0:
+                    raise Exception(f"下载失败，错误代码: {error_code}")
+                return ydl
             except Exception as e:
-                print(f"下载出错: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                return False
+                # yt-dlp 的下载错误已经通过它的 logger 记录过原因，不再记录堆栈
+                download_log.error("下载出错", exc_info=not isinstance(e, yt_dlp.utils.DownloadError),
+                                   extra={'error': str(e)})
+                ydl_pool.checkin(ydl, failed=True)
+                # 保留原始异常，用于判断是否重试
+                raise DownloadFailed("下载失败 - 请检查日志获取详细信息") from e
         
-        print("在线程池中启动下载...")
-        success = await loop.run_in_executor(thread_pool, do_download)
+        download_started = time.monotonic()
+        # 复制上下文，下载线程中的日志（包括 yt-dlp 的输出）也带上 download_id
+        ydl = await loop.run_in_executor(download_pool, contextvars.copy_context().run, do_download)
+        upstream.record_success(url)
+        timings = {'download': time.monotonic() - download_started}
         
-        if success:
-            print("下载成功完成")
-            await manager.broadcast(json.dumps({
-                'status': 'completed',
-                'path': save_path,
+        if ydl.needs_pipeline:
+            # 下载阶段结束：让出下载并发名额，合并在后处理线程池中排队执行
+            scheduler.release(download_id)
+            bandwidth.unregister(download_id)
+            if cancel_event is not None and cancel_event.is_set():
+                raise yt_dlp.utils.DownloadCancelled("下载已取消")
+            manager.publish({
+                'status': 'postprocessing',
+                'stage': 'queued',
+                'timings': timings,
+                'queue_depths': queue_depths(),
                 'download_id': download_id
-            }))
+            })
+            
+            def on_postprocess_start(wait):
+                manager.publish({
+                    'status': 'postprocessing',
+                    'stage': 'running',
+                    'timings': {**timings, 'postprocess_wait': wait},
+                    'queue_depths': queue_depths(),
+                    'download_id': download_id
+                })
+            
+            result = await postprocess_pipeline.run(ydl, on_start=on_postprocess_start)
+            final_paths = result['paths']
+            timings.update(postprocess_wait=result['wait'], postprocess=result['run'])
         else:
-            raise Exception("下载失败 - 请检查日志获取详细信息")
+            # 没有需要 ffmpeg 的后处理，直接完成
+            final_paths = ydl.run_deferred()
+        
+        download_log.info("下载成功完成", extra={'timings': timings})
+        if archive_key is not None and final_paths:
+            try:
+                await loop.run_in_executor(None, archive.record, *archive_key, final_paths[-1])
+            except Exception as e:
+                download_log.warning("登记下载文件失败", extra={'error': str(e)})
+        if final_paths:
+            files.complete(download_id, final_paths[-1])
+            await record_library(final_paths[-1], info, format_id)
+        journal.append(download_id, 'completed')
+        manager.publish({
+            'status': 'completed',
+            'path': save_path,
+            'timings': timings,
+            'queue_depths': queue_depths(),
+            'download_id': download_id
+        })
+        succeeded = True
             
     except Exception as e:
+        if cancel_event is not None and cancel_event.is_set():
+            if scheduler.stopping:
+                # 服务关闭导致的中断，不写入结束事件，重启后从 .part 文件继续
+                download_log.info("服务关闭，下载中断")
+                return
+            download_log.info("下载已取消")
+            journal.append(download_id, 'cancelled')
+            manager.publish({
+                'status': 'cancelled',
+                'download_id': download_id
+            })
+            return
         error_msg = f"下载任务出错: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
-        await manager.broadcast(json.dumps({
+        # 限流和临时错误计入上游主机的熔断器，永久错误进入负缓存
+        kind = upstream.record_failure(url, e)
+        delay = None if scheduler.stopping else retry_policy.delay(attempt, kind)
+        if delay is not None:
+            download_log.warning("下载失败，稍后重试", extra={
+                'kind': kind, 'retry_in': round(delay, 1), 'attempt': attempt + 1, 'error': str(e)
+            })
+            retrying = True
+            journal.append(download_id, 'retrying', attempt=attempt + 1, error=error_msg)
+            manager.publish({
+                'status': 'retrying',
+                'error': error_msg,
+                'kind': kind,
+                'attempt': attempt + 1,
+                'max_retries': retry_policy.max_retries,
+                'retry_in': delay,
+                'download_id': download_id
+            })
+            raise RetryJob(delay, error_msg) from e
+        download_log.error(error_msg, exc_info=not isinstance(
+            e, (DownloadFailed, UpstreamUnavailable, yt_dlp.utils.DownloadError)
+        ), extra={'kind': kind})
+        journal.append(download_id, 'failed', error=error_msg)
+        manager.publish({
             'status': 'error',
             'error': error_msg,
+            'kind': kind,
+            'download_id': download_id
+        })
+        raise
+    finally:
+        files.fail(download_id, 'cancelled' if cancel_event is not None and cancel_event.is_set() else 'failed')
+        if ydl is not None:
+            ydl_pool.checkin(ydl, failed=not succeeded)
+        progress_sampler.forget(download_id)
+        if retrying:
+            # 等待重试的任务仍在队列中，保留它的限速设置和任务归属，只让出全局带宽
+            bandwidth.deactivate(download_id)
+        else:
+            bandwidth.unregister(download_id)
+            await download_manager.remove_download(download_id)
+
+@app.get("/queue")
+async def get_queue():
+    """列出本进程运行中、排队中和最近结束的下载任务，以及其他工作进程正在执行的任务"""
+    return {
+        **scheduler.snapshot(),
+        'worker_id': state.worker_id,
+        'other_workers': [job for job in state.jobs() if job['worker'] != state.worker_id],
+    }
+
+async def cancel_local(download_id):
+    """取消本进程中的任务，任务不在本进程时返回 False"""
+    if not scheduler.cancel(download_id):
+        return False
+    # 唤醒可能处于暂停状态的下载线程，让它检查取消标记后退出
+    bandwidth.resume(download_id)
+    job = scheduler.get(download_id)
+    if job is None:
+        # 排队中和等待重试的任务已直接移除，download_task 不会再运行，由这里清理
+        bandwidth.unregister(download_id)
+        await download_manager.remove_download(download_id)
+        journal.append(download_id, 'cancelled')
+        manager.publish({
+            'status': 'cancelled',
             'download_id': download_id
-        }))
+        })
+    return True
+
+def forward_command(download_id, command, **data):
+    """任务在其他工作进程中时把控制命令转发给它，任务不存在时返回 False"""
+    owner = state.owner(download_id)
+    if owner is None or owner == state.worker_id:
+        return False
+    state.send_command(owner, download_id, command, **data)
+    return True
+
+async def handle_command(download_id, command, data):
+    """执行其他工作进程转发来的控制命令"""
+    logger.info("收到转发的命令", extra={'command': command, 'download_id': download_id})
+    try:
+        if command == 'pause':
+            await download_manager.pause_download(download_id)
+        elif command == 'resume':
+            await download_manager.resume_download(download_id)
+        elif command == 'cancel':
+            await cancel_local(download_id)
+        elif command == 'rate':
+            bandwidth.set_job_rate(download_id, float(data.get('rate_limit') or 0))
+    except Exception as e:
+        logger.exception("执行转发的命令失败", extra={'command': command, 'download_id': download_id})
+
+@app.post("/cancel-download")
+async def cancel_download(request: Request):
+    data = await request.json()
+    download_id = data.get('download_id')
+    job = scheduler.get(download_id)
+    if job is not None and job.state == POSTPROCESSING:
+        raise HTTPException(status_code=409, detail="下载已完成，正在后处理，无法取消")
+    if not await cancel_local(download_id) and not forward_command(download_id, 'cancel'):
+        raise HTTPException(status_code=404, detail="Download not found")
+    return {"status": "success", "download_id": download_id}
+
+@app.api_route("/files/{download_id}", methods=["GET", "HEAD"])
+async def get_file(download_id: str, request: Request, download: bool = False):
+    """获取下载任务的文件：已完成的文件支持 Range；单个流的下载在进行中即可边下边读（download=1 时作为附件下载）"""
+    live = files.get(download_id)
+    if live is None:
+        if scheduler.get(download_id) is not None:
+            raise HTTPException(status_code=409, detail="下载尚未开始", headers={'Retry-After': '1'})
+        raise HTTPException(status_code=404, detail="File not found")
+    range_header = request.headers.get('Range')
+    if live.state == 'completed':
+        if not live.final_path or not os.path.isfile(live.final_path):
+            raise HTTPException(status_code=404, detail="文件已被移动或删除")
+        return file_response(live.final_path, range_header, request.scope, attachment=download)
+    if live.state != 'downloading':
+        raise HTTPException(status_code=410, detail=f"下载已结束: {live.state}")
+    if not live.streamable:
+        raise HTTPException(status_code=409, detail="需要合并的格式在合并完成后才能获取", headers={'Retry-After': '5'})
+    if live.path is None:
+        raise HTTPException(status_code=409, detail="下载尚未开始", headers={'Retry-After': '1'})
+    return tail_response(live, range_header, attachment=download)
+
+@app.get("/bandwidth")
+async def get_bandwidth():
+    return bandwidth.stats()
+
+@app.post("/bandwidth")
+async def set_bandwidth(request: Request):
+    """调整全局限速或单个任务的限速（字节/秒，0 表示不限速）"""
+    data = await request.json()
+    if 'global_rate' in data:
+        bandwidth.set_global_rate(float(data['global_rate'] or 0))
+    if data.get('download_id'):
+        rate_limit = float(data.get('rate_limit') or 0)
+        if (not bandwidth.set_job_rate(data['download_id'], rate_limit)
+                and not forward_command(data['download_id'], 'rate', rate_limit=rate_limit)):
+            raise HTTPException(status_code=404, detail="Download not found")
+    return bandwidth.stats()
+
+@app.get("/admission")
+async def get_admission():
+    """准入控制的当前限制和使用情况（本进程）"""
+    return admission.stats()
+
+@app.post("/admission")
+async def set_admission(request: Request):
+    """运行时调整准入限制：max_concurrent、max_queue、queue_timeout、rate（每秒令牌数，0 表示不限速）、burst"""
+    data = await request.json()
+    try:
+        admission.configure(**{k: data.get(k) for k in ('max_concurrent', 'max_queue', 'queue_timeout', 'rate', 'burst')})
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return admission.stats()
+
+@app.get("/upstream-stats")
+async def get_upstream_stats():
+    """负缓存、各上游主机的熔断状态、失败分类计数，以及等待重试的任务（本进程）"""
+    return {
+        **upstream.stats(),
+        'retry': {
+            'max_retries': retry_policy.max_retries,
+            'base_delay': retry_policy.base_delay,
+            'max_delay': retry_policy.max_delay,
+            'waiting': [job.to_dict() for job in scheduler.retrying()],
+        },
+    }
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    return metadata_cache.stats()
+
+@app.get("/pipeline-stats")
+async def get_pipeline_stats():
+    return {
+        'queue_depths': queue_depths(),
+        'postprocess': postprocess_pipeline.stats(),
+        'ydl_pool': ydl_pool.stats(),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/archive-stats")
+async def get_archive_stats():
+    if archive is None:
+        raise HTTPException(status_code=404, detail="Media archive disabled")
+    return archive.stats()
 
 @app.get("/videos")
-async def get_videos():
-    return JSONResponse({"videos": videos}) 
+async def get_videos(q: str = '', sort: str = 'added', order: str = 'desc', page: int = 1, page_size: int = 50,
+                     refresh: bool = False):
+    """下载库中的文件：q 搜索标题/文件名/视频ID，sort 为 added/mtime/title/size/duration，refresh=1 时先扫描一次"""
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"不支持的排序字段: {sort}")
+    if order not in ('asc', 'desc'):
+        raise HTTPException(status_code=400, detail=f"无效的排序方向: {order}")
+    page = max(1, page)
+    page_size = min(max(1, page_size), LIBRARY_MAX_PAGE_SIZE)
+    loop = asyncio.get_running_loop()
+    if refresh:
+        await loop.run_in_executor(None, library.scan)
+    total, videos = await loop.run_in_executor(
+        None, library.query, q.strip(), sort, order == 'desc', (page - 1) * page_size, page_size)
+    return JSONResponse({"videos": videos, "total": total, "page": page, "page_size": page_size})
+
+@app.get("/workers")
+async def get_workers():
+    """共享状态后端和各工作进程之间转发的事件、命令数"""
+    return state.stats()
+
+@app.get("/library-stats")
+async def get_library_stats():
+    return library.stats()
 
 @app.post("/select-folder")
 async def select_folder():
-    root = tk.Tk()
+    # 图形界面模块只在使用时导入，无图形界面的服务器上也能正常启动
+    try:
+        import tkinter as tk
+        from tkinter import filedialog
+        root = tk.Tk()
+    except Exception as e:
+        raise HTTPException(status_code=501, detail=f"当前环境没有图形界面，请直接输入保存路径: {e}")
     root.withdraw()  # Hide the main window
     root.attributes('-topmost', True)  # Make the dialog appear on top
     
@@ -531,7 +1297,7 @@ async def open_folder(request: Request):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/info")
+@app.post("/info", dependencies=[Depends(extraction_slot)])
 async def get_video_info(url: str, request: Request):
     try:
         data = await request.json()
@@ -541,10 +1307,11 @@ async def get_video_info(url: str, request: Request):
             raise HTTPException(status_code=400, detail="URL is required")
             
         ydl_opts = {
+            **BASE_EXTRACT_OPTS,
+            **PLAYLIST_PROBE_OPTS,
             'format': 'bestvideo+bestaudio/best',  # 使用最佳视频和音频组合
             'quiet': True,
             'no_warnings': True,
-            'extract_flat': False,
             'format_sort': [
                 'res',          # 按分辨率排序
                 'fps',          # 然后是帧率
@@ -554,91 +1321,23 @@ async def get_video_info(url: str, request: Request):
             ]
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            # 调试日志：打印所有格式
-            print("Available formats:")
-            for f in info['formats']:
-                print(f"ID: {f['format_id']}, Res: {f.get('height', 'N/A')}p, "
-                      f"FPS: {f.get('fps', 'N/A')}, "
-                      f"vcodec: {f.get('vcodec', 'none')}, "
-                      f"acodec: {f.get('acodec', 'none')}")
-            
-            # 处理格式信息
-            formats = {'combined': [], 'video': [], 'audio': []}
-            
-            # 处理格式
-            for f in info['formats']:
-                # 跳过不包含视频或音频的格式
-                if f.get('vcodec') == 'none' and f.get('acodec') == 'none':
-                    continue
+        with EXTRACTION_SECONDS.time('info'):
+            info = await extractor.extract_info(url, ydl_opts)
+        reject_playlist(info)
+        
+        extract_log.debug("获取视频信息成功", extra={'url': url, 'title': info.get('title')})
+        formats = format_table(info, MERGE_CONTAINERS)
 
-                # 获取最佳音频流
-                best_audio = None
-                for af in info['formats']:
-                    if af.get('vcodec') == 'none' and af.get('acodec') != 'none':
-                        if not best_audio or (af.get('filesize', 0) > best_audio.get('filesize', 0)):
-                            best_audio = af
-
-                # 处理质量标签
-                quality_label = f.get('quality_label', '')
-                if not quality_label and f.get('height'):
-                    quality_label = f'{f.get("height")}p'
-                    if f.get('fps', 0) > 30:
-                        quality_label += f' {f.get("fps")}fps'
-                elif not quality_label:
-                    quality_label = f.get('format_note', 'N/A')
-
-                format_info = {
-                    'format_id': f['format_id'],
-                    'ext': f['ext'],
-                    'quality_label': quality_label,
-                    'fps': f.get('fps', 'N/A'),
-                    'vcodec': f.get('vcodec', 'N/A'),
-                    'acodec': f.get('acodec', 'N/A'),
-                    'filesize': humanize.naturalsize(f.get('filesize', 0) or f.get('approximate_filesize', 0)) 
-                              if (f.get('filesize') or f.get('approximate_filesize')) else 'N/A',
-                    'width': f.get('width', 0),
-                    'height': f.get('height', 0)
-                }
-
-                # 分类格式
-                if f.get('vcodec') != 'none':
-                    # 如果是纯视频流，添加音频流ID
-                    if f.get('acodec') == 'none' and best_audio:
-                        format_info['format_id'] = f'{f["format_id"]}+{best_audio["format_id"]}'
-                    formats['combined'].append(format_info)
-                elif f.get('acodec') != 'none':
-                    formats['audio'].append(format_info)
-
-            # 按分辨率和帧率排序
-            for format_type in formats:
-                formats[format_type].sort(
-                    key=lambda x: (
-                        int(x.get('height', 0)) if isinstance(x.get('height'), (int, str)) and str(x.get('height', '')).isdigit() else 0,
-                        int(x.get('fps', 0)) if isinstance(x.get('fps'), (int, str)) and str(x.get('fps', '')).isdigit() else 0
-                    ),
-                    reverse=True
-                )
-
-            # 调试日志：打印排序后的格式
-            print("\nSorted formats:")
-            for format_type, format_list in formats.items():
-                print(f"\n{format_type.upper()}:")
-                for f in format_list:
-                    print(f"Quality: {f['quality_label']}, "
-                          f"Height: {f.get('height')}, "
-                          f"FPS: {f.get('fps')}")
-
-            return {
-                'title': info['title'],
-                'duration': str(timedelta(seconds=info['duration'])),
-                'thumbnail': info.get('thumbnail', ''),
-                'description': info.get('description', ''),
-                'formats': formats
-            }
-            
+        return {
+            'title': info['title'],
+            'duration': str(timedelta(seconds=info['duration'])),
+            'thumbnail': info.get('thumbnail', ''),
+            'description': info.get('description', ''),
+            'formats': formats
+        }
+        
+    except UpstreamUnavailable as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -650,9 +1349,9 @@ async def toggle_download(request: Request):
         download_id = data.get('download_id')
         
         if action == 'pause':
-            success = await download_manager.pause_download(download_id)
+            success = await download_manager.pause_download(download_id) or forward_command(download_id, 'pause')
         elif action == 'resume':
-            success = await download_manager.resume_download(download_id)
+            success = await download_manager.resume_download(download_id) or forward_command(download_id, 'resume')
         else:
             raise HTTPException(status_code=400, detail="Invalid action")
             
@@ -674,37 +1373,37 @@ if __name__ == "__main__":
     static_dir = os.path.join(os.path.dirname(__file__), "static")
     
     if not os.path.exists(template_dir):
-        print(f"Error: Templates directory not found at {template_dir}")
-        print("Creating templates directory...")
+        logger.warning("模板目录不存在，已创建", extra={'path': template_dir})
         os.makedirs(template_dir)
     
     if not os.path.exists(static_dir):
-        print(f"Error: Static directory not found at {static_dir}")
-        print("Creating static directory...")
+        logger.warning("静态文件目录不存在，已创建", extra={'path': static_dir})
         os.makedirs(static_dir)
     
     if not os.path.exists(os.path.join(template_dir, "index.html")):
-        print(f"Error: index.html not found in {template_dir}")
+        logger.error("找不到 index.html", extra={'path': template_dir})
+        log_pipeline.stop()
         exit(1)
     
     # Configure the server
     host = "0.0.0.0"  # 允许所有IP访问
     port = 8080  # 换个端口试试
     
-    print(f"Starting server at http://{host}:{port}")
-    print(f"You can access the website at:")
-    print(f"  http://localhost:{port}")
-    print(f"  http://127.0.0.1:{port}")
-    print("Project directory:", os.path.abspath(os.path.dirname(__file__)))
-    print("Templates directory:", template_dir)
-    print("Static directory:", static_dir)
-    print("Press Ctrl+C to stop the server")
+    logger.info("启动服务", extra={
+        'url': f"http://localhost:{port}",
+        'host': host,
+        'project_dir': os.path.abspath(os.path.dirname(__file__)),
+    })
+    
+    # 工作进程数：大于 1 时关闭自动重载，各进程通过 YTD_STATE_DB 共享任务状态
+    workers = int(os.environ.get("YTD_WORKERS", 1))
     
     # Start the server
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
-        reload=True,
-        log_level="debug"
+        reload=workers == 1,
+        workers=workers,
+        log_level=LOG_LEVEL.lower()
     ) 
\ No newline at end of file
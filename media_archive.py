@@ -0,0 +1,152 @@
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+
+# Linux 上的 FICLONE ioctl，在 btrfs/xfs 等文件系统上做写时复制（reflink）
+_FICLONE = 0x40049409
+
+
+class ArchiveEntry(NamedTuple):
+    extractor: str
+    video_id: str
+    format_id: str
+    path: str
+    size: int
+    mtime: float
+    checksum: str
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _reflink(src: str, dst: str):
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported on this platform")
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+class MediaArchive:
+    """已下载媒体文件的索引，key 为 (提取器, 视频ID, format_id)
+
+    命中时通过硬链接、reflink 或复制把已有文件放到新的保存路径，不再重复下载。
+    文件被删除或修改（大小/修改时间变化，verify=True 时还校验内容的 sha256）后，对应的记录视为过期并被移除。
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        self.verify = verify
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS media ("
+                "extractor TEXT NOT NULL, video_id TEXT NOT NULL, format_id TEXT NOT NULL, "
+                "path TEXT NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL, "
+                "checksum TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (extractor, video_id, format_id))"
+            )
+
+    def lookup(self, extractor: str, video_id: str, format_id: str) -> Optional[ArchiveEntry]:
+        """查找已下载的文件并确认它没有变化（会查询数据库、读取文件，应在线程池中调用）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT extractor, video_id, format_id, path, size, mtime, checksum FROM media "
+                "WHERE extractor = ? AND video_id = ? AND format_id = ?",
+                (extractor, video_id, format_id),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        entry = ArchiveEntry(*row)
+        try:
+            st = os.stat(entry.path)
+            valid = st.st_size == entry.size and abs(st.st_mtime - entry.mtime) < 1e-3
+            # 大小和修改时间不变，内容也可能损坏或被原地改写，链接出去之前核对校验和
+            if valid and self.verify:
+                valid = file_checksum(entry.path) == entry.checksum
+        except OSError:
+            valid = False
+        if not valid:
+            self.stale += 1
+            self.misses += 1
+            self.remove(extractor, video_id, format_id)
+            return None
+        self.hits += 1
+        return entry
+
+    def record(self, extractor: str, video_id: str, format_id: str, path: str) -> ArchiveEntry:
+        """登记下载完成的文件（会读取整个文件计算校验和，应在线程池中调用）"""
+        path = os.path.abspath(path)
+        checksum = file_checksum(path)
+        st = os.stat(path)
+        entry = ArchiveEntry(extractor, video_id, format_id, path, st.st_size, st.st_mtime, checksum)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*entry, time.time()),
+            )
+        return entry
+
+    def remove(self, extractor: str, video_id: str, format_id: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM media WHERE extractor = ? AND video_id = ? AND format_id = ?",
+                (extractor, video_id, format_id),
+            )
+
+    @staticmethod
+    def materialize(entry: ArchiveEntry, dest_dir: str) -> Tuple[str, str]:
+        """把已有文件放到 dest_dir，返回 (目标路径, 方式)，方式为 existing/hardlink/reflink/copy"""
+        dest = os.path.join(dest_dir, os.path.basename(entry.path))
+        if os.path.exists(dest):
+            if os.path.samefile(dest, entry.path) or os.path.getsize(dest) == entry.size:
+                return dest, 'existing'
+            raise FileExistsError(f"目标文件已存在: {dest}")
+        try:
+            os.link(entry.path, dest)
+            return dest, 'hardlink'
+        except OSError:
+            pass
+        try:
+            _reflink(entry.path, dest)
+            return dest, 'reflink'
+        except OSError:
+            pass
+        shutil.copy2(entry.path, dest)
+        return dest, 'copy'
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM media").fetchone()
+        return {
+            'entries': count,
+            'total_bytes': total,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
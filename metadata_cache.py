@@ -0,0 +1,213 @@
+import functools
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import yt_dlp
+
+# 只有这些参数会影响提取结果本身；format 等选择类参数在本地处理阶段生效，不参与缓存 key
+EXTRACTION_OPTS = (
+    'http_headers', 'cookiefile', 'cookiesfrombrowser', 'proxy', 'geo_verification_proxy',
+    'geo_bypass', 'geo_bypass_country', 'extractor_args', 'username', 'password',
+    'age_limit', 'source_address', 'allowed_extractors',
+)
+
+# 签名流地址中的过期时间，如 googlevideo 的 ?expire=1700000000 或 /expire/1700000000/
+_EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d{9,11})')
+
+
+# 只按这些常见站点的提取器规范化 URL：逐个尝试全部提取器要匹配上千个正则，而 key 在事件循环中计算
+HOT_EXTRACTORS = ('Youtube', 'BiliBili', 'Vimeo', 'Twitter', 'TikTok', 'Instagram', 'Dailymotion')
+
+
+@functools.lru_cache(maxsize=None)
+def _hot_extractors():
+    return [yt_dlp.extractor.get_info_extractor(ie_key) for ie_key in HOT_EXTRACTORS]
+
+
+@functools.lru_cache(maxsize=4096)
+def video_key(url: str) -> str:
+    """把常见站点的 URL 规范化为 "提取器:视频ID"，同一视频的不同链接形式共用一个 key；其他站点直接使用 URL"""
+    for ie in _hot_extractors():
+        if ie.suitable(url):
+            video_id = ie.get_temp_id(url)
+            if video_id:
+                return f"{ie.ie_key()}:{video_id}"
+            break
+    return f"url:{url}"
+
+
+def opts_key(ydl_opts: dict) -> str:
+    return json.dumps({k: ydl_opts[k] for k in EXTRACTION_OPTS if k in ydl_opts},
+                      sort_keys=True, default=repr)
+
+
+def cache_key(url: str, ydl_opts: dict) -> str:
+    return f"{video_key(url)}|{opts_key(ydl_opts)}"
+
+
+def url_expiry(info: dict) -> Optional[float]:
+    """返回信息中最早过期的签名地址的时间戳，没有签名地址时返回 None"""
+    expiry = None
+    for f in info.get('formats') or [info]:
+        for field in ('url', 'manifest_url', 'fragment_base_url'):
+            m = _EXPIRE_RE.search(f.get(field) or '')
+            if m:
+                ts = float(m.group(1))
+                if expiry is None or ts < expiry:
+                    expiry = ts
+    return expiry
+
+
+def is_expired(info: dict, margin: float = 60) -> bool:
+    """签名地址是否已经（或将在 margin 秒内）过期"""
+    expiry = url_expiry(info)
+    return expiry is not None and expiry - margin <= time.time()
+
+
+def _dumps(info: dict) -> str:
+    # 双下划线开头的是 yt-dlp 的内部回调等对象，无法持久化
+    return json.dumps({k: v for k, v in info.items() if not k.startswith('__')}, default=repr)
+
+
+class SqliteCacheBackend:
+    """可选的磁盘缓存，进程重启后仍然有效"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata_cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM metadata_cache WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, data FROM metadata_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, expires_at: float, info: dict):
+        data = _dumps(info)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata_cache (key, expires_at, data) VALUES (?, ?, ?)",
+                (key, expires_at, data),
+            )
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM metadata_cache WHERE key = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MetadataCache:
+    """extract_info 结果的 LRU + TTL 缓存，TTL 不会超过签名流地址的过期时间"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 1800, expiry_margin: float = 60,
+                 backend: Optional[SqliteCacheBackend] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self._backend = backend
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def persistent(self) -> bool:
+        return self._backend is not None
+
+    def peek(self, key: str) -> Optional[dict]:
+        """只查内存，未命中时不计数；有磁盘缓存时由调用方在线程池中再调用 get()"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get(self, key: str) -> Optional[dict]:
+        """先查内存再查磁盘缓存（查磁盘会访问 SQLite，不应在事件循环中调用）"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+        if self._backend is not None:
+            entry = self._backend.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    with self._lock:
+                        self._store(key, entry)
+                        self.hits += 1
+                    return entry[1]
+                self._backend.delete(key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, info: dict):
+        """有磁盘缓存时会序列化并写入 SQLite，不应在事件循环中调用"""
+        expires_at = time.time() + self.ttl
+        expiry = url_expiry(info)
+        if expiry is not None:
+            expires_at = min(expires_at, expiry - self.expiry_margin)
+        if expires_at <= time.time():
+            return
+        with self._lock:
+            self._store(key, (expires_at, info))
+        if self._backend is not None:
+            self._backend.set(key, expires_at, info)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._backend is not None:
+            self._backend.delete(key)
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'persistent': self._backend is not None,
+            }
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
@@ -0,0 +1,301 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+from typing import Optional, Set
+
+import yt_dlp
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.utils import DownloadCancelled, determine_protocol
+
+# 小于该大小的文件不拆分，单连接下载
+MIN_SPLIT_SIZE = 4 << 20
+# 吞吐量提升不足该比例时停止增加连接数
+GROWTH_THRESHOLD = 1.1
+# 每隔多少秒评估一次吞吐量
+PROBE_INTERVAL = 0.5
+
+
+class _RangeError(Exception):
+    pass
+
+
+class ParallelHttpFD(HttpFD):
+    """多连接分段下载渐进式 HTTP 流
+
+    - 文件按 http_chunk_size 切成若干段，多个连接同时下载不同的段
+    - 每段直接写到 .part 文件中的对应偏移，内存占用只有每个连接的一个读取块
+    - 每段独立重试，从该段已写入的位置继续；已完成的段记录在 .part.ranges 中，中断后可续传
+    - 连接数从 2 开始，吞吐量随连接数增加而提升时翻倍，直到 concurrent_fragment_downloads
+    - 服务器不支持 Range 或文件较小时退回单连接下载
+    """
+
+    @staticmethod
+    def can_download(info_dict: dict, params: dict) -> bool:
+        return (
+            determine_protocol(info_dict) in ('http', 'https')
+            and not info_dict.get('request_data')
+            and not info_dict.get('section_start') and not info_dict.get('section_end')
+            and not params.get('external_downloader')
+            and (params.get('concurrent_fragment_downloads') or 1) > 1
+        )
+
+    def real_download(self, filename, info_dict):
+        max_connections = self.params.get('concurrent_fragment_downloads') or 1
+        headers = {'Accept-Encoding': 'identity', **(info_dict.get('http_headers') or {})}
+        if max_connections < 2 or 'Range' in headers or self.params.get('test'):
+            return super().real_download(filename, info_dict)
+
+        tmpfilename = self.temp_name(filename)
+        state_path = tmpfilename + '.ranges'
+        if os.path.exists(tmpfilename) and not os.path.exists(state_path):
+            # 单连接下载留下的 .part 文件，按原方式续传
+            return super().real_download(filename, info_dict)
+
+        try:
+            total, last_modified = self._probe(info_dict['url'], headers)
+        except (TransportError, _RangeError) as e:
+            self.write_debug(f'Parallel download not available: {e}')
+            total = None
+        if total is None or total < MIN_SPLIT_SIZE:
+            return super().real_download(filename, info_dict)
+
+        # 每个连接平均分到几段，后加入的连接也有活干，且最后几段不会只剩一个连接在下载
+        chunk_size = self.params.get('http_chunk_size') or (10 << 20)
+        chunk_size = max(1 << 20, min(chunk_size, -(-total // (max_connections * 4))))
+        n_chunks = -(-total // chunk_size)
+        done = self._load_state(state_path, total, chunk_size)
+        if not os.path.exists(tmpfilename):
+            done = set()
+        with open(tmpfilename, 'r+b' if os.path.exists(tmpfilename) else 'wb') as f:
+            f.truncate(total)
+
+        self.report_destination(filename)
+        transfer = _Transfer(
+            self, info_dict, filename, tmpfilename, state_path, headers, total,
+            chunk_size, n_chunks, done, max_connections,
+        )
+        transfer.run()
+
+        os.remove(state_path)
+        self.try_rename(tmpfilename, filename)
+        if self.params.get('updatetime', True):
+            info_dict['filetime'] = self.try_utime(filename, last_modified)
+        self._hook_progress({
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': filename,
+            'status': 'finished',
+            'elapsed': time.time() - transfer.start_time,
+            'ctx_id': info_dict.get('ctx_id'),
+        }, info_dict)
+        return True
+
+    def _probe(self, url, headers):
+        """请求第一个字节，确认服务器支持 Range 并得到文件总大小"""
+        with self.ydl.urlopen(Request(url, headers={**headers, 'Range': 'bytes=0-0'})) as resp:
+            content_range = resp.headers.get('Content-Range') or ''
+            m = re.match(r'bytes 0-0/(\d+)', content_range)
+            if resp.status != 206 or not m:
+                raise _RangeError('server does not support range requests')
+            return int(m.group(1)), resp.headers.get('Last-Modified')
+
+    @staticmethod
+    def _load_state(state_path, total, chunk_size) -> Set[int]:
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        if state.get('total') != total or state.get('chunk_size') != chunk_size:
+            return set()
+        return set(state.get('done') or ())
+
+
+class _Transfer:
+    """一次多连接下载的运行状态"""
+
+    def __init__(self, fd: ParallelHttpFD, info_dict, filename, tmpfilename, state_path, headers,
+                 total, chunk_size, n_chunks, done, max_connections):
+        self.fd = fd
+        self.info_dict = info_dict
+        self.url = info_dict['url']
+        self.filename = filename
+        self.tmpfilename = tmpfilename
+        self.state_path = state_path
+        self.headers = headers
+        self.total = total
+        self.chunk_size = chunk_size
+        self.n_chunks = n_chunks
+        self.done = done
+        self.max_connections = max_connections
+        self.retries = fd.params.get('fragment_retries', 10)
+        self.block_size = fd.params.get('buffersize') or 65536
+        self.pending: "queue.Queue[int]" = queue.Queue()
+        for index in range(n_chunks):
+            if index not in done:
+                self.pending.put(index)
+        self.downloaded = self.resumed = sum(self._chunk_len(i) for i in done)
+        # 从文件开头起连续完成的段数，之前的字节可以按顺序读取（用于边下边播）
+        self.frontier = 0
+        self._advance_frontier()
+        self.start_time = time.time()
+        # 目标连接数和当前运行的连接数
+        self.target = min(2, max_connections)
+        self.active = 0
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        # yt-dlp 的进度回调不是线程安全的，这里串行调用；回调中的暂停/限速会让所有连接一起等待
+        self._hook_lock = threading.Lock()
+
+    def _advance_frontier(self):
+        while self.frontier in self.done:
+            self.frontier += 1
+
+    def _chunk_len(self, index: int) -> int:
+        return min(self.chunk_size, self.total - index * self.chunk_size)
+
+    def run(self):
+        last_bytes, last_time = self.downloaded, time.monotonic()
+        best_rate = 0.0
+        growing = True
+        with self._cond:
+            self._spawn()
+        while True:
+            with self._cond:
+                if self._cond.wait_for(lambda: self.active == 0, PROBE_INTERVAL):
+                    break
+                now = time.monotonic()
+                rate = (self.downloaded - last_bytes) / (now - last_time)
+                last_bytes, last_time = self.downloaded, now
+                # 类似 TCP 慢启动：吞吐量明显提升时连接数翻倍，否则保持当前连接数
+                if (growing and self.error is None and self.target < self.max_connections
+                        and not self.pending.empty()):
+                    if rate > best_rate * GROWTH_THRESHOLD:
+                        self.target = min(self.max_connections, self.target * 2)
+                        self._spawn()
+                    else:
+                        growing = False
+                best_rate = max(best_rate, rate)
+        if self.error is not None:
+            raise self.error
+        if len(self.done) < self.n_chunks:
+            raise _RangeError('download stopped before all ranges were fetched')
+
+    def _spawn(self):
+        """启动连接直到达到目标连接数（调用方持有 self._cond）"""
+        while self.active < self.target:
+            self.active += 1
+            threading.Thread(target=self._worker, daemon=True,
+                             name=f'{threading.current_thread().name}-range{self.active}').start()
+
+    def _worker(self):
+        retired = False
+        try:
+            with open(self.tmpfilename, 'r+b') as f:
+                while self.error is None:
+                    with self._cond:
+                        if self.active > self.target:
+                            # 连接数超过目标（被限流后下调），当前连接退出
+                            self.active -= 1
+                            retired = True
+                            return
+                    try:
+                        index = self.pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    if not self._fetch_chunk(f, index):
+                        return
+                    with self._cond:
+                        self.done.add(index)
+                        self._advance_frontier()
+                        self._save_state()
+        except BaseException as e:
+            with self._cond:
+                if self.error is None:
+                    self.error = e
+        finally:
+            with self._cond:
+                if not retired:
+                    self.active -= 1
+                self._cond.notify_all()
+
+    def _fetch_chunk(self, f, index: int) -> bool:
+        """下载一段并写入文件，其他连接出错时返回 False"""
+        start = index * self.chunk_size
+        end = start + self._chunk_len(index)
+        pos = start
+        for attempt in range(self.retries + 1):
+            try:
+                request = Request(self.url, headers={**self.headers, 'Range': f'bytes={pos}-{end - 1}'})
+                with self.fd.ydl.urlopen(request) as resp:
+                    if resp.status != 206:
+                        raise _RangeError(f'unexpected status {resp.status} for range {pos}-{end - 1}')
+                    while pos < end:
+                        if self.error is not None:
+                            return False
+                        data = resp.read(min(self.block_size, end - pos))
+                        if not data:
+                            raise _RangeError(f'connection closed at byte {pos} of range {start}-{end - 1}')
+                        f.seek(pos)
+                        f.write(data)
+                        pos += len(data)
+                        self._report(len(data))
+                f.flush()
+                return True
+            except (TransportError, HTTPError, _RangeError, OSError) as e:
+                if attempt >= self.retries or isinstance(e, HTTPError) and e.status < 500 and e.status != 429:
+                    raise
+                self.fd.report_retry(e, attempt + 1, self.retries, frag_index=index + 1)
+                if isinstance(e, HTTPError) and e.status in (429, 503):
+                    # 上游限流，减少一个连接
+                    with self._cond:
+                        self.target = max(1, self.target - 1)
+                time.sleep(min(0.5 * 2 ** attempt, 8))
+        return False
+
+    def _save_state(self):
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'total': self.total, 'chunk_size': self.chunk_size, 'done': sorted(self.done)}, f)
+        os.replace(tmp, self.state_path)
+
+    def _report(self, n: int):
+        with self._hook_lock:
+            if self.error is not None:
+                raise DownloadCancelled('download aborted')
+            self.downloaded += n
+            now = time.time()
+            speed = self.fd.calc_speed(self.start_time, now, self.downloaded - self.resumed)
+            self.fd._hook_progress({
+                'status': 'downloading',
+                'downloaded_bytes': self.downloaded,
+                'total_bytes': self.total,
+                'tmpfilename': self.tmpfilename,
+                # .part 文件预分配了全部大小，只有这部分字节已按顺序写入
+                'contiguous_bytes': min(self.total, self.frontier * self.chunk_size),
+                'filename': self.filename,
+                'eta': self.fd.calc_eta(speed, self.total - self.downloaded),
+                'speed': speed,
+                'elapsed': now - self.start_time,
+                'ctx_id': self.info_dict.get('ctx_id'),
+            }, self.info_dict)
+
+
+class ParallelYoutubeDL(yt_dlp.YoutubeDL):
+    """渐进式 HTTP 流使用 ParallelHttpFD 下载，其余协议（DASH/HLS 分片等）保持 yt-dlp 默认行为"""
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if test or subtitle or name == '-' or not info.get('url') or not ParallelHttpFD.can_download(info, self.params):
+            return super().dl(name, info, subtitle=subtitle, test=test)
+        fd = ParallelHttpFD(self, self.params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
@@ -0,0 +1,246 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Set
+
+from scheduler import QUEUED, JobScheduler
+from ydl_pool import YoutubeDLPool
+
+logger = logging.getLogger('ytd.playlist')
+
+# 常用的格式策略，也可以直接传入 yt-dlp 的格式选择表达式
+FORMAT_POLICIES = {
+    'best': 'bestvideo+bestaudio/best',
+    'audio': 'bestaudio/best',
+    '1080p': 'bestvideo[height<=1080]+bestaudio/best[height<=1080]',
+    '720p': 'bestvideo[height<=720]+bestaudio/best[height<=720]',
+    '480p': 'bestvideo[height<=480]+bestaudio/best[height<=480]',
+}
+
+# 结束事件
+DONE = 'playlist_done'
+ERROR = 'playlist_error'
+
+# 顶层结果是指向其他地址的链接时（watch?v=…&list=…、标签页跳转、短链接）最多跟随的次数
+MAX_REDIRECTS = 5
+
+
+def iter_flat_entries(url: str, opts: dict, pool: YoutubeDLPool) -> Iterator[dict]:
+    """平铺提取播放列表/频道，逐条产出条目（只包含 URL、ID、标题等，不解析单个视频）
+
+    yt-dlp 的 entries 是按页请求的生成器，这里边遍历边产出，不会一次性把整个列表读入内存。
+    """
+    ydl_opts = {**opts, 'extract_flat': 'in_playlist', 'lazy_playlist': True, 'quiet': True}
+    with pool.acquire(ydl_opts) as ydl:
+        yield from _walk(_resolve(ydl, ydl.extract_info(url, download=False, process=False)))
+
+
+def _resolve(ydl, result: Optional[dict]) -> Optional[dict]:
+    """process=False 时链接类结果（_type 为 url/url_transparent）不会被跟随，先提取它指向的地址，
+    否则整个播放列表会被当作一个条目提交"""
+    for _ in range(MAX_REDIRECTS):
+        if result is None or result.get('_type') not in ('url', 'url_transparent'):
+            return result
+        result = ydl.extract_info(result['url'], ie_key=result.get('ie_key'), download=False, process=False)
+    return result
+
+
+def _walk(result: Optional[dict]) -> Iterator[dict]:
+    if result is None:
+        return
+    if result.get('_type') not in ('playlist', 'multi_video'):
+        yield result
+        return
+    # 嵌套的播放列表（如频道的各个标签页）按顺序展开
+    for entry in result.get('entries') or ():
+        yield from _walk(entry)
+
+
+def entry_url(entry: dict) -> Optional[str]:
+    return entry.get('webpage_url') or entry.get('url') or entry.get('original_url')
+
+
+class PlaylistIngest:
+    """一个播放列表的导入任务：边枚举边把条目交给下载队列"""
+
+    def __init__(self, ingest_id: str, url: str, format_selector: str, save_path: str):
+        self.id = ingest_id
+        self.url = url
+        self.format = format_selector
+        self.save_path = save_path
+        self.state = 'running'
+        self.discovered = 0
+        self.submitted = 0
+        self.skipped = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        # 本次导入提交的、仍在排队的任务
+        self.queued_ids: Set[str] = set()
+        self._listeners: Set[asyncio.Queue] = set()
+
+    def to_dict(self) -> dict:
+        return {
+            'ingest_id': self.id,
+            'url': self.url,
+            'format': self.format,
+            'save_path': self.save_path,
+            'state': self.state,
+            'discovered': self.discovered,
+            'submitted': self.submitted,
+            'skipped': self.skipped,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class PlaylistIngestor:
+    """播放列表/频道导入
+
+    - 平铺提取（extract_flat）按页枚举条目，每发现一个条目就提交到下载队列并推送事件
+    - 单个视频的完整解析推迟到该条目真正开始下载时（download_task 中）进行
+    - 每个导入任务最多有 window 个条目在队列中排队，超过时暂停枚举，因此内存占用与列表长度无关
+    """
+
+    def __init__(self, scheduler: JobScheduler, publish: Callable[[dict], None], extract_opts: dict,
+                 window: int = 100, max_active: int = 2, history_size: int = 50,
+                 pool: Optional[YoutubeDLPool] = None):
+        self.scheduler = scheduler
+        self.publish = publish
+        self.extract_opts = extract_opts
+        self.pool = pool or YoutubeDLPool(max_idle=max_active)
+        self.window = window
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_active, thread_name_prefix="playlist")
+        self._ingests: Dict[str, PlaylistIngest] = {}
+        self.history_size = history_size
+
+    def get(self, ingest_id: str) -> Optional[PlaylistIngest]:
+        return self._ingests.get(ingest_id)
+
+    def snapshot(self) -> list:
+        return [ingest.to_dict() for ingest in self._ingests.values()]
+
+    def start(self, url: str, format_selector: str, save_path: str,
+              submit: Callable[[str, str, int], Awaitable]) -> PlaylistIngest:
+        """开始导入；await submit(entry_url, download_id, index) 把条目提交到下载队列并返回 Job"""
+        ingest = PlaylistIngest(uuid.uuid4().hex[:12], url, format_selector, save_path)
+        self._ingests[ingest.id] = ingest
+        self._trim()
+        asyncio.create_task(self._run(ingest, submit))
+        return ingest
+
+    def cancel(self, ingest_id: str) -> bool:
+        ingest = self._ingests.get(ingest_id)
+        if ingest is None:
+            return False
+        ingest.cancel_event.set()
+        return True
+
+    def listen(self, ingest: PlaylistIngest, maxsize: int = 1000) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        ingest._listeners.add(queue)
+        return queue
+
+    def unlisten(self, ingest: PlaylistIngest, queue: asyncio.Queue):
+        ingest._listeners.discard(queue)
+
+    @staticmethod
+    def is_listening(ingest: PlaylistIngest, queue: asyncio.Queue) -> bool:
+        return queue in ingest._listeners
+
+    def _emit(self, ingest: PlaylistIngest, event: dict):
+        event = {'ingest_id': ingest.id, **event}
+        # WebSocket 客户端订阅 ingest_id 即可收到同样的事件
+        self.publish({**event, 'download_id': ingest.id})
+        for queue in list(ingest._listeners):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 读取太慢的 NDJSON 连接不再推送，导入继续
+                ingest._listeners.discard(queue)
+
+    async def _run(self, ingest: PlaylistIngest, submit):
+        loop = asyncio.get_running_loop()
+
+        def produce():
+            for index, entry in enumerate(iter_flat_entries(ingest.url, self.extract_opts, self.pool)):
+                if ingest.cancel_event.is_set():
+                    return
+                # 阻塞枚举线程直到条目提交完成（包括等待排队窗口），形成背压
+                future = asyncio.run_coroutine_threadsafe(self._on_entry(ingest, index, entry, submit), loop)
+                while True:
+                    try:
+                        future.result(timeout=1)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        if ingest.cancel_event.is_set():
+                            future.cancel()
+                            return
+
+        try:
+            await loop.run_in_executor(self._pool, produce)
+            ingest.state = 'cancelled' if ingest.cancel_event.is_set() else 'done'
+            self._emit(ingest, {'status': DONE, **ingest.to_dict()})
+        except Exception as e:
+            ingest.state = 'failed'
+            ingest.error = str(e)
+            logger.warning("播放列表导入失败", extra={'url': ingest.url, 'ingest_id': ingest.id, 'error': str(e)})
+            self._emit(ingest, {'status': ERROR, 'error': str(e), **ingest.to_dict()})
+        finally:
+            ingest.finished_at = time.time()
+
+    async def _on_entry(self, ingest: PlaylistIngest, index: int, entry: dict, submit):
+        ingest.discovered += 1
+        url = entry_url(entry)
+        download_id = f"{ingest.id}-{index}"
+        event = {
+            'status': 'playlist_entry',
+            'index': index,
+            'id': entry.get('id'),
+            'title': entry.get('title'),
+            'url': url,
+            'entry_download_id': download_id,
+        }
+        if not url:
+            ingest.skipped += 1
+            self._emit(ingest, {**event, 'state': 'skipped'})
+            return
+        await self._wait_window(ingest)
+        if ingest.cancel_event.is_set():
+            return
+        try:
+            job = await submit(url, download_id, index)
+        except Exception as e:
+            ingest.skipped += 1
+            self._emit(ingest, {**event, 'state': 'skipped', 'error': str(e)})
+            return
+        ingest.submitted += 1
+        ingest.queued_ids.add(download_id)
+        self._emit(ingest, {**event, 'state': job.state,
+                            'queue_position': self.scheduler.queue_position(download_id)})
+
+    async def _wait_window(self, ingest: PlaylistIngest):
+        while not ingest.cancel_event.is_set():
+            for download_id in list(ingest.queued_ids):
+                job = self.scheduler.get(download_id)
+                if job is None or job.state != QUEUED:
+                    ingest.queued_ids.discard(download_id)
+            if len(ingest.queued_ids) < self.window:
+                return
+            await asyncio.sleep(0.5)
+
+    def _trim(self):
+        """只保留最近的已结束导入记录"""
+        finished = [i for i in self._ingests.values() if i.finished_at is not None]
+        for ingest in finished[:max(0, len(finished) - self.history_size)]:
+            del self._ingests[ingest.id]
+
+    def shutdown(self):
+        for ingest in self._ingests.values():
+            ingest.cancel_event.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import yt_dlp
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+
+from parallel_download import ParallelYoutubeDL
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_capabilities() -> dict:
+    """探测 ffmpeg/ffprobe 的版本和特性，进程内只执行一次
+
+    yt-dlp 按可执行文件路径缓存探测结果，这里探测后后处理器也不会再为每个下载启动 ffmpeg -version 子进程。
+    """
+    versions, features = FFmpegPostProcessor.get_versions_and_features()
+    return {
+        'available': bool(versions.get('ffmpeg')),
+        'ffmpeg': versions.get('ffmpeg'),
+        'ffprobe': versions.get('ffprobe'),
+        'features': features,
+    }
+
+
+class PipelinedYoutubeDL(ParallelYoutubeDL):
+    """下载完成后不立即运行后处理（ffmpeg 合并、修复等），记录下来由 run_deferred() 在后处理阶段执行"""
+
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.deferred = []
+
+    def on_checkout(self):
+        # 从实例池借出时清除上一个任务遗留的后处理
+        self.deferred = []
+
+    def post_process(self, filename, info, files_to_move=None):
+        info['filepath'] = filename
+        self.deferred.append((filename, info, files_to_move))
+        return info
+
+    @property
+    def needs_pipeline(self) -> bool:
+        """是否有需要调用 ffmpeg 的后处理（合并格式、修复容器、转码等）"""
+        return bool(self.deferred) and (
+            bool(self._pps['post_process']) or any(info.get('__postprocessors') for _, info, _ in self.deferred)
+        )
+
+    def run_deferred(self) -> List[str]:
+        """执行推迟的后处理，返回最终文件路径"""
+        paths = []
+        while self.deferred:
+            filename, info, files_to_move = self.deferred.pop(0)
+            info = yt_dlp.YoutubeDL.post_process(self, filename, info, files_to_move)
+            paths.append(info['filepath'])
+        return paths
+
+
+class PostProcessPipeline:
+    """下载流水线的后处理阶段
+
+    ffmpeg 合并在独立的线程池中排队执行（每个线程驱动一个 ffmpeg 子进程，线程数默认为 CPU 核数），
+    下载线程下载完成后立即返回，可以开始下一个下载。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="postprocess")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def depth(self) -> int:
+        """排队中和执行中的后处理数"""
+        return self.queued + self.running
+
+    async def run(self, ydl: PipelinedYoutubeDL, on_start: Optional[Callable[[float], None]] = None) -> dict:
+        """执行 ydl 推迟的后处理，返回最终文件路径和排队/执行耗时；on_start 在开始执行时以排队秒数调用"""
+        submitted = time.monotonic()
+        with self._lock:
+            self.queued += 1
+
+        def job():
+            started = time.monotonic()
+            wait = started - submitted
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.wait_seconds += wait
+            ok = False
+            try:
+                if on_start is not None:
+                    on_start(wait)
+                paths = ydl.run_deferred()
+                ok = True
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    self.running -= 1
+                    self.run_seconds += elapsed
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+            return {'paths': paths, 'wait': wait, 'run': elapsed}
+
+        return await asyncio.get_running_loop().run_in_executor(self._pool, job)
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                'workers': self.max_workers,
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_wait_seconds': self.wait_seconds / finished if finished else 0.0,
+                'avg_run_seconds': self.run_seconds / finished if finished else 0.0,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
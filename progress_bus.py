@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+
+logger = logging.getLogger('ytd.ws')
+
+
+class _Connection:
+    """单个 WebSocket 连接：自己的有界发送队列和发送任务"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender: Optional[asyncio.Task] = None
+        self.topics: Set[str] = set()
+
+
+class ProgressBus:
+    """下载进度事件总线
+
+    - publish() 可在任意线程调用，只入队不等待网络发送
+    - 同一 download_id 的 downloading 事件按 max_rate 合并，只发送最新的一条
+    - 每个连接有独立的有界队列和发送任务，队列满（消费太慢）的连接会被断开
+    - 连接只接收自己订阅的 download_id；订阅时先补发该下载最近的几条状态
+    """
+
+    def __init__(self, max_rate: float = 4.0, queue_size: int = 100, send_timeout: float = 5.0,
+                 history_size: int = 8, max_topics: int = 1024,
+                 on_send: Optional[Callable[[float], None]] = None,
+                 relay: Optional[Callable[[List[dict]], None]] = None):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.history_size = history_size
+        self.max_topics = max_topics
+        self._connections: Dict[WebSocket, _Connection] = {}
+        self._subscribers: Dict[str, Set[_Connection]] = {}
+        # download_id -> 最近发送过的事件，用于重连后的状态补发
+        self._history: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        # download_id -> 最新的进度事件（latest-wins）
+        self._pending: Dict[str, dict] = {}
+        # 状态变化事件（完成/出错/暂停等）不合并，按顺序尽快发送
+        self._urgent = []
+        self._last_sent: Dict[str, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.dropped_connections = 0
+        self.sent_messages = 0
+        # 每条消息发送完成时以排队到发送完成的秒数调用（用于监控广播延迟）
+        self.on_send = on_send
+        # 多进程部署时把本进程发出的事件（合并限频之后）转发给其他进程
+        self.relay = relay
+        # 其他进程转发来的事件，已经合并限频过，直接推送
+        self._remote: List[dict] = []
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+        for conn in list(self._connections.values()):
+            if conn.sender is not None:
+                conn.sender.cancel()
+        self._connections.clear()
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        conn = _Connection(websocket, self.queue_size)
+        conn.sender = asyncio.create_task(self._send_loop(conn))
+        self._connections[websocket] = conn
+        logger.debug("WebSocket 已连接", extra={'connections': len(self._connections)})
+
+    async def disconnect(self, websocket: WebSocket):
+        conn = self._connections.get(websocket)
+        self._drop(websocket)
+        if conn is not None and conn.sender is not None:
+            # 等待发送任务真正退出，避免遗留挂起的任务
+            await asyncio.gather(conn.sender, return_exceptions=True)
+
+    def _drop(self, websocket: WebSocket):
+        conn = self._connections.pop(websocket, None)
+        if conn is None:
+            return
+        self._unsubscribe(conn, list(conn.topics))
+        if conn.sender is not None and conn.sender is not asyncio.current_task():
+            conn.sender.cancel()
+        logger.debug("WebSocket 已断开", extra={'connections': len(self._connections)})
+
+    def subscribe(self, websocket: WebSocket, download_ids: Iterable[str]):
+        """订阅下载进度，并立即补发每个下载最近的状态"""
+        conn = self._connections.get(websocket)
+        if conn is None:
+            return
+        for download_id in download_ids:
+            if download_id in conn.topics:
+                continue
+            conn.topics.add(download_id)
+            self._subscribers.setdefault(download_id, set()).add(conn)
+            for message in self._history.get(download_id, ()):
+                self._enqueue(conn, message)
+
+    def unsubscribe(self, websocket: WebSocket, download_ids: Iterable[str]):
+        conn = self._connections.get(websocket)
+        if conn is not None:
+            self._unsubscribe(conn, download_ids)
+
+    def _unsubscribe(self, conn: _Connection, download_ids: Iterable[str]):
+        for download_id in download_ids:
+            conn.topics.discard(download_id)
+            subscribers = self._subscribers.get(download_id)
+            if subscribers is not None:
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self._subscribers[download_id]
+
+    def snapshot(self, download_id: str) -> Optional[dict]:
+        """返回某个下载最近一次发送的状态"""
+        history = self._history.get(download_id)
+        return json.loads(history[-1]) if history else None
+
+    @property
+    def active_connections(self):
+        return list(self._connections)
+
+    def publish(self, event: dict):
+        """线程安全、非阻塞地发布事件"""
+        download_id = event.get('download_id')
+        with self._lock:
+            if event.get('status') == 'downloading' and download_id is not None:
+                self._pending[download_id] = event
+            else:
+                # 状态变化之后不再发送旧的进度
+                self._pending.pop(download_id, None)
+                self._urgent.append(event)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def deliver(self, events: List[dict]):
+        """推送其他进程转发来的事件，不再合并也不再转发"""
+        with self._lock:
+            self._remote.extend(events)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            delay = self._flush()
+            # 只保留一个定时器，限速期间的重复唤醒不会堆积
+            if delay is not None and self._timer is None:
+                self._timer = self._loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._wakeup.set()
+
+    def _flush(self) -> Optional[float]:
+        """发送到期的事件，返回距离下一条被限速事件可发送还需等待的秒数"""
+        now = time.monotonic()
+        next_delay = None
+        ready = []
+        with self._lock:
+            urgent, self._urgent = self._urgent, []
+            remote, self._remote = self._remote, []
+            for download_id, event in list(self._pending.items()):
+                wait = self._last_sent.get(download_id, 0.0) + self.min_interval - now
+                if wait > 0:
+                    next_delay = wait if next_delay is None else min(next_delay, wait)
+                    continue
+                del self._pending[download_id]
+                self._last_sent[download_id] = now
+                ready.append(event)
+            for event in urgent:
+                self._last_sent.pop(event.get('download_id'), None)
+        if self.relay is not None and (urgent or ready):
+            self.relay(urgent + ready)
+        for event in urgent + ready + remote:
+            message = json.dumps(event)
+            download_id = event.get('download_id')
+            if download_id is None:
+                targets = self._connections.values()
+            else:
+                self._remember(download_id, message)
+                targets = self._subscribers.get(download_id, ())
+            for conn in list(targets):
+                self._enqueue(conn, message)
+        return next_delay
+
+    def _remember(self, download_id: str, message: str):
+        history = self._history.get(download_id)
+        if history is None:
+            history = self._history[download_id] = deque(maxlen=self.history_size)
+            while len(self._history) > self.max_topics:
+                self._history.popitem(last=False)
+        else:
+            self._history.move_to_end(download_id)
+        history.append(message)
+
+    def _enqueue(self, conn: _Connection, message: str):
+        try:
+            conn.queue.put_nowait((message, time.monotonic()))
+        except asyncio.QueueFull:
+            logger.warning("WebSocket 客户端消费太慢，断开连接")
+            self.dropped_connections += 1
+            self._drop(conn.websocket)
+            asyncio.create_task(self._close(conn.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    async def _send_loop(self, conn: _Connection):
+        try:
+            # 连接被移除后退出（wait_for 在发送恰好完成时可能吞掉取消）
+            while self._connections.get(conn.websocket) is conn:
+                message, queued_at = await conn.queue.get()
+                await asyncio.wait_for(conn.websocket.send_text(message), self.send_timeout)
+                self.sent_messages += 1
+                if self.on_send is not None:
+                    self.on_send(time.monotonic() - queued_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("发送 WebSocket 消息失败", extra={'error': str(e)})
+            self._drop(conn.websocket)
@@ -0,0 +1,280 @@
+import random
+import re
+import ssl
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import yt_dlp
+
+# 错误分类
+PERMANENT = 'permanent'  # 视频不存在、私享、已删除、地区限制等，重试没有意义
+THROTTLED = 'throttled'  # 上游限流（429/403）
+TRANSIENT = 'transient'  # 超时、连接中断、5xx 等临时错误
+LOCAL = 'local'          # 本地错误（磁盘、ffmpeg 等），与上游无关
+
+_PERMANENT_MESSAGES = re.compile(
+    r"private video|video unavailable|has been removed|no longer available|does not exist|"
+    r"not available in your country|geo.?restrict|unsupported url|members.only|"
+    r"account .*terminated|HTTP Error (?:404|410)\b",
+    re.I,
+)
+_THROTTLED_MESSAGES = re.compile(r"HTTP Error (?:429|403)\b|too many requests|rate.?limit|not a bot", re.I)
+_NETWORK_ERRORS = (ConnectionError, TimeoutError, ssl.SSLError)
+
+
+def _chain(exc: BaseException) -> Iterator[BaseException]:
+    """异常本身以及它包装的原因（yt-dlp 的 exc_info/cause 和 Python 的 __cause__）"""
+    seen = set()
+    pending = [exc]
+    while pending:
+        e = pending.pop()
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        yield e
+        exc_info = getattr(e, 'exc_info', None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1:
+            pending.append(exc_info[1])
+        pending.extend(c for c in (getattr(e, 'cause', None), e.__cause__, e.__context__)
+                       if isinstance(c, BaseException))
+
+
+def _status(e: BaseException) -> Optional[int]:
+    if 'HTTPError' not in type(e).__name__:
+        return None
+    status = getattr(e, 'status', None) or getattr(e, 'code', None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(exc: BaseException) -> str:
+    """按异常链判断失败类型：PERMANENT/THROTTLED/TRANSIENT/LOCAL"""
+    upstream = False
+    for e in _chain(exc):
+        if isinstance(e, (yt_dlp.utils.GeoRestrictedError, yt_dlp.utils.UnsupportedError)):
+            return PERMANENT
+        status = _status(e)
+        if status in (404, 410):
+            return PERMANENT
+        if status in (403, 429):
+            return THROTTLED
+        if status is not None or isinstance(e, (yt_dlp.utils.YoutubeDLError, *_NETWORK_ERRORS)):
+            upstream = True
+    message = str(exc)
+    if _PERMANENT_MESSAGES.search(message):
+        return PERMANENT
+    if _THROTTLED_MESSAGES.search(message):
+        return THROTTLED
+    return TRANSIENT if upstream else LOCAL
+
+
+class RetryPolicy:
+    """任务级重试：指数退避加随机抖动，限流错误的退避更长；永久错误和本地错误不重试"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 5.0, max_delay: float = 300.0,
+                 throttle_factor: float = 4.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_factor = throttle_factor
+
+    def delay(self, attempt: int, kind: str) -> Optional[float]:
+        """第 attempt 次重试（从 0 开始）前等待的秒数，不再重试时返回 None"""
+        if kind not in (THROTTLED, TRANSIENT) or attempt >= self.max_retries:
+            return None
+        base = self.base_delay * (self.throttle_factor if kind == THROTTLED else 1)
+        ceiling = min(self.max_delay, base * 2 ** attempt)
+        # 一半固定、一半随机：同时失败的任务不会同时重试，也不会几乎立即重试
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class NegativeCache:
+    """短期记住永久不可用的URL，重复请求直接返回上次的错误，不再访问上游"""
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+
+    def get(self, url: str) -> Optional[Tuple[str, float]]:
+        """返回 (错误信息, 剩余有效秒数)"""
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        remaining = entry[0] - time.monotonic()
+        if remaining <= 0:
+            del self._entries[url]
+            return None
+        self.hits += 1
+        return entry[1], remaining
+
+    def set(self, url: str, message: str):
+        if self.ttl <= 0:
+            return
+        self._entries[url] = (time.monotonic() + self.ttl, message)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 熔断器状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """单个上游主机的熔断器
+
+    连续 threshold 次限流或临时错误后打开，cooldown 秒内不再向该主机发请求；冷却结束后半开，
+    只放行一个探测请求：成功则关闭，失败则重新打开并把冷却时间加倍（不超过 max_cooldown）。
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 600.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self._open_until = 0.0
+        # 探测请求没有结果（例如被取消）时，超过这个时间放行下一个探测
+        self._probe_until = 0.0
+
+    def wait(self, probe: bool = True) -> float:
+        """需要等待的秒数，0 表示可以发请求；半开状态下 probe=True 会占用探测名额"""
+        if self.state == CLOSED:
+            return 0.0
+        now = time.monotonic()
+        if now < self._open_until:
+            return self._open_until - now
+        if now < self._probe_until:
+            return self._probe_until - now
+        self.state = HALF_OPEN
+        if probe:
+            self._probe_until = now + self.base_cooldown
+        return 0.0
+
+    def success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self._probe_until = 0.0
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+        elif self.state == OPEN or self.failures < self.threshold:
+            return
+        self.state = OPEN
+        self.trips += 1
+        self._open_until = time.monotonic() + self.cooldown
+        self._probe_until = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'trips': self.trips,
+            'cooldown': self.cooldown,
+            'retry_in': round(max(0.0, self._open_until - time.monotonic()), 1) if self.state == OPEN else 0,
+        }
+
+
+class UpstreamUnavailable(Exception):
+    """没有访问上游：URL 在负缓存中（reason='unavailable'），或上游主机已熔断（reason='circuit_open'）"""
+
+    def __init__(self, reason: str, message: str, retry_after: float):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after + 0.999))
+        # 已经分类过，UpstreamGuard.record_failure 不再重复计数
+        self._upstream_kind = PERMANENT if reason == 'unavailable' else THROTTLED
+
+
+class UpstreamGuard:
+    """负缓存和按主机的熔断器（只在事件循环中使用）"""
+
+    def __init__(self, negative_ttl: float = 600.0, threshold: int = 5, cooldown: float = 30.0,
+                 max_cooldown: float = 600.0):
+        self.negative = NegativeCache(negative_ttl)
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.failures: Dict[str, int] = {PERMANENT: 0, THROTTLED: 0, TRANSIENT: 0, LOCAL: 0}
+        self.shed = 0
+
+    @staticmethod
+    def host(url: str) -> Optional[str]:
+        return urlparse(url).hostname
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.threshold, self.cooldown, self.max_cooldown)
+        return breaker
+
+    def check_negative(self, url: str):
+        cached = self.negative.get(url)
+        if cached is not None:
+            raise UpstreamUnavailable('unavailable', cached[0], cached[1])
+
+    def check(self, url: str):
+        """访问上游之前调用，不应访问时抛出 UpstreamUnavailable"""
+        self.check_negative(url)
+        host = self.host(url)
+        wait = self.host_wait(host) if host else 0
+        if wait > 0:
+            self.shed += 1
+            raise UpstreamUnavailable('circuit_open', f"上游 {host} 暂时不可用，请稍后重试", wait)
+
+    def host_wait(self, host: str) -> float:
+        """主机熔断时需要等待的秒数；半开时第一个调用方作为探测请求放行"""
+        breaker = self._breakers.get(host)
+        return 0.0 if breaker is None else breaker.wait()
+
+    def record_success(self, url: str):
+        breaker = self._breakers.get(self.host(url))
+        if breaker is not None:
+            breaker.success()
+
+    def record_failure(self, url: str, exc: BaseException) -> str:
+        """记录一次失败并返回它的类型；同一个异常只记录一次"""
+        kind = getattr(exc, '_upstream_kind', None)
+        if kind is not None:
+            return kind
+        kind = classify_error(exc)
+        try:
+            exc._upstream_kind = kind
+        except AttributeError:
+            pass
+        self.failures[kind] += 1
+        if kind == PERMANENT:
+            self.negative.set(url, str(exc))
+        elif kind in (THROTTLED, TRANSIENT):
+            host = self.host(url)
+            if host:
+                self._breaker(host).failure()
+        return kind
+
+    def breaker_states(self) -> Dict[str, str]:
+        return {host: breaker.state for host, breaker in self._breakers.items()}
+
+    def stats(self) -> dict:
+        return {
+            'negative_cache': {'entries': len(self.negative), 'hits': self.negative.hits, 'ttl': self.negative.ttl},
+            'failures': dict(self.failures),
+            'shed': self.shed,
+            # 只列出出现过失败或熔断过的主机
+            'hosts': {
+                host: b.to_dict() for host, b in self._breakers.items() if b.failures or b.trips or b.state != CLOSED
+            },
+        }
@@ -0,0 +1,270 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+# 下载阶段已结束、正在后处理（合并等），不再占用下载并发名额
+POSTPROCESSING = 'postprocessing'
+# 失败后等待重试，不占用并发名额
+RETRY_WAIT = 'retry_wait'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# 优先级，数值越小越先执行
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+
+class RetryJob(Exception):
+    """任务函数抛出该异常表示 delay 秒后重新排队执行"""
+
+    def __init__(self, delay: float, error: str):
+        super().__init__(error)
+        self.delay = delay
+
+
+class Job:
+    def __init__(self, job_id: str, fn: Callable[['Job'], Awaitable], client: str,
+                 priority: str, host: Optional[str]):
+        self.id = job_id
+        self.fn = fn
+        self.client = client
+        self.priority = priority
+        self.host = host
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 运行中的任务通过该事件通知下载线程中止
+        self.cancel_event = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+        # 已重试的次数和下一次重试的时间
+        self.attempts = 0
+        self.retry_at: Optional[float] = None
+        self._retry_timer: Optional[asyncio.TimerHandle] = None
+
+    def to_dict(self) -> dict:
+        return {
+            'download_id': self.id,
+            'state': self.state,
+            'priority': self.priority,
+            'client': self.client,
+            'host': self.host,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'attempts': self.attempts,
+            'retry_at': self.retry_at,
+        }
+
+
+class JobScheduler:
+    """下载任务调度器
+
+    - 按优先级调度；同一优先级内按客户端轮转，每个客户端内部先进先出
+    - 限制全局并发数和单个上游主机的并发数（per_host_limit <= 0 表示不单独限制）
+    - 可取消排队中、等待重试和运行中的任务；正在后处理的任务不能取消
+    - 任务可以在结束前通过 release() 提前让出并发名额（例如下载完成、只剩后处理时）
+    - 任务函数抛出 RetryJob 时让出名额，等待指定时间后回到队首重新执行
+    - host_gate(host) 返回大于 0 的秒数时该主机的任务暂不启动（例如上游熔断），到时自动重新调度
+    """
+
+    def __init__(self, max_concurrent: int = 4, per_host_limit: int = 0, history_size: int = 100,
+                 host_gate: Optional[Callable[[str], float]] = None):
+        self.max_concurrent = max_concurrent
+        self.per_host_limit = per_host_limit
+        self.host_gate = host_gate
+        self._gate_timer: Optional[asyncio.TimerHandle] = None
+        self._gate_wait: Optional[float] = None
+        # priority -> client -> 该客户端排队中的任务
+        self._queues: Dict[int, "OrderedDict[str, Deque[Job]]"] = {
+            p: OrderedDict() for p in sorted(PRIORITIES.values())
+        }
+        self._jobs: Dict[str, Job] = {}
+        self._running: Dict[str, Job] = {}
+        self._host_running: Dict[str, int] = {}
+        self._history: Deque[Job] = deque(maxlen=history_size)
+        # 服务关闭时中断的任务不算取消，重启后需要恢复
+        self.stopping = False
+
+    def submit(self, job_id: str, fn: Callable[[Job], Awaitable], client: str = 'anonymous',
+               priority: str = 'normal', host: Optional[str] = None) -> Job:
+        if job_id in self._jobs:
+            raise ValueError(f"Job already exists: {job_id}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Invalid priority: {priority}")
+        job = Job(job_id, fn, client, priority, host)
+        self._jobs[job_id] = job
+        self._queues[PRIORITIES[priority]].setdefault(client, deque()).append(job)
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务；不存在或正在后处理的任务返回 False"""
+        job = self._jobs.get(job_id)
+        if job is None or job.state == POSTPROCESSING:
+            # 后处理不检查 cancel_event，总会执行完成，不能再标记为已取消
+            return False
+        job.cancel_event.set()
+        if job.state == RETRY_WAIT:
+            job._retry_timer.cancel()
+            self._finish(job, CANCELLED)
+        elif job.state == QUEUED:
+            client_queue = self._queues[PRIORITIES[job.priority]].get(job.client)
+            if client_queue is not None:
+                client_queue.remove(job)
+                if not client_queue:
+                    del self._queues[PRIORITIES[job.priority]][job.client]
+            self._finish(job, CANCELLED)
+        # 运行中的任务由下载线程在下一次进度回调时检查 cancel_event 并中止
+        return True
+
+    def _host_available(self, host: Optional[str]) -> bool:
+        if self.per_host_limit <= 0 or host is None:
+            return True
+        return self._host_running.get(host, 0) < self.per_host_limit
+
+    def _next_job(self) -> Optional[Job]:
+        for clients in self._queues.values():
+            for client, client_queue in list(clients.items()):
+                job = client_queue[0]
+                if not self._host_available(job.host):
+                    continue
+                if self.host_gate is not None and job.host is not None:
+                    wait = self.host_gate(job.host)
+                    if wait > 0:
+                        self._gate_wait = wait if self._gate_wait is None else min(self._gate_wait, wait)
+                        continue
+                client_queue.popleft()
+                # 轮转到队尾，保证同一优先级内各客户端公平
+                del clients[client]
+                if client_queue:
+                    clients[client] = client_queue
+                return job
+        return None
+
+    def _dispatch(self):
+        self._gate_wait = None
+        while not self.stopping and len(self._running) < self.max_concurrent:
+            job = self._next_job()
+            if job is None:
+                break
+            job.state = RUNNING
+            job.started_at = time.time()
+            self._running[job.id] = job
+            if job.host is not None:
+                self._host_running[job.host] = self._host_running.get(job.host, 0) + 1
+            job.task = asyncio.create_task(self._run(job))
+        if self._gate_wait is not None and self._gate_timer is None:
+            # 被 host_gate 挡住的任务到时重新调度
+            self._gate_timer = asyncio.get_running_loop().call_later(self._gate_wait, self._gate_expired)
+
+    def _gate_expired(self):
+        self._gate_timer = None
+        self._dispatch()
+
+    async def _run(self, job: Job):
+        state = DONE
+        retry_delay = None
+        try:
+            await job.fn(job)
+        except asyncio.CancelledError:
+            state = CANCELLED
+        except RetryJob as e:
+            retry_delay = e.delay
+            job.error = str(e)
+        except Exception as e:
+            state = FAILED
+            job.error = str(e)
+        if job.cancel_event.is_set():
+            state = CANCELLED
+            retry_delay = None
+        self._release_slot(job)
+        if retry_delay is not None and not self.stopping:
+            job.state = RETRY_WAIT
+            job.attempts += 1
+            job.retry_at = time.time() + retry_delay
+            job._retry_timer = asyncio.get_running_loop().call_later(retry_delay, self._requeue, job)
+        else:
+            self._finish(job, FAILED if retry_delay is not None else state)
+        self._dispatch()
+
+    def _requeue(self, job: Job):
+        if self._jobs.get(job.id) is not job or job.state != RETRY_WAIT:
+            return
+        job.state = QUEUED
+        job.retry_at = None
+        # 排在该客户端队列的最前面，保持原来的先后顺序
+        self._queues[PRIORITIES[job.priority]].setdefault(job.client, deque()).appendleft(job)
+        self._dispatch()
+
+    def release(self, job_id: str) -> bool:
+        """运行中的任务让出并发名额，进入后处理状态，排队中的下一个任务可以开始"""
+        job = self._running.get(job_id)
+        if job is None:
+            return False
+        self._release_slot(job)
+        job.state = POSTPROCESSING
+        self._dispatch()
+        return True
+
+    def _release_slot(self, job: Job):
+        if self._running.pop(job.id, None) is None:
+            return
+        if job.host is not None:
+            self._host_running[job.host] -= 1
+            if not self._host_running[job.host]:
+                del self._host_running[job.host]
+
+    def _finish(self, job: Job, state: str):
+        job.state = state
+        job.finished_at = time.time()
+        self._jobs.pop(job.id, None)
+        self._history.append(job)
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        for position, job in enumerate(self.queued()):
+            if job.id == job_id:
+                return position
+        return None
+
+    def running(self) -> List[Job]:
+        return list(self._running.values())
+
+    def retrying(self) -> List[Job]:
+        return [job for job in self._jobs.values() if job.state == RETRY_WAIT]
+
+    def queued(self) -> List[Job]:
+        """按预计执行顺序列出排队中的任务（不考虑主机并发限制）"""
+        result = []
+        for clients in self._queues.values():
+            queues = [list(q) for q in clients.values()]
+            # 模拟客户端轮转
+            for i in range(max((len(q) for q in queues), default=0)):
+                result.extend(q[i] for q in queues if i < len(q))
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            'max_concurrent': self.max_concurrent,
+            'per_host_limit': self.per_host_limit,
+            'running': [job.to_dict() for job in self._running.values()],
+            'postprocessing': [job.to_dict() for job in self._jobs.values() if job.state == POSTPROCESSING],
+            'retrying': [job.to_dict() for job in self.retrying()],
+            'queued': [job.to_dict() for job in self.queued()],
+            'finished': [job.to_dict() for job in reversed(self._history)],
+        }
+
+    async def stop(self):
+        self.stopping = True
+        for job in list(self._jobs.values()):
+            job.cancel_event.set()
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger('ytd.state')
+
+# 控制命令：暂停、恢复、取消、调整单任务限速
+COMMANDS = ('pause', 'resume', 'cancel', 'rate')
+
+EventsHandler = Callable[[List[dict]], None]
+CommandHandler = Callable[[str, str, dict], Awaitable]
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LocalStateBackend:
+    """单进程使用的状态后端：任务只在本进程中，没有需要转发的命令和事件"""
+
+    shared = False
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or default_worker_id()
+        self._jobs: Dict[str, str] = {}
+
+    def start(self, loop: asyncio.AbstractEventLoop, on_events: EventsHandler, on_command: CommandHandler):
+        pass
+
+    def register(self, download_id: str):
+        self._jobs[download_id] = self.worker_id
+
+    def claim(self, download_id: str) -> bool:
+        self.register(download_id)
+        return True
+
+    def unregister(self, download_id: str):
+        self._jobs.pop(download_id, None)
+
+    def owner(self, download_id: str) -> Optional[str]:
+        return self._jobs.get(download_id)
+
+    def jobs(self) -> List[dict]:
+        return [{'download_id': d, 'worker': w} for d, w in self._jobs.items()]
+
+    def send_command(self, worker_id: str, download_id: str, command: str, **data):
+        raise RuntimeError("单进程模式下没有其他工作进程")
+
+    def publish(self, events: List[dict]):
+        pass
+
+    def stats(self) -> dict:
+        return {'backend': 'local', 'worker_id': self.worker_id, 'jobs': len(self._jobs)}
+
+    def close(self):
+        self._jobs.clear()
+
+
+class SqliteStateBackend:
+    """多个工作进程（uvicorn --workers N）通过同一个 SQLite 文件共享状态，不需要外部服务
+
+    - jobs 表：下载任务由哪个工作进程执行；控制请求落到其他进程时按此转发
+    - commands 表：发给某个工作进程的控制命令，目标进程轮询执行后删除
+    - events 表：各进程合并限频后的进度事件，其他进程轮询后推送给自己的 WebSocket 连接
+    - workers 表：心跳，超过 worker_timeout 没有心跳的进程视为已退出，它的任务可以被其他进程接管
+
+    所有数据库读写都在一个后台线程中批量进行（注册和查询任务除外），事件循环只做入队。
+    """
+
+    shared = True
+
+    def __init__(self, path: str, worker_id: Optional[str] = None, poll_interval: float = 0.1,
+                 worker_timeout: float = 10.0, event_retention: float = 60.0):
+        self.path = path
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval
+        self.worker_timeout = worker_timeout
+        self.event_retention = event_retention
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._outgoing: List[dict] = []
+        self._outgoing_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_event = 0
+        self._last_command = 0
+        self.events_published = 0
+        self.events_received = 0
+        self.commands_sent = 0
+        self.commands_received = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, heartbeat REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (download_id TEXT PRIMARY KEY, worker TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS commands ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, worker TEXT NOT NULL, download_id TEXT NOT NULL, "
+                "command TEXT NOT NULL, data TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, worker TEXT NOT NULL, data TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS commands_worker ON commands (worker, seq)")
+            self._heartbeat()
+
+    def start(self, loop: asyncio.AbstractEventLoop, on_events: EventsHandler, on_command: CommandHandler):
+        """启动后台同步线程；on_events 和 on_command 在事件循环中调用"""
+        with self._lock:
+            # 只接收启动之后的事件和命令
+            self._last_event = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+            self._last_command = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM commands WHERE worker = ?", (self.worker_id,)
+            ).fetchone()[0]
+        self._thread = threading.Thread(
+            target=self._run, args=(loop, on_events, on_command), name="shared-state", daemon=True
+        )
+        self._thread.start()
+
+    def _heartbeat(self):
+        self._conn.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (self.worker_id, time.time()))
+
+    def _alive(self, worker_id: str) -> bool:
+        if worker_id == self.worker_id:
+            return True
+        row = self._conn.execute("SELECT heartbeat FROM workers WHERE worker = ?", (worker_id,)).fetchone()
+        return row is not None and time.time() - row[0] < self.worker_timeout
+
+    def register(self, download_id: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)", (download_id, self.worker_id, time.time())
+            )
+
+    def claim(self, download_id: str) -> bool:
+        """没有存活的进程在执行该任务时登记为本进程的任务（用于重启后恢复，避免多个进程重复恢复）"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT worker FROM jobs WHERE download_id = ?", (download_id,)).fetchone()
+                if row is not None and self._alive(row[0]):
+                    self._conn.rollback()
+                    return row[0] == self.worker_id
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)", (download_id, self.worker_id, time.time())
+                )
+                self._conn.commit()
+                return True
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def unregister(self, download_id: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE download_id = ? AND worker = ?", (download_id, self.worker_id)
+            )
+
+    def owner(self, download_id: str) -> Optional[str]:
+        """执行该任务的存活进程，没有时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT worker FROM jobs WHERE download_id = ?", (download_id,)).fetchone()
+            if row is None or not self._alive(row[0]):
+                return None
+        return row[0]
+
+    def jobs(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT j.download_id, j.worker FROM jobs j JOIN workers w ON w.worker = j.worker "
+                "WHERE w.heartbeat > ? ORDER BY j.ts", (time.time() - self.worker_timeout,)
+            ).fetchall()
+        return [{'download_id': d, 'worker': w} for d, w in rows]
+
+    def send_command(self, worker_id: str, download_id: str, command: str, **data):
+        if command not in COMMANDS:
+            raise ValueError(f"未知的命令: {command}")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO commands (worker, download_id, command, data, ts) VALUES (?, ?, ?, ?, ?)",
+                (worker_id, download_id, command, json.dumps(data), time.time()),
+            )
+        self.commands_sent += 1
+
+    def publish(self, events: List[dict]):
+        """转发本进程发出的事件（已合并限频），非阻塞，由后台线程批量写入"""
+        with self._outgoing_lock:
+            self._outgoing.extend(events)
+
+    def _run(self, loop, on_events, on_command):
+        last_heartbeat = last_prune = time.monotonic()
+        while not self._stop.wait(self.poll_interval):
+            try:
+                events, commands = self._sync()
+                now = time.monotonic()
+                if now - last_heartbeat >= self.worker_timeout / 4:
+                    last_heartbeat = now
+                    with self._lock, self._conn:
+                        self._heartbeat()
+                if now - last_prune >= self.event_retention:
+                    last_prune = now
+                    self._prune()
+            except Exception as e:
+                logger.warning("同步共享状态失败", extra={'error': str(e)})
+                continue
+            if events:
+                self.events_received += len(events)
+                loop.call_soon_threadsafe(on_events, events)
+            for download_id, command, data in commands:
+                self.commands_received += 1
+                asyncio.run_coroutine_threadsafe(on_command(download_id, command, data), loop)
+
+    def _sync(self):
+        """写出本进程的事件，读取其他进程的事件和发给本进程的命令"""
+        with self._outgoing_lock:
+            outgoing, self._outgoing = self._outgoing, []
+        now = time.time()
+        with self._lock, self._conn:
+            if outgoing:
+                self._conn.executemany(
+                    "INSERT INTO events (worker, data, ts) VALUES (?, ?, ?)",
+                    [(self.worker_id, json.dumps(event), now) for event in outgoing],
+                )
+                self.events_published += len(outgoing)
+            rows = self._conn.execute(
+                "SELECT seq, worker, data FROM events WHERE seq > ? ORDER BY seq", (self._last_event,)
+            ).fetchall()
+            commands = self._conn.execute(
+                "SELECT seq, download_id, command, data FROM commands WHERE worker = ? AND seq > ? ORDER BY seq",
+                (self.worker_id, self._last_command),
+            ).fetchall()
+            if commands:
+                self._last_command = commands[-1][0]
+                self._conn.execute(
+                    "DELETE FROM commands WHERE worker = ? AND seq <= ?", (self.worker_id, self._last_command)
+                )
+        if rows:
+            self._last_event = rows[-1][0]
+        events = [json.loads(data) for _, worker, data in rows if worker != self.worker_id]
+        return events, [(d, c, json.loads(data)) for _, d, c, data in commands]
+
+    def _prune(self):
+        """删除过期的事件、发给已退出进程的命令，以及已退出进程的心跳和任务"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM events WHERE ts < ?", (now - self.event_retention,))
+            self._conn.execute("DELETE FROM commands WHERE ts < ?", (now - self.event_retention,))
+            dead = "SELECT worker FROM workers WHERE heartbeat < ?"
+            self._conn.execute(f"DELETE FROM jobs WHERE worker IN ({dead})", (now - self.worker_timeout * 6,))
+            self._conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - self.worker_timeout * 6,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            workers = self._conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE heartbeat > ?", (time.time() - self.worker_timeout,)
+            ).fetchone()[0]
+        return {
+            'backend': 'sqlite',
+            'worker_id': self.worker_id,
+            'workers': workers,
+            'events_published': self.events_published,
+            'events_received': self.events_received,
+            'commands_sent': self.commands_sent,
+            'commands_received': self.commands_received,
+        }
+
+    def close(self):
+        """停止同步线程并注销本进程；未完成的任务仍保留在任务日志中，由重启后的进程恢复"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        with self._outgoing_lock:
+            outgoing, self._outgoing = self._outgoing, []
+        now = time.time()
+        with self._lock, self._conn:
+            # 最后的事件（例如被关闭中断的任务状态）仍然转发给其他进程
+            self._conn.executemany(
+                "INSERT INTO events (worker, data, ts) VALUES (?, ?, ?)",
+                [(self.worker_id, json.dumps(event), now) for event in outgoing],
+            )
+            self._conn.execute("DELETE FROM jobs WHERE worker = ?", (self.worker_id,))
+            self._conn.execute("DELETE FROM workers WHERE worker = ?", (self.worker_id,))
+        with self._lock:
+            self._conn.close()
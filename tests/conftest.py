@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# main.py 在导入时创建任务日志、状态库等文件，并按相对路径挂载 static 和 templates：
+# 在临时目录中导入，不写入仓库目录
+_WORKDIR = tempfile.mkdtemp(prefix='ytd-tests-')
+for name in ('static', 'templates'):
+    os.makedirs(os.path.join(_WORKDIR, name), exist_ok=True)
+os.environ.update({
+    'YTD_JOB_JOURNAL': os.path.join(_WORKDIR, 'jobs.db'),
+    'YTD_LIBRARY_DB': os.path.join(_WORKDIR, 'library.db'),
+    'YTD_MEDIA_ARCHIVE': '',
+    'YTD_STATE_DB': '',
+    'YTD_CLIENT_RATE': '0',
+    'YTD_LOG_LEVEL': 'WARNING',
+})
+
+
+@pytest.fixture(scope='session')
+def main():
+    cwd = os.getcwd()
+    os.chdir(_WORKDIR)
+    try:
+        import main as module
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+@pytest.fixture(scope='session')
+def client(main):
+    # 关闭时会关闭任务日志等数据库，整个测试会话共用一个客户端
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as client:
+        yield client
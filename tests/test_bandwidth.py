@@ -0,0 +1,38 @@
+from bandwidth import BandwidthController
+
+
+def allocated(controller):
+    return {job_id: job['allocated_rate'] for job_id, job in controller.stats()['jobs'].items()}
+
+
+def test_only_transferring_jobs_share_global_rate():
+    controller = BandwidthController(global_rate=400)
+    for i in range(100):
+        controller.register(f'job-{i}')
+    for i in range(4):
+        controller.activate(f'job-{i}')
+    rates = allocated(controller)
+    assert [rates[f'job-{i}'] for i in range(4)] == [100] * 4
+    # 排队中的任务没有分配全局带宽
+    assert rates['job-4'] == 0
+
+    controller.pause('job-0')
+    rates = allocated(controller)
+    assert [round(rates[f'job-{i}'], 6) for i in range(1, 4)] == [round(400 / 3, 6)] * 3
+
+    controller.resume('job-0')
+    controller.deactivate('job-1')
+    controller.unregister('job-2')
+    rates = allocated(controller)
+    assert rates['job-0'] == rates['job-3'] == 200
+
+
+def test_job_limits_are_max_min_fair():
+    controller = BandwidthController(global_rate=300)
+    controller.register('slow', rate_limit=50)
+    controller.register('fast')
+    controller.register('queued', rate_limit=20)
+    controller.activate('slow')
+    controller.activate('fast')
+    rates = allocated(controller)
+    assert rates == {'slow': 50, 'fast': 250, 'queued': 20}
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.mark.parametrize('concurrency', ['abc', [2], {'n': 2}])
+def test_invalid_concurrency_is_rejected(client, concurrency):
+    response = client.post('/batch-video-info', json={
+        'urls': ['http://example.invalid/video.mp4'], 'concurrency': concurrency,
+    })
+    assert response.status_code == 400
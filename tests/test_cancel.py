@@ -0,0 +1,57 @@
+import time
+import uuid
+
+from scheduler import RETRY_WAIT
+
+
+def _queue_job(main, client):
+    """提交一个不会开始执行的下载任务（并发数为 0），返回 download_id"""
+    download_id = f'test-{uuid.uuid4().hex[:8]}'
+
+    async def submit():
+        job = main.submit_download('http://example.invalid/video.mp4', 'best', main.DEFAULT_DOWNLOAD_PATHS[0],
+                                   download_id)
+        await main.download_manager.add_download(download_id, job)
+
+    client.portal.call(submit)
+    return download_id
+
+
+def test_cancel_queued_job_releases_download(main, client, monkeypatch):
+    monkeypatch.setattr(main.scheduler, 'max_concurrent', 0)
+    download_id = _queue_job(main, client)
+    assert client.post('/toggle-download', json={'action': 'pause', 'download_id': download_id}).status_code == 200
+
+    response = client.post('/cancel-download', json={'download_id': download_id})
+    assert response.status_code == 200
+    assert main.scheduler.get(download_id) is None
+
+    assert download_id not in main.download_manager._downloads
+    response = client.post('/toggle-download', json={'action': 'pause', 'download_id': download_id})
+    assert response.status_code != 200
+
+
+def test_cancel_job_waiting_for_retry_releases_download(main, client):
+    download_id = f'test-{uuid.uuid4().hex[:8]}'
+
+    async def fail_once(job):
+        raise main.RetryJob(60, 'HTTP Error 429')
+
+    async def submit():
+        main.bandwidth.register(download_id)
+        job = main.scheduler.submit(download_id, fail_once, host='example.invalid')
+        await main.download_manager.add_download(download_id, job)
+
+    client.portal.call(submit)
+    deadline = time.monotonic() + 5
+    while main.scheduler.get(download_id).state != RETRY_WAIT:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    # 等待重试期间任务仍然存在
+    assert client.post('/toggle-download', json={'action': 'pause', 'download_id': download_id}).status_code == 200
+
+    assert client.post('/cancel-download', json={'download_id': download_id}).status_code == 200
+    assert main.scheduler.get(download_id) is None
+    assert download_id not in main.download_manager._downloads
+    response = client.post('/toggle-download', json={'action': 'pause', 'download_id': download_id})
+    assert response.status_code != 200
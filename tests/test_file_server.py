@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from file_server import DownloadInterrupted, LiveFile, _tail
+
+
+def collect(live, start=0, end=None):
+    async def run():
+        return b''.join([chunk async for chunk in _tail(live, start, end)])
+
+    return asyncio.run(run())
+
+
+def live_file(path, data, total=None):
+    path.write_bytes(data)
+    live = LiveFile('job')
+    live.path = str(path)
+    live.total = total
+    return live
+
+
+def test_tail_sends_finished_stream(tmp_path):
+    live = live_file(tmp_path / 'video.mp4', b'x' * 100, total=100)
+    live.stream_done = True
+    assert collect(live, 10, 100) == b'x' * 90
+
+
+@pytest.mark.parametrize('total, end', [(100, 100), (None, None)])
+def test_tail_aborts_when_download_fails(tmp_path, total, end):
+    live = live_file(tmp_path / 'video.mp4.part', b'x' * 10, total=total)
+    live.state = 'failed'
+    with pytest.raises(DownloadInterrupted):
+        collect(live, 0, end)
+
+
+def test_tail_aborts_when_file_is_short(tmp_path):
+    live = live_file(tmp_path / 'video.mp4', b'x' * 10, total=100)
+    live.stream_done = True
+    with pytest.raises(DownloadInterrupted):
+        collect(live, 0, 100)
@@ -0,0 +1,19 @@
+import os
+
+from media_archive import MediaArchive
+
+
+def test_lookup_rejects_corrupted_file(tmp_path):
+    media = tmp_path / 'video.mp4'
+    media.write_bytes(b'a' * 1024)
+    archive = MediaArchive(str(tmp_path / 'archive.db'))
+    archive.record('Youtube', 'abc', '18', str(media))
+    assert archive.lookup('Youtube', 'abc', '18') is not None
+
+    # 原地改写内容，大小和修改时间不变
+    st = os.stat(media)
+    media.write_bytes(b'b' * 1024)
+    os.utime(media, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert archive.lookup('Youtube', 'abc', '18') is None
+    assert archive.stats()['stale'] == 1
+    archive.close()
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+from extraction import Extractor
+from metadata_cache import MetadataCache, SqliteCacheBackend, cache_key, video_key
+
+
+def test_hot_extractor_links_share_key():
+    assert video_key('https://www.youtube.com/watch?v=dQw4w9WgXcQ') == 'Youtube:dQw4w9WgXcQ'
+    assert video_key('https://youtu.be/dQw4w9WgXcQ') == 'Youtube:dQw4w9WgXcQ'
+
+
+def test_other_sites_use_url():
+    assert video_key('https://example.com/video.mp4') == 'url:https://example.com/video.mp4'
+
+
+def test_persistent_entry_is_loaded_off_the_event_loop(tmp_path):
+    url = 'https://example.com/video.mp4'
+    backend = SqliteCacheBackend(str(tmp_path / 'cache.db'))
+    backend.set(cache_key(url, {}), 4102444800, {'id': 'video', 'title': 'cached'})
+    cache = MetadataCache(backend=backend)
+    reads = []
+    backend_get = backend.get
+    backend.get = lambda key: reads.append(threading.current_thread().name) or backend_get(key)
+
+    async def run():
+        extractor = Extractor(max_workers=1, cache=cache)
+        first = await extractor.extract_raw(url, {})
+        second = await extractor.extract_raw(url, {})
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first[1]['title'] == second[1]['title'] == 'cached'
+    # 只读一次磁盘缓存，且在提取线程中
+    assert len(reads) == 1 and reads[0].startswith('extract')
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 0
+    cache.close()
@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+
+from playlist_ingest import iter_flat_entries
+
+
+class FakeYDL:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def extract_info(self, url, ie_key=None, download=True, process=True):
+        self.calls.append((url, ie_key, process))
+        return self.results[url]
+
+
+class FakePool:
+    def __init__(self, ydl):
+        self.ydl = ydl
+
+    @contextmanager
+    def acquire(self, ydl_opts):
+        yield self.ydl
+
+
+def test_top_level_url_result_is_followed():
+    # 例如 watch?v=…&list=… 提取出的是指向播放列表页的 url 结果
+    ydl = FakeYDL({
+        'https://example.com/watch?v=a&list=PL1': {
+            '_type': 'url', 'url': 'https://example.com/playlist?list=PL1', 'ie_key': 'YoutubeTab',
+        },
+        'https://example.com/playlist?list=PL1': {
+            '_type': 'playlist', 'entries': iter([
+                {'_type': 'url', 'url': 'https://example.com/watch?v=a', 'id': 'a'},
+                {'_type': 'url', 'url': 'https://example.com/watch?v=b', 'id': 'b'},
+            ]),
+        },
+    })
+    entries = list(iter_flat_entries('https://example.com/watch?v=a&list=PL1', {}, FakePool(ydl)))
+    assert [e['id'] for e in entries] == ['a', 'b']
+    # 条目本身的 url 结果不再展开
+    assert ydl.calls == [
+        ('https://example.com/watch?v=a&list=PL1', None, False),
+        ('https://example.com/playlist?list=PL1', 'YoutubeTab', False),
+    ]
+
+
+def test_single_video_is_one_entry():
+    ydl = FakeYDL({'https://example.com/v.mp4': {'id': 'v', 'url': 'https://example.com/v.mp4'}})
+    assert [e['id'] for e in iter_flat_entries('https://example.com/v.mp4', {}, FakePool(ydl))] == ['v']
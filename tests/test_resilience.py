@@ -0,0 +1,160 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import resilience  # noqa: E402
+from extraction import Extractor  # noqa: E402
+from media_server import MediaServer  # noqa: E402
+from resilience import (  # noqa: E402
+    CLOSED, HALF_OPEN, LOCAL, OPEN, PERMANENT, THROTTLED, TRANSIENT,
+    CircuitBreaker, NegativeCache, RetryPolicy, UpstreamGuard, UpstreamUnavailable, classify_error,
+)
+
+EXTRACT_OPTS = {'quiet': True, 'no_warnings': True, 'retries': 0, 'extractor_retries': 0}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def server():
+    with MediaServer() as server:
+        yield server
+
+
+def extract(server, path, guard=None):
+    """通过提取器访问本地媒体服务器，返回提取结果或抛出的异常"""
+    async def run():
+        extractor = Extractor(max_workers=1, guard=guard)
+        try:
+            return await extractor.extract_raw(server.url(path), EXTRACT_OPTS)
+        except Exception as e:
+            return e
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('message, kind', [
+    ('ERROR: [youtube] abc: Private video', PERMANENT),
+    ('ERROR: [youtube] abc: Video unavailable', PERMANENT),
+    ('HTTP Error 404: Not Found', PERMANENT),
+    ('HTTP Error 429: Too Many Requests', THROTTLED),
+    ('Sign in to confirm you’re not a bot', THROTTLED),
+    ('ffmpeg exited with code 1', LOCAL),
+])
+def test_classify_error_messages(message, kind):
+    assert classify_error(Exception(message)) == kind
+
+
+def test_classify_error_follows_cause_chain():
+    try:
+        try:
+            raise TimeoutError('read timed out')
+        except TimeoutError as e:
+            raise RuntimeError('下载失败') from e
+    except RuntimeError as e:
+        assert classify_error(e) == TRANSIENT
+
+
+@pytest.mark.parametrize('status, kind', [(404, PERMANENT), (410, PERMANENT), (429, THROTTLED), (503, TRANSIENT)])
+def test_classify_errors_from_upstream(server, status, kind):
+    error = extract(server, f'/media/video.mp4?status={status}')
+    assert isinstance(error, Exception)
+    assert classify_error(error) == kind
+
+
+def test_retry_policy_delay(monkeypatch):
+    policy = RetryPolicy(max_retries=3, base_delay=2, max_delay=10, throttle_factor=4)
+    monkeypatch.setattr(resilience.random, 'uniform', lambda a, b: b)
+    assert [policy.delay(i, TRANSIENT) for i in range(3)] == [2, 4, 8]
+    # 限流的退避更长，且不超过 max_delay
+    assert policy.delay(0, THROTTLED) == 8
+    assert policy.delay(2, THROTTLED) == 10
+    monkeypatch.setattr(resilience.random, 'uniform', lambda a, b: a)
+    assert policy.delay(1, TRANSIENT) == 2
+    assert policy.delay(3, TRANSIENT) is None
+    assert policy.delay(0, PERMANENT) is None
+    assert policy.delay(0, LOCAL) is None
+
+
+def test_negative_cache_expires(clock):
+    cache = NegativeCache(ttl=10, max_entries=2)
+    cache.set('a', 'gone')
+    assert cache.get('a') == ('gone', 10)
+    clock.now += 10
+    assert cache.get('a') is None
+    # 超过容量时淘汰最早的记录
+    for url in ('a', 'b', 'c'):
+        cache.set(url, 'gone')
+    assert len(cache) == 2 and cache.get('a') is None
+
+
+def test_circuit_breaker_half_open_probe(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=10, max_cooldown=15)
+    breaker.failure()
+    assert breaker.state == CLOSED and breaker.wait() == 0
+    breaker.failure()
+    assert breaker.state == OPEN and breaker.wait() == 10
+
+    clock.now += 10
+    assert breaker.wait() == 0 and breaker.state == HALF_OPEN
+    # 探测请求进行中，其他请求继续等待
+    assert breaker.wait() > 0
+    breaker.failure()
+    assert breaker.state == OPEN and breaker.cooldown == 15
+
+    clock.now += 15
+    assert breaker.wait() == 0
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.cooldown == 10 and breaker.wait() == 0
+
+
+def test_guard_negative_cache_skips_upstream(server):
+    guard = UpstreamGuard(negative_ttl=60)
+    first = extract(server, '/media/gone.mp4?status=404', guard)
+    requests = server.requests
+    second = extract(server, '/media/gone.mp4?status=404', guard)
+    assert classify_error(first) == PERMANENT
+    assert isinstance(second, UpstreamUnavailable) and second.reason == 'unavailable'
+    assert server.requests == requests
+    assert guard.failures[PERMANENT] == 1
+
+
+def test_guard_opens_breaker_on_throttling(server):
+    guard = UpstreamGuard(threshold=3, cooldown=60)
+    server.inject(429)
+    for i in range(3):
+        assert classify_error(extract(server, f'/media/throttled-{i}.mp4', guard)) == THROTTLED
+    requests = server.requests
+    error = extract(server, '/media/throttled-3.mp4', guard)
+    assert isinstance(error, UpstreamUnavailable) and error.reason == 'circuit_open'
+    assert error.retry_after == 60
+    assert server.requests == requests
+    assert guard.failures[THROTTLED] == 3 and guard.shed == 1
+    assert guard.breaker_states() == {'127.0.0.1': OPEN}
+
+
+def test_guard_records_each_failure_once(server):
+    guard = UpstreamGuard(threshold=1)
+    error = extract(server, '/media/video.mp4?status=503')
+    url = server.url('/media/video.mp4')
+    assert guard.record_failure(url, error) == TRANSIENT
+    assert guard.record_failure(url, error) == TRANSIENT
+    assert guard.failures[TRANSIENT] == 1
+    assert guard.stats()['hosts']['127.0.0.1']['trips'] == 1
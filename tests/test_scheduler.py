@@ -0,0 +1,24 @@
+import asyncio
+
+from scheduler import DONE, POSTPROCESSING, JobScheduler
+
+
+def test_cancel_is_refused_during_postprocessing():
+    async def run():
+        scheduler = JobScheduler(max_concurrent=1)
+        merged = asyncio.Event()
+
+        async def fn(job):
+            scheduler.release(job.id)
+            await merged.wait()
+
+        scheduler.submit('job', fn)
+        await asyncio.sleep(0)
+        assert scheduler.get('job').state == POSTPROCESSING
+        assert not scheduler.cancel('job')
+        merged.set()
+        await asyncio.sleep(0.01)
+        return scheduler.snapshot()['finished']
+
+    finished = asyncio.run(run())
+    assert [(job['download_id'], job['state']) for job in finished] == [('job', DONE)]
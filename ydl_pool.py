@@ -0,0 +1,137 @@
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Tuple, Type
+
+import yt_dlp
+
+logger = logging.getLogger('ytd.pool')
+
+
+def profile_key(ydl_opts: dict) -> str:
+    # 进度回调按任务单独挂载，不区分参数组合
+    return json.dumps({k: v for k, v in ydl_opts.items() if k != 'progress_hooks'}, sort_keys=True, default=repr)
+
+
+class YoutubeDLPool:
+    """按参数组合复用的 YoutubeDL 实例池
+
+    创建 YoutubeDL 需要解析参数、注册全部提取器，并且每个实例有自己的 HTTP 会话；
+    复用实例可以省去这些开销，并复用到同一主机的 keep-alive 连接。
+
+    - 实例同一时刻只借给一个线程使用，归还后才能再次借出
+    - 进度回调（progress_hooks）在借出时按任务挂载，归还时清除
+    - 使用 max_uses 次或使用中出错的实例直接关闭，不再放回池中
+    """
+
+    def __init__(self, max_idle: int = 4, max_uses: int = 100, max_profiles: int = 32):
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        # (类, 参数组合) -> 空闲实例，按最近使用排序
+        self._idle: OrderedDict[Tuple[Type, str], Deque[yt_dlp.YoutubeDL]] = OrderedDict()
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+        self.in_use = 0
+
+    def checkout(self, ydl_opts: dict, cls: Type[yt_dlp.YoutubeDL] = yt_dlp.YoutubeDL) -> yt_dlp.YoutubeDL:
+        """借出一个实例，必须调用 checkin() 归还"""
+        key = (cls, profile_key(ydl_opts))
+        ydl = None
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                ydl = idle.pop()
+                self._idle.move_to_end(key)
+                self.reused += 1
+            self.in_use += 1
+        if ydl is None:
+            try:
+                ydl = cls({k: v for k, v in ydl_opts.items() if k != 'progress_hooks'})
+            except BaseException:
+                with self._lock:
+                    self.in_use -= 1
+                raise
+            ydl._pool_key = key
+            ydl._pool_uses = 0
+            with self._lock:
+                self.created += 1
+        self._reset(ydl)
+        for hook in ydl_opts.get('progress_hooks') or ():
+            ydl.add_progress_hook(hook)
+        return ydl
+
+    def checkin(self, ydl: yt_dlp.YoutubeDL, failed: bool = False):
+        """归还实例；出错或已达到使用次数上限的实例会被关闭"""
+        ydl._progress_hooks = []
+        key = ydl._pool_key
+        close = []
+        with self._lock:
+            self.in_use -= 1
+            ydl._pool_uses += 1
+            idle = self._idle.get(key)
+            if failed or ydl._pool_uses >= self.max_uses or (idle is not None and len(idle) >= self.max_idle):
+                self.recycled += 1
+                close.append(ydl)
+            else:
+                if idle is None:
+                    idle = self._idle[key] = deque()
+                idle.append(ydl)
+                self._idle.move_to_end(key)
+                # 参数组合太多时关闭最久未使用的组合的空闲实例
+                while len(self._idle) > self.max_profiles:
+                    _, evicted = self._idle.popitem(last=False)
+                    close.extend(evicted)
+        for old in close:
+            self._close(old)
+
+    @contextmanager
+    def acquire(self, ydl_opts: dict, cls: Type[yt_dlp.YoutubeDL] = yt_dlp.YoutubeDL):
+        ydl = self.checkout(ydl_opts, cls)
+        failed = True
+        try:
+            yield ydl
+            failed = False
+        finally:
+            self.checkin(ydl, failed)
+
+    @staticmethod
+    def _reset(ydl: yt_dlp.YoutubeDL):
+        """清除上一次使用留下的状态"""
+        ydl._progress_hooks = []
+        ydl._num_downloads = 0
+        ydl._download_retcode = 0
+        ydl._playlist_level = 0
+        ydl._playlist_urls = set()
+        on_checkout = getattr(ydl, 'on_checkout', None)
+        if on_checkout is not None:
+            on_checkout()
+
+    @staticmethod
+    def _close(ydl: yt_dlp.YoutubeDL):
+        try:
+            ydl.close()
+        except Exception as e:
+            logger.warning("关闭 YoutubeDL 实例失败", extra={'error': str(e)})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'profiles': len(self._idle),
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'in_use': self.in_use,
+                'created': self.created,
+                'reused': self.reused,
+                'recycled': self.recycled,
+            }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, OrderedDict()
+        for instances in idle.values():
+            for ydl in instances:
+                self._close(ydl)